@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:59
+
+import rest_framework.utils.encoders
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("actions", "0005_alter_action_auto_approve"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="action",
+            name="action_data",
+            field=models.JSONField(
+                default=dict, encoder=rest_framework.utils.encoders.JSONEncoder
+            ),
+        ),
+        migrations.AlterField(
+            model_name="action",
+            name="cache",
+            field=models.JSONField(
+                default=dict, encoder=rest_framework.utils.encoders.JSONEncoder
+            ),
+        ),
+    ]
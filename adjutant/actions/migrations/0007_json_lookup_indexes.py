@@ -0,0 +1,41 @@
+from django.db import migrations
+
+# Index the JSON keys most often filtered on. These rely on the jsonb
+# operators, so they are only created on PostgreSQL.
+INDEXES = [
+    (
+        "actions_action_data_gin",
+        'CREATE INDEX IF NOT EXISTS "actions_action_data_gin" '
+        'ON "actions_action" USING gin ("action_data")',
+    ),
+    (
+        "actions_action_data_email_idx",
+        'CREATE INDEX IF NOT EXISTS "actions_action_data_email_idx" '
+        'ON "actions_action" (("action_data" -> \'email\'))',
+    ),
+]
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, sql in INDEXES:
+        schema_editor.execute(sql)
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, sql in INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS "%s"' % name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("actions", "0006_native_json_fields"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:07
+
+import rest_framework.utils.encoders
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("actions", "0007_json_lookup_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="action",
+            name="completed_stages",
+            field=models.JSONField(
+                default=dict, encoder=rest_framework.utils.encoders.JSONEncoder
+            ),
+        ),
+    ]
@@ -12,10 +12,12 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-from jsonfield import JSONField
+from contextlib import contextmanager
+import copy
 
 from django.db import models
 from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
 
 from adjutant import actions
 
@@ -26,8 +28,11 @@ class Action(models.Model):
     """
 
     action_name = models.CharField(max_length=200)
-    action_data = JSONField(default={})
-    cache = JSONField(default={})
+    action_data = models.JSONField(default=dict, encoder=JSONEncoder)
+    cache = models.JSONField(default=dict, encoder=JSONEncoder)
+    # the task stages this action has finished, with what each of them
+    # added to the task cache:
+    completed_stages = models.JSONField(default=dict, encoder=JSONEncoder)
     state = models.CharField(max_length=200, default="default")
     valid = models.BooleanField(default=False)
     need_token = models.BooleanField(default=False)
@@ -44,6 +49,86 @@ class Action(models.Model):
     order = models.IntegerField()
     created = models.DateTimeField(default=timezone.now)
 
+    def __init__(self, *args, **kwargs):
+        super(Action, self).__init__(*args, **kwargs)
+        # saved field values, tracked while saves are being deferred:
+        self._saved_values = None
+        self._defer_depth = 0
+        # whether flush also waits for the saves to stop being deferred:
+        self._hold_flushes = False
+
+    def _field_values(self):
+        deferred = self.get_deferred_fields()
+        return {
+            field.attname: copy.deepcopy(getattr(self, field.attname))
+            for field in self._meta.concrete_fields
+            if not field.primary_key and field.attname not in deferred
+        }
+
+    def changed_fields(self):
+        """The fields changed since the saves started being deferred."""
+        if self._saved_values is None:
+            return None
+        current = self._field_values()
+        return sorted(
+            name
+            for name, value in current.items()
+            if name not in self._saved_values or self._saved_values[name] != value
+        )
+
+    def save(self, *args, **kwargs):
+        super(Action, self).save(*args, **kwargs)
+        if self._saved_values is not None:
+            current = self._field_values()
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None:
+                current = {
+                    name: value
+                    for name, value in current.items()
+                    if name in update_fields
+                }
+            self._saved_values.update(current)
+
+    def flush(self):
+        """
+        Save the fields changed since the saves started being deferred,
+        and only those fields, or the whole action if not deferring.
+        """
+        if self._hold_flushes:
+            return
+        fields = self.changed_fields()
+        if fields is None:
+            self.save()
+        elif fields:
+            self.save(update_fields=fields)
+
+    def save_changes(self):
+        """Save the action, unless saves are being deferred."""
+        if not self._defer_depth:
+            self.flush()
+
+    @contextmanager
+    def deferred_saves(self, hold_flushes=False):
+        """
+        Hold off saving the changes given to save_changes until the end
+        of the block, then save only the fields that changed.
+
+        With hold_flushes, flush waits for the end of the block as well,
+        so that nothing is saved from the threads of a parallel stage.
+        """
+        if not self._defer_depth:
+            self._saved_values = self._field_values()
+            self._hold_flushes = hold_flushes
+        self._defer_depth += 1
+        try:
+            yield
+        finally:
+            self._defer_depth -= 1
+            if not self._defer_depth:
+                self._hold_flushes = False
+                self.flush()
+                self._saved_values = None
+
     def get_action(self):
         """Returns self as the appropriate action wrapper type."""
         data = self.action_data
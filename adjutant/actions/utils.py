@@ -1,7 +1,7 @@
 from django.core.mail import EmailMultiAlternatives
 from django.template import loader
 
-from adjutant.notifications.utils import create_notification
+from adjutant.notifications.utils import create_notification, deliver_email
 
 
 def validate_steps(validation_steps):
@@ -79,7 +79,7 @@ def send_email(to_addresses, context, conf, task):
         if html_template:
             email.attach_alternative(html_template.render(context), "text/html")
 
-        email.send(fail_silently=False)
+        deliver_email(task, email, "while sending additional email")
         return True
 
     except Exception as e:
@@ -12,6 +12,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import copy
 from logging import getLogger
 
 from django.utils import timezone
@@ -49,11 +50,23 @@ class BaseAction(object):
 
     By using 'get_cache' and 'set_cache' they can pass data along which
     may be needed by the action later. This cache is backed to the database.
+    Within each stage changes to it are saved together at the end of the
+    stage, so call 'flush' before any external change that relies on the
+    cache already being saved, such as creating a resource that must not
+    be created twice if the stage is retried.
 
     Passing data along to other actions is done via the task and
     its cache, but this is in memory only, so it is only useful during the
     same action stage ('prepare', 'approve', etc.).
 
+    An action that neither reads nor writes the task cache in a stage,
+    and doesn't depend on the actions around it, can list that stage in
+    'parallel_stages'. Consecutive actions that do so for a stage may be
+    run at the same time, in separate threads, so those stages should only
+    be changing their own action, and shouldn't create or change anything
+    outside Adjutant. Their saves, flushes included, are held until the
+    whole group has finished, then made by the task.
+
     Other than the task cache, actions should not be altering database
     models other than themselves. This is not enforced, just a guideline.
     """
@@ -64,6 +77,8 @@ class BaseAction(object):
 
     config_group = None
 
+    parallel_stages = []
+
     def __init__(self, data, action_model=None, task=None, order=None):
         """
         Build itself around an existing database model,
@@ -99,6 +114,11 @@ class BaseAction(object):
     def valid(self):
         return self.action.valid
 
+    @property
+    def id_manager(self):
+        """The IdentityManager shared by all the actions of this task."""
+        return user_store.get_identity_manager(self.action.task)
+
     @property
     def need_token(self):
         return self.action.need_token
@@ -112,9 +132,25 @@ class BaseAction(object):
     def get_cache(self, key):
         return self.action.cache.get(key, None)
 
-    def set_cache(self, key, value):
+    def set_cache(self, key, value, flush=False):
+        """
+        Set a value in the action cache. Values that record the result of
+        a side effect, such as the id of something created, should be set
+        with flush, so they are saved straight away rather than at the end
+        of the stage.
+        """
+        # NOTE: Unchanged values aren't saved again, but that is left to
+        # the saves, which compare against what was last saved rather than
+        # the live cache, as the value may have been changed in place.
         self.action.cache[key] = value
-        self.action.save()
+        if flush:
+            self.flush()
+        else:
+            self.action.save_changes()
+
+    def flush(self):
+        """Save any changes to the action that haven't been saved yet."""
+        self.action.flush()
 
     @property
     def token_fields(self):
@@ -122,7 +158,7 @@ class BaseAction(object):
 
     def set_token_fields(self, token_fields):
         self.action.cache["token_fields"] = token_fields
-        self.action.save()
+        self.action.save_changes()
 
     @property
     def auto_approve(self):
@@ -131,7 +167,7 @@ class BaseAction(object):
     def set_auto_approve(self, can_approve=True):
         self.add_note("Auto approve set to %s." % can_approve)
         self.action.auto_approve = can_approve
-        self.action.save()
+        self.action.save_changes()
 
     def add_note(self, note):
         """
@@ -167,34 +203,70 @@ class BaseAction(object):
         return self._config
 
     def prepare(self):
-        try:
-            return self._prepare()
-        except NotImplementedError:
-            self.logger.warning(
-                "DEPRECATED: Action '_pre_approve' stage has been renamed "
-                "to 'prepare'."
-            )
-            return self._pre_approve()
+        with self.action.deferred_saves():
+            try:
+                return self._prepare()
+            except NotImplementedError:
+                self.logger.warning(
+                    "DEPRECATED: Action '_pre_approve' stage has been renamed "
+                    "to 'prepare'."
+                )
+                return self._pre_approve()
 
     def approve(self):
-        try:
-            return self._approve()
-        except NotImplementedError:
-            self.logger.warning(
-                "DEPRECATED: Action '_post_approve' stage has been renamed "
-                "to 'prepare'."
-            )
-            return self._post_approve()
+        with self.action.deferred_saves():
+            task_cache = copy.deepcopy(self.action.task.cache)
+            try:
+                result = self._approve()
+            except NotImplementedError:
+                self.logger.warning(
+                    "DEPRECATED: Action '_post_approve' stage has been renamed "
+                    "to 'prepare'."
+                )
+                result = self._post_approve()
+            self._complete_stage("approve", task_cache)
+            return result
 
     def submit(self, token_data, keystone_user=None):
-        try:
-            return self._submit(token_data, keystone_user)
-        except TypeError:
-            self.logger.warning(
-                "DEPRECATED: Action '_submit' must accept a second parameter "
-                "'keystone_user=None' along with the required 'token_data'."
-            )
-            return self._submit(token_data)
+        with self.action.deferred_saves():
+            task_cache = copy.deepcopy(self.action.task.cache)
+            try:
+                result = self._submit(token_data, keystone_user)
+            except TypeError:
+                self.logger.warning(
+                    "DEPRECATED: Action '_submit' must accept a second parameter "
+                    "'keystone_user=None' along with the required 'token_data'."
+                )
+                result = self._submit(token_data)
+            self._complete_stage("submit", task_cache)
+            return result
+
+    def _complete_stage(self, stage, task_cache):
+        """
+        Mark the stage as done for this action, along with what it added
+        to the task cache, so a retry of the stage can skip it. The task
+        clears the mark once all of its actions have done the stage.
+        """
+        if not self.valid:
+            return
+        self.action.completed_stages[stage] = {
+            key: value
+            for key, value in self.action.task.cache.items()
+            if key not in task_cache or task_cache[key] != value
+        }
+
+    def stage_completed(self, stage):
+        return stage in self.action.completed_stages
+
+    def resume_stage(self, stage):
+        """
+        Skip a stage this action has already completed, putting back
+        what it added to the task cache for the actions after it.
+        """
+        self.action.task.cache.update(
+            copy.deepcopy(self.action.completed_stages[stage])
+        )
+        self.add_note("Already completed the %s stage, skipping." % stage)
 
     def _prepare(self):
         raise NotImplementedError
@@ -229,7 +301,7 @@ class ResourceMixin(object):
         return True
 
     def _validate_domain_id(self):
-        id_manager = user_store.IdentityManager()
+        id_manager = self.id_manager
         domain = id_manager.get_domain(self.domain_id)
         if not domain:
             self.add_note("Domain does not exist.")
@@ -245,7 +317,7 @@ class ResourceMixin(object):
             return False
 
         # Now actually check the project exists.
-        id_manager = user_store.IdentityManager()
+        id_manager = self.id_manager
         project = id_manager.get_project(self.project_id)
         if not project:
             self.add_note("Project with id %s does not exist." % self.project_id)
@@ -254,7 +326,7 @@ class ResourceMixin(object):
         return True
 
     def _validate_domain_name(self):
-        id_manager = user_store.IdentityManager()
+        id_manager = self.id_manager
         self.domain = id_manager.find_domain(self.domain_name)
         if not self.domain:
             self.add_note("Domain does not exist.")
@@ -265,7 +337,7 @@ class ResourceMixin(object):
 
     def _validate_region_exists(self, region):
         # Check that the region actually exists
-        id_manager = user_store.IdentityManager()
+        id_manager = self.id_manager
         v_region = id_manager.get_region(region)
         if not v_region:
             self.add_note("ERROR: Region: %s does not exist." % region)
@@ -280,7 +352,7 @@ class UserMixin(ResourceMixin):
 
     # Accessors
     def _validate_username_exists(self):
-        id_manager = user_store.IdentityManager()
+        id_manager = self.id_manager
 
         self.user = id_manager.find_user(self.username, self.domain.id)
         if not self.user:
@@ -312,14 +384,14 @@ class UserMixin(ResourceMixin):
             return False
 
         # user manageable role
-        id_manager = user_store.IdentityManager()
+        id_manager = self.id_manager
         manageable_roles = id_manager.get_manageable_roles(user_roles)
         intersection = set(manageable_roles) & requested_roles
         # if all requested roles match, we can proceed
         return intersection == requested_roles
 
     def find_user(self):
-        id_manager = user_store.IdentityManager()
+        id_manager = self.id_manager
         return id_manager.find_user(self.username, self.domain_id)
 
     # Mutators
@@ -335,7 +407,9 @@ class UserMixin(ResourceMixin):
 
     # Helper function to add or remove roles
     def _user_roles_edit(self, user, roles, project_id, remove=False, inherited=False):
-        id_manager = user_store.IdentityManager()
+        # Save what has been cached so far before changing any roles.
+        self.flush()
+        id_manager = self.id_manager
         if not remove:
             action_fn = id_manager.add_user_role
             action_string = "granting"
@@ -361,7 +435,7 @@ class UserMixin(ResourceMixin):
             raise
 
     def enable_user(self, user=None):
-        id_manager = user_store.IdentityManager()
+        id_manager = self.id_manager
         try:
             if not user:
                 user = self.find_user()
@@ -374,7 +448,7 @@ class UserMixin(ResourceMixin):
             raise
 
     def create_user(self, password):
-        id_manager = user_store.IdentityManager()
+        id_manager = self.id_manager
         try:
             user = id_manager.create_user(
                 name=self.username,
@@ -393,7 +467,7 @@ class UserMixin(ResourceMixin):
         return user
 
     def update_password(self, password, user=None):
-        id_manager = user_store.IdentityManager()
+        id_manager = self.id_manager
         try:
             if not user:
                 user = self.find_user()
@@ -405,7 +479,7 @@ class UserMixin(ResourceMixin):
             raise
 
     def update_email(self, email, user=None):
-        id_manager = user_store.IdentityManager()
+        id_manager = self.id_manager
         try:
             if not user:
                 user = self.find_user()
@@ -417,7 +491,7 @@ class UserMixin(ResourceMixin):
             raise
 
     def update_user_name(self, username, user=None):
-        id_manager = user_store.IdentityManager()
+        id_manager = self.id_manager
         try:
             if not user:
                 user = self.find_user()
@@ -433,7 +507,7 @@ class ProjectMixin(ResourceMixin):
     """Mixin with functions for projects."""
 
     def _validate_parent_project(self):
-        id_manager = user_store.IdentityManager()
+        id_manager = self.id_manager
         # NOTE(adriant): If parent id is None, Keystone defaults to the domain.
         # So we only care to validate if parent_id is not None.
         if self.parent_id:
@@ -444,7 +518,7 @@ class ProjectMixin(ResourceMixin):
         return True
 
     def _validate_project_absent(self):
-        id_manager = user_store.IdentityManager()
+        id_manager = self.id_manager
         project = id_manager.find_project(self.project_name, self.domain_id)
         if project:
             self.add_note("Existing project with name '%s'." % self.project_name)
@@ -454,7 +528,9 @@ class ProjectMixin(ResourceMixin):
         return True
 
     def _create_project(self):
-        id_manager = user_store.IdentityManager()
+        # Save what has been cached so far before creating the project.
+        self.flush()
+        id_manager = self.id_manager
         description = getattr(self, "description", "")
         try:
             project = id_manager.create_project(
@@ -471,7 +547,7 @@ class ProjectMixin(ResourceMixin):
             raise
         # put project_id into action cache:
         self.action.task.cache["project_id"] = project.id
-        self.set_cache("project_id", project.id)
+        self.set_cache("project_id", project.id, flush=True)
         self.add_note("New project '%s' created." % project.name)
 
 
@@ -519,7 +595,7 @@ class UserIdAction(BaseAction):
         """
         Gets the target user by id
         """
-        id_manager = user_store.IdentityManager()
+        id_manager = self.id_manager
         user = id_manager.get_user(self.user_id)
 
         return user
@@ -552,7 +628,7 @@ class UserNameAction(BaseAction):
         """
         Gets the target user by their username
         """
-        id_manager = user_store.IdentityManager()
+        id_manager = self.id_manager
         user = id_manager.find_user(self.username, self.domain_id)
 
         return user
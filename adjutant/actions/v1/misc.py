@@ -19,7 +19,6 @@ from confspirator import types
 from adjutant.actions.v1.base import BaseAction
 from adjutant.actions.v1 import serializers
 from adjutant.actions.utils import send_email
-from adjutant.common import user_store
 from adjutant.common import constants
 from adjutant.config import CONF
 
@@ -100,6 +99,12 @@ def _build_default_email_group(group_name):
 class SendAdditionalEmailAction(BaseAction):
     serializer = serializers.SendAdditionalEmailSerializer
 
+    # NOTE: No parallel_stages, as every stage waits on the other actions:
+    # it only sends once they are all valid, can take addresses from the
+    # task cache, and renders the other actions into the email. Run
+    # alongside them, it could check and email about them before they
+    # have finished the stage.
+
     config_group = groups.DynamicNameConfigGroup(
         children=[
             _build_default_email_group("prepare"),
@@ -116,7 +121,7 @@ class SendAdditionalEmailAction(BaseAction):
                 self.emails.add(self.action.task.keystone_user["username"])
             else:
                 try:
-                    id_manager = user_store.IdentityManager()
+                    id_manager = self.id_manager
                     email = id_manager.get_user(
                         self.action.task.keystone_user["user_id"]
                     ).email
@@ -132,7 +137,7 @@ class SendAdditionalEmailAction(BaseAction):
                 % (roles, project_id)
             )
 
-            id_manager = user_store.IdentityManager()
+            id_manager = self.id_manager
             users = id_manager.list_users(project_id)
             for user in users:
                 user_roles = [role.name for role in user.roles]
@@ -154,7 +159,8 @@ class SendAdditionalEmailAction(BaseAction):
 
     def _validate(self):
         self.action.valid = True
-        self.action.save()
+        # Saved right away, as perform_action checks the stored actions.
+        self.flush()
 
     def _prepare(self):
         self.perform_action("prepare")
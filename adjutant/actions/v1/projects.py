@@ -20,7 +20,6 @@ from confspirator import groups
 from confspirator import fields
 
 from adjutant.config import CONF
-from adjutant.common import user_store
 from adjutant.common.utils import str_datetime
 from adjutant.actions.utils import validate_steps
 from adjutant.actions.v1.base import BaseAction, UserNameAction, UserMixin, ProjectMixin
@@ -43,6 +42,8 @@ class NewProjectAction(BaseAction, ProjectMixin, UserMixin):
 
     serializer = serializers.NewProjectSerializer
 
+    parallel_stages = ["prepare"]
+
     config_group = groups.DynamicNameConfigGroup(
         children=[
             fields.ListConfig(
@@ -65,7 +66,7 @@ class NewProjectAction(BaseAction, ProjectMixin, UserMixin):
                 self._validate_project_absent,
             ]
         )
-        self.action.save()
+        self.action.save_changes()
 
     def _validate_domain_id(self):
         keystone_user = self.action.task.keystone_user
@@ -113,7 +114,7 @@ class NewProjectAction(BaseAction, ProjectMixin, UserMixin):
             keystone_user = self.action.task.keystone_user
 
             try:
-                id_manager = user_store.IdentityManager()
+                id_manager = self.id_manager
                 user = id_manager.get_user(keystone_user["user_id"])
 
                 self.grant_roles(user, default_roles, project_id)
@@ -129,7 +130,7 @@ class NewProjectAction(BaseAction, ProjectMixin, UserMixin):
 
             # put user_id into action cache:
             self.action.task.cache["user_id"] = user.id
-            self.set_cache("user_id", user.id)
+            self.set_cache("user_id", user.id, flush=True)
             self.add_note(
                 "Existing user '%s' attached to project %s with roles: %s"
                 % (user.name, project_id, default_roles)
@@ -175,10 +176,10 @@ class NewProjectWithUserAction(UserNameAction, ProjectMixin, UserMixin):
                 self._validate_user,
             ]
         )
-        self.action.save()
+        self.action.save_changes()
 
     def _validate_user(self):
-        id_manager = user_store.IdentityManager()
+        id_manager = self.id_manager
         user = id_manager.find_user(self.username, self.domain_id)
 
         if not user:
@@ -234,7 +235,7 @@ class NewProjectWithUserAction(UserNameAction, ProjectMixin, UserMixin):
         user_id = self.get_cache("user_id")
         project_id = self.get_cache("project_id")
 
-        id_manager = user_store.IdentityManager()
+        id_manager = self.id_manager
 
         user = id_manager.get_user(user_id)
         project = id_manager.get_project(project_id)
@@ -246,7 +247,7 @@ class NewProjectWithUserAction(UserNameAction, ProjectMixin, UserMixin):
 
         self.action.task.cache["user_state"] = self.action.state
 
-        self.action.save()
+        self.action.save_changes()
 
     def _prepare(self):
         self._validate()
@@ -270,7 +271,7 @@ class NewProjectWithUserAction(UserNameAction, ProjectMixin, UserMixin):
                 and self._validate_parent_project()
                 and self._validate_project_absent()
             )
-            self.action.save()
+            self.action.save_changes()
 
             if not self.valid:
                 return
@@ -286,7 +287,7 @@ class NewProjectWithUserAction(UserNameAction, ProjectMixin, UserMixin):
             self.add_note("User already setup.")
         elif not user_id:
             self.action.valid = self._validate_user()
-            self.action.save()
+            self.action.save_changes()
 
             if not self.valid:
                 return
@@ -296,7 +297,9 @@ class NewProjectWithUserAction(UserNameAction, ProjectMixin, UserMixin):
             self._create_user_for_project()
 
     def _create_user_for_project(self):
-        id_manager = user_store.IdentityManager()
+        # Save the cached project id before creating or changing the user.
+        self.flush()
+        id_manager = self.id_manager
         default_roles = self.config.default_roles
 
         project_id = self.get_cache("project_id")
@@ -315,7 +318,7 @@ class NewProjectWithUserAction(UserNameAction, ProjectMixin, UserMixin):
                         domain=self.domain_id,
                         created_on=str_datetime(timezone.now()),
                     )
-                    self.set_cache("user_id", user.id)
+                    self.set_cache("user_id", user.id, flush=True)
                 else:
                     user = id_manager.get_user(user_id)
                 # put user_id into action cache:
@@ -329,7 +332,7 @@ class NewProjectWithUserAction(UserNameAction, ProjectMixin, UserMixin):
                 )
                 raise
 
-            self.set_cache("roles_granted", True)
+            self.set_cache("roles_granted", True, flush=True)
             self.add_note(
                 "New user '%s' created for project %s with roles: %s"
                 % (self.username, project_id, default_roles)
@@ -339,7 +342,7 @@ class NewProjectWithUserAction(UserNameAction, ProjectMixin, UserMixin):
                 user_id = self.get_cache("user_id")
                 if not user_id:
                     user = id_manager.find_user(self.username, self.domain_id)
-                    self.set_cache("user_id", user.id)
+                    self.set_cache("user_id", user.id, flush=True)
                 else:
                     user = id_manager.get_user(user_id)
                 self.action.task.cache["user_id"] = user.id
@@ -352,7 +355,7 @@ class NewProjectWithUserAction(UserNameAction, ProjectMixin, UserMixin):
                 )
                 raise
 
-            self.set_cache("roles_granted", True)
+            self.set_cache("roles_granted", True, flush=True)
             self.add_note(
                 "Existing user '%s' setup on project %s  with roles: %s"
                 % (self.username, project_id, default_roles)
@@ -383,7 +386,7 @@ class NewProjectWithUserAction(UserNameAction, ProjectMixin, UserMixin):
                     raise
                 self.add_note("User %s password has been changed." % self.username)
 
-                self.set_cache("user_id", user.id)
+                self.set_cache("user_id", user.id, flush=True)
             else:
                 user = id_manager.get_user(user_id)
             self.action.task.cache["user_id"] = user.id
@@ -399,7 +402,7 @@ class NewProjectWithUserAction(UserNameAction, ProjectMixin, UserMixin):
                         % (e, self.username, default_roles)
                     )
                     raise
-                self.set_cache("roles_granted", True)
+                self.set_cache("roles_granted", True, flush=True)
 
             self.add_note(
                 "Existing user '%s' setup on project %s with roles: %s"
@@ -423,7 +426,7 @@ class NewProjectWithUserAction(UserNameAction, ProjectMixin, UserMixin):
         self.action.task.cache["project_id"] = project_id
         user_id = self.get_cache("user_id")
         self.action.task.cache["user_id"] = user_id
-        id_manager = user_store.IdentityManager()
+        id_manager = self.id_manager
 
         if self.action.state in ["default", "disabled"]:
             user = id_manager.get_user(user_id)
@@ -480,7 +483,7 @@ class AddDefaultUsersToProjectAction(BaseAction, ProjectMixin, UserMixin):
         self.roles = self.config.default_roles
 
     def _validate_users(self):
-        id_manager = user_store.IdentityManager()
+        id_manager = self.id_manager
         all_found = True
         for user in self.users:
             ks_user = id_manager.find_user(user, self.domain_id)
@@ -498,7 +501,7 @@ class AddDefaultUsersToProjectAction(BaseAction, ProjectMixin, UserMixin):
                 self._validate_users,
             ]
         )
-        self.action.save()
+        self.action.save_changes()
 
     def _validate(self):
         self.action.valid = validate_steps(
@@ -507,13 +510,13 @@ class AddDefaultUsersToProjectAction(BaseAction, ProjectMixin, UserMixin):
                 self._validate_project_id,
             ]
         )
-        self.action.save()
+        self.action.save_changes()
 
     def _prepare(self):
         self._pre_validate()
 
     def _approve(self):
-        id_manager = user_store.IdentityManager()
+        id_manager = self.id_manager
         self.project_id = self.action.task.cache.get("project_id", None)
         self._validate()
 
@@ -534,7 +537,7 @@ class AddDefaultUsersToProjectAction(BaseAction, ProjectMixin, UserMixin):
                 )
                 raise
             self.action.state = "completed"
-            self.action.save()
+            self.flush()
             self.add_note("All users added.")
 
     def _submit(self, token_data, keystone_user=None):
@@ -22,7 +22,7 @@ from confspirator import fields
 from adjutant.actions.v1.base import BaseAction, ProjectMixin, QuotaMixin
 from adjutant.actions.v1 import serializers
 from adjutant.actions.utils import validate_steps
-from adjutant.common import openstack_clients, user_store
+from adjutant.common import openstack_clients
 from adjutant.api import models
 from adjutant.common.quota import QuotaManager
 from adjutant.config import CONF
@@ -43,6 +43,8 @@ class NewDefaultNetworkAction(BaseAction, ProjectMixin):
 
     serializer = serializers.NewDefaultNetworkSerializer
 
+    parallel_stages = ["prepare"]
+
     config_group = groups.DynamicNameConfigGroup(
         children=[
             groups.ConfigGroup(
@@ -116,7 +118,7 @@ class NewDefaultNetworkAction(BaseAction, ProjectMixin):
             self.add_note("ERROR: No region given.")
             return False
 
-        id_manager = user_store.IdentityManager()
+        id_manager = self.id_manager
         region = id_manager.get_region(self.region)
         if not region:
             self.add_note("ERROR: Region does not exist.")
@@ -133,14 +135,14 @@ class NewDefaultNetworkAction(BaseAction, ProjectMixin):
                 self._validate_keystone_user_project_id,
             ]
         )
-        self.action.save()
+        self.action.save_changes()
 
     def _create_network(self):
         if self.config.create_in_regions:
             for region in self.config.create_in_regions:
                 self._create_network_in_region(region)
         elif self.config.create_in_all_regions:
-            id_manager = user_store.IdentityManager()
+            id_manager = self.id_manager
             for region in id_manager.list_regions():
                 region_id = region.id
                 self._create_network_in_region(region_id)
@@ -162,8 +164,10 @@ class NewDefaultNetworkAction(BaseAction, ProjectMixin):
         # NOTE(callumdickinson): Backwards compatibility with older tasks.
         if not network_id and is_default_region:
             network_id = self.get_cache("network_id")
-        # If the default network does not exist, create it.
+        # If the default network does not exist, create it. Anything cached
+        # so far is saved first, so a retry won't create resources twice.
         if not network_id:
+            self.flush()
             try:
                 network_body = {
                     "network": {
@@ -196,7 +200,7 @@ class NewDefaultNetworkAction(BaseAction, ProjectMixin):
                     f"in region '{region}'"
                 ),
             )
-        self.set_cache(f"network_id{cache_suffix}", network_id)
+        self.set_cache(f"network_id{cache_suffix}", network_id, flush=True)
 
         subnet_id = self.get_cache(f"subnet_id{cache_suffix}")
         # NOTE(callumdickinson): Backwards compatibility with older tasks.
@@ -204,6 +208,7 @@ class NewDefaultNetworkAction(BaseAction, ProjectMixin):
             subnet_id = self.get_cache("subnet_id")
         # If the default subnet does not exist, create it.
         if not subnet_id:
+            self.flush()
             try:
                 subnet_body = {
                     "subnet": {
@@ -240,7 +245,7 @@ class NewDefaultNetworkAction(BaseAction, ProjectMixin):
                     f"created for project '{self.project_id}' in region '{region}'"
                 ),
             )
-        self.set_cache(f"subnet_id{cache_suffix}", subnet_id)
+        self.set_cache(f"subnet_id{cache_suffix}", subnet_id, flush=True)
 
         router_id = self.get_cache(f"router_id{cache_suffix}")
         # NOTE(callumdickinson): Backwards compatibility with older tasks.
@@ -248,6 +253,7 @@ class NewDefaultNetworkAction(BaseAction, ProjectMixin):
             router_id = self.get_cache("router_id")
         # If the default router does not exist, create it.
         if not router_id:
+            self.flush()
             try:
                 router_body = {
                     "router": {
@@ -283,7 +289,7 @@ class NewDefaultNetworkAction(BaseAction, ProjectMixin):
                     f"in region '{region}'"
                 ),
             )
-        self.set_cache(f"router_id{cache_suffix}", router_id)
+        self.set_cache(f"router_id{cache_suffix}", router_id, flush=True)
 
         port_id = self.get_cache(f"port_id{cache_suffix}")
         # NOTE(callumdickinson): Backwards compatibility with older tasks.
@@ -291,6 +297,7 @@ class NewDefaultNetworkAction(BaseAction, ProjectMixin):
             port_id = self.get_cache("port_id")
         # If the subnet port on the default router does not exist, create it.
         if not port_id:
+            self.flush()
             try:
                 interface_body = {"subnet_id": subnet_id}
                 interface = neutron.add_interface_router(router_id, body=interface_body)
@@ -325,7 +332,7 @@ class NewDefaultNetworkAction(BaseAction, ProjectMixin):
                     f"in region '{region}'"
                 ),
             )
-        self.set_cache(f"port_id{cache_suffix}", port_id)
+        self.set_cache(f"port_id{cache_suffix}", port_id, flush=True)
 
     def _prepare(self):
         # Note: Do we need to get this from cache? it is a required setting
@@ -362,7 +369,7 @@ class NewProjectDefaultNetworkAction(NewDefaultNetworkAction):
                 self._validate_region,
             ]
         )
-        self.action.save()
+        self.action.save_changes()
 
     def _validate(self):
         self.action.valid = validate_steps(
@@ -371,7 +378,7 @@ class NewProjectDefaultNetworkAction(NewDefaultNetworkAction):
                 self._validate_project_id,
             ]
         )
-        self.action.save()
+        self.action.save_changes()
 
     def _prepare(self):
         self._pre_validate()
@@ -416,7 +423,7 @@ class UpdateProjectQuotasAction(BaseAction, QuotaMixin):
         if CONF.identity.username_is_email:
             return self.action.task.keystone_user["username"]
         else:
-            id_manager = user_store.IdentityManager()
+            id_manager = self.id_manager
             user = id_manager.get_user(self.action.task.keystone_user["user_id"])
             email = getattr(user, "email", None)
             if email:
@@ -444,25 +451,59 @@ class UpdateProjectQuotasAction(BaseAction, QuotaMixin):
         )
         return False
 
-    def _set_region_quota(self, region_name, quota_size):
-        # Set the quota for an individual region
-        quota_config = CONF.quota.sizes.get(quota_size, {})
-        if not quota_config:
-            self.add_note(
-                "Project quota not defined for size '%s' in region %s."
-                % (quota_size, region_name)
-            )
-            return
+    def _set_region_quotas(self, region_sizes):
+        # Set the quota for every region concurrently. Services that were
+        # set by an earlier attempt are tracked per region in the cache,
+        # so that re-approving only retries the services that failed.
+        region_quotas = {}
+        for region_name, quota_size in region_sizes.items():
+            quota_config = CONF.quota.sizes.get(quota_size, {})
+            if not quota_config:
+                self.add_note(
+                    "Project quota not defined for size '%s' in region %s."
+                    % (quota_size, region_name)
+                )
+                continue
+            region_quotas[region_name] = quota_config
+
+        completed_services = self.get_cache("completed_quota_services") or {}
+        completed = [
+            (region_name, service_name)
+            for region_name, services in completed_services.items()
+            for service_name in services
+        ]
 
         quota_manager = QuotaManager(
             self.project_id, self.config.size_difference_threshold
         )
+        updated, errors, notes = quota_manager.set_regions_quota(
+            region_quotas, completed=completed
+        )
+        for note in notes:
+            self.add_note(note)
 
-        quota_manager.set_region_quota(region_name, quota_config)
+        for region_name, service_name in updated:
+            completed_services.setdefault(region_name, []).append(service_name)
+            self.add_note(
+                "Project %s quota for region %s set to %s"
+                % (service_name, region_name, region_sizes[region_name])
+            )
+        if updated:
+            self.set_cache("completed_quota_services", completed_services, flush=True)
 
-        self.add_note(
-            "Project quota for region %s set to %s" % (region_name, quota_size)
-        )
+        for (region_name, service_name), error in errors.items():
+            self.add_note(
+                "Error: '%s' while setting %s quota for region %s to %s"
+                % (error, service_name, region_name, region_sizes[region_name])
+            )
+        if errors:
+            raise next(iter(errors.values()))
+
+        for region_name in region_quotas:
+            self.add_note(
+                "Project quota for region %s set to %s"
+                % (region_name, region_sizes[region_name])
+            )
 
     def _can_auto_approve(self):
         wait_days = self.config.days_between_autoapprove
@@ -558,7 +599,7 @@ class UpdateProjectQuotasAction(BaseAction, QuotaMixin):
                 self._validate_usage_lower_than_quota,
             ]
         )
-        self.action.save()
+        self.action.save_changes()
 
     def _prepare(self):
         self._validate()
@@ -571,16 +612,13 @@ class UpdateProjectQuotasAction(BaseAction, QuotaMixin):
         if not self.valid or self.action.state == "completed":
             return
 
-        # Use manager here instead, it will make it easier to add has_more
-        # in later
-        for region in self.regions:
-            self._set_region_quota(region, self.size)
+        self._set_region_quotas({region: self.size for region in self.regions})
 
         self.action.state = "completed"
         self.action.task.cache["project_id"] = self.project_id
         self.action.task.cache["size"] = self.size
 
-        self.action.save()
+        self.action.save_changes()
 
     def _submit(self, token_data, keystone_user=None):
         """
@@ -617,12 +655,12 @@ class SetProjectQuotaAction(UpdateProjectQuotasAction):
                 self._validate_project_id,
             ]
         )
-        self.action.save()
+        self.action.save_changes()
 
     def _prepare(self):
         # Nothing to validate yet
         self.action.valid = True
-        self.action.save()
+        self.action.save_changes()
 
     def _approve(self):
         # Assumption: another action has placed the project_id into the cache.
@@ -633,11 +671,10 @@ class SetProjectQuotaAction(UpdateProjectQuotasAction):
             return
 
         # update quota for each openstack service
-        for region_name, region_size in self.config.region_sizes.items():
-            self._set_region_quota(region_name, region_size)
+        self._set_region_quotas(self.config.region_sizes)
 
         self.action.state = "completed"
-        self.action.save()
+        self.flush()
 
     def _submit(self, token_data, keystone_user=None):
         pass
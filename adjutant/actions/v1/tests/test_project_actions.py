@@ -22,6 +22,7 @@ from adjutant.actions.v1.projects import (
     NewProjectAction,
 )
 from adjutant.api.models import Task
+from adjutant.common import user_store
 from adjutant.common.tests import fake_clients
 from adjutant.common.tests.fake_clients import FakeManager, setup_identity_cache
 from adjutant.common.tests.utils import AdjutantTestCase
@@ -109,6 +110,45 @@ class ProjectActionTests(AdjutantTestCase):
             sorted(["member", "project_admin", "project_mod", "heat_stack_owner"]),
         )
 
+    def test_new_project_shared_identity_manager(self):
+        """
+        All the actions of a task share a single IdentityManager,
+        rather than building a Keystone client per call.
+        """
+
+        setup_identity_cache()
+
+        task = Task.objects.create(keystone_user={})
+
+        data = {
+            "domain_id": "default",
+            "parent_id": None,
+            "email": "test@example.com",
+            "project_name": "test_project",
+        }
+
+        start_count = user_store.identity_manager_count()
+
+        action = NewProjectWithUserAction(data, task=task, order=1)
+        default_users = AddDefaultUsersToProjectAction(
+            {"domain_id": "default"}, task=task, order=2
+        )
+
+        action.prepare()
+        default_users.prepare()
+        action.approve()
+        default_users.approve()
+        self.assertEqual(action.valid, True)
+        self.assertEqual(default_users.valid, True)
+        self.assertEqual(user_store.identity_manager_count(), start_count + 1)
+
+        # A new task stage loads the task again, and gets a new manager.
+        task = Task.objects.get(uuid=task.uuid)
+        action = task.actions[0].get_action()
+        action.submit({"password": "123456"})
+        self.assertEqual(action.valid, True)
+        self.assertEqual(user_store.identity_manager_count(), start_count + 2)
+
     def test_new_project_reapprove(self):
         """
         Project created at approve step,
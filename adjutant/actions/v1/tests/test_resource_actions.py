@@ -15,6 +15,8 @@
 from unittest import mock
 
 from confspirator.tests import utils as conf_utils
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from adjutant.actions.v1.resources import (
     NewDefaultNetworkAction,
@@ -22,8 +24,11 @@ from adjutant.actions.v1.resources import (
     SetProjectQuotaAction,
     UpdateProjectQuotasAction,
 )
+from adjutant.actions.models import Action
 from adjutant.api.models import Task
 from adjutant.common.tests.fake_clients import (
+    FakeNeutronClient,
+    FakeOpenstackClient,
     FakeProject,
     FakeUser,
     FakeManager,
@@ -141,6 +146,136 @@ class ProjectSetupActionTests(AdjutantTestCase):
             len(neutron_cache["RegionOne"]["test_project_id"]["subnets"]), 1
         )
 
+    def test_network_setup_action_writes(self):
+        """
+        Cache changes are saved on their own, and only when they change.
+        """
+        setup_neutron_cache("RegionOne", "test_project_id")
+        task = Task.objects.create(
+            keystone_user={"roles": ["admin"], "project_id": "test_project_id"}
+        )
+
+        project = mock.Mock()
+        project.id = "test_project_id"
+        project.name = "test_project"
+        project.domain = "default"
+        project.roles = {}
+
+        setup_identity_cache(projects=[project])
+
+        data = {
+            "setup_network": True,
+            "region": "RegionOne",
+            "project_id": "test_project_id",
+        }
+
+        action = NewDefaultNetworkAction(data, task=task, order=1)
+        action.prepare()
+
+        def action_updates(queries):
+            return [
+                query["sql"]
+                for query in queries
+                if query["sql"].startswith('UPDATE "actions_action"')
+            ]
+
+        with CaptureQueriesContext(connection) as queries:
+            action.approve()
+        updates = action_updates(queries)
+        self.assertTrue(updates)
+        for sql in updates:
+            self.assertNotIn('"action_data"', sql)
+
+        action.action.refresh_from_db()
+        self.assertEqual(
+            action.action.cache,
+            {
+                "network_id_RegionOne": "net_id_0",
+                "port_id_RegionOne": "port_id_3",
+                "router_id_RegionOne": "router_id_2",
+                "subnet_id_RegionOne": "subnet_id_1",
+            },
+        )
+
+        # Everything is already cached, so approving again saves nothing.
+        with CaptureQueriesContext(connection) as queries:
+            action.approve()
+        self.assertEqual(action_updates(queries), [])
+
+    def test_network_setup_saves_each_resource(self):
+        """
+        Each resource created is saved on the action straight away, not
+        just at the end of the stage.
+        """
+        setup_neutron_cache("RegionOne", "test_project_id")
+        task = Task.objects.create(
+            keystone_user={"roles": ["admin"], "project_id": "test_project_id"}
+        )
+
+        project = mock.Mock()
+        project.id = "test_project_id"
+        project.name = "test_project"
+        project.domain = "default"
+        project.roles = {}
+
+        setup_identity_cache(projects=[project])
+
+        data = {
+            "setup_network": True,
+            "region": "RegionOne",
+            "project_id": "test_project_id",
+        }
+
+        action = NewDefaultNetworkAction(data, task=task, order=1)
+        action.prepare()
+
+        saved_caches = []
+        create_network = NewDefaultNetworkAction._create_network_in_region
+
+        def check_saved(network_action, region):
+            create_network(network_action, region)
+            # Still within the stage, before its final save.
+            saved_caches.append(Action.objects.get(pk=action.action.pk).cache)
+
+        with mock.patch.object(
+            NewDefaultNetworkAction, "_create_network_in_region", check_saved
+        ):
+            action.approve()
+
+        self.assertEqual(
+            saved_caches,
+            [
+                {
+                    "network_id_RegionOne": "net_id_0",
+                    "port_id_RegionOne": "port_id_3",
+                    "router_id_RegionOne": "router_id_2",
+                    "subnet_id_RegionOne": "subnet_id_1",
+                }
+            ],
+        )
+
+    def test_set_cache_changed_in_place(self):
+        """
+        A cached value changed in place is still saved by set_cache.
+        """
+        task = Task.objects.create(keystone_user={"roles": ["admin"]})
+        data = {
+            "setup_network": True,
+            "region": "RegionOne",
+            "project_id": "test_project_id",
+        }
+        action = NewDefaultNetworkAction(data, task=task, order=1)
+
+        action.set_cache("completed", {"RegionOne": ["nova"]})
+        completed = action.get_cache("completed")
+        completed["RegionOne"].append("cinder")
+        action.set_cache("completed", completed)
+
+        action.action.refresh_from_db()
+        self.assertEqual(
+            action.action.cache, {"completed": {"RegionOne": ["nova", "cinder"]}}
+        )
+
     def test_network_setup_old_cache_compatibility(self):
         """
         Check that a task with old-tyle cache values defined is compatible
@@ -980,6 +1115,77 @@ class QuotaActionTests(AdjutantTestCase):
         neutronquota = neutron_cache["RegionTwo"]["test_project_id"]["quota"]
         self.assertEqual(neutronquota["network"], 10)
 
+    def test_update_quota_multi_region_fail(self):
+        """
+        A service failing to update fails the approval, and re-approving
+        only retries the services that failed.
+        """
+        project = mock.Mock()
+        project.id = "test_project_id"
+        project.name = "test_project"
+        project.domain = "default"
+        project.roles = {}
+
+        user = mock.Mock()
+        user.id = "user_id"
+        user.name = "test@example.com"
+        user.email = "test@example.com"
+        user.domain = "default"
+        user.password = "test_password"
+
+        setup_identity_cache(projects=[project], users=[user])
+        setup_mock_caches("RegionOne", project.id)
+        setup_mock_caches("RegionTwo", project.id)
+
+        task = Task.objects.create(keystone_user={"roles": ["admin"]})
+
+        data = {
+            "project_id": "test_project_id",
+            "size": "large",
+            "domain_id": "default",
+            "regions": ["RegionOne", "RegionTwo"],
+            "user_id": "user_id",
+        }
+
+        action = UpdateProjectQuotasAction(data, task=task, order=1)
+
+        action.prepare()
+        self.assertEqual(action.valid, True)
+
+        neutron_update_quota = FakeNeutronClient.update_quota
+
+        def failing_update_quota(client, project_id, body):
+            if client.region == "RegionTwo":
+                raise Exception("neutron is down")
+            neutron_update_quota(client, project_id, body)
+
+        with mock.patch.object(FakeNeutronClient, "update_quota", failing_update_quota):
+            self.assertRaises(Exception, action.approve)
+
+        self.assertEqual(action.action.state, "default")
+        completed_services = action.action.cache["completed_quota_services"]
+        self.assertEqual(
+            sorted(completed_services["RegionOne"]), ["cinder", "neutron", "nova"]
+        )
+        self.assertEqual(sorted(completed_services["RegionTwo"]), ["cinder", "nova"])
+        neutronquota = neutron_cache["RegionTwo"]["test_project_id"]["quota"]
+        self.assertEqual(neutronquota["network"], 3)
+
+        with (
+            mock.patch.object(FakeOpenstackClient, "update_quota") as update_quota,
+            mock.patch.object(
+                FakeNeutronClient, "update_quota", autospec=True
+            ) as update_neutron_quota,
+        ):
+            update_neutron_quota.side_effect = neutron_update_quota
+            action.approve()
+
+        self.assertEqual(action.action.state, "completed")
+        update_quota.assert_not_called()
+        self.assertEqual(update_neutron_quota.call_count, 1)
+        self.assertEqual(update_neutron_quota.call_args[0][0].region, "RegionTwo")
+        self.assertEqual(neutronquota["network"], 10)
+
     @conf_utils.modify_conf(
         CONF,
         operations={
@@ -16,7 +16,6 @@ from confspirator import groups
 from confspirator import fields
 
 from adjutant.config import CONF
-from adjutant.common import user_store
 from adjutant.actions.v1.base import (
     UserNameAction,
     UserIdAction,
@@ -47,7 +46,7 @@ class NewUserAction(UserNameAction, ProjectMixin, UserMixin):
     serializer = serializers.NewUserSerializer
 
     def _validate_target_user(self):
-        id_manager = user_store.IdentityManager()
+        id_manager = self.id_manager
 
         # check if user exists and is valid
         # this may mean we need a token.
@@ -126,7 +125,7 @@ class NewUserAction(UserNameAction, ProjectMixin, UserMixin):
                 self._validate_target_user,
             ]
         )
-        self.action.save()
+        self.action.save_changes()
 
     def _prepare(self):
         self._validate()
@@ -194,6 +193,8 @@ class ResetUserPasswordAction(UserNameAction, UserMixin):
 
     serializer = serializers.ResetUserPasswordSerializer
 
+    parallel_stages = ["prepare", "approve"]
+
     config_group = groups.DynamicNameConfigGroup(
         children=[
             fields.ListConfig(
@@ -209,7 +210,7 @@ class ResetUserPasswordAction(UserNameAction, UserMixin):
         super(ResetUserPasswordAction, self).__init__(*args, **kwargs)
 
     def _validate_user_roles(self):
-        id_manager = user_store.IdentityManager()
+        id_manager = self.id_manager
 
         all_roles = id_manager.get_all_roles(self.user)
 
@@ -249,7 +250,7 @@ class ResetUserPasswordAction(UserNameAction, UserMixin):
                 self._validate_user_email,
             ]
         )
-        self.action.save()
+        self.action.save_changes()
 
     def _prepare(self):
         self._validate()
@@ -278,6 +279,8 @@ class EditUserRolesAction(UserIdAction, ProjectMixin, UserMixin):
 
     serializer = serializers.EditUserRolesSerializer
 
+    parallel_stages = ["prepare", "approve"]
+
     def _validate_target_user(self):
         # Get target user
         user = self._get_target_user()
@@ -287,7 +290,7 @@ class EditUserRolesAction(UserIdAction, ProjectMixin, UserMixin):
         return True
 
     def _validate_user_roles(self):
-        id_manager = user_store.IdentityManager()
+        id_manager = self.id_manager
         user = self._get_target_user()
         project = id_manager.get_project(self.project_id)
         # user roles
@@ -322,7 +325,7 @@ class EditUserRolesAction(UserIdAction, ProjectMixin, UserMixin):
         return True
 
     def _validate_role_permissions(self):
-        id_manager = user_store.IdentityManager()
+        id_manager = self.id_manager
 
         current_user_roles = id_manager.get_roles(
             project=self.project_id, user=self.user_id
@@ -356,7 +359,7 @@ class EditUserRolesAction(UserIdAction, ProjectMixin, UserMixin):
                 self._validate_user_roles,
             ]
         )
-        self.action.save()
+        self.action.save_changes()
 
     def _prepare(self):
         self._validate()
@@ -428,6 +431,8 @@ class UpdateUserEmailAction(UserIdAction, UserMixin):
 
     serializer = serializers.UpdateUserEmailSerializer
 
+    parallel_stages = ["prepare", "approve"]
+
     def _get_email(self):
         # Sending to new email address
         return self.new_email
@@ -439,7 +444,7 @@ class UpdateUserEmailAction(UserIdAction, UserMixin):
                 self._validate_email_not_in_use,
             ]
         )
-        self.action.save()
+        self.action.save_changes()
 
     def _validate_user(self):
         self.user = self._get_target_user()
@@ -452,7 +457,7 @@ class UpdateUserEmailAction(UserIdAction, UserMixin):
         if CONF.identity.username_is_email:
             self.domain_id = self.action.task.keystone_user["project_domain_id"]
 
-            id_manager = user_store.IdentityManager()
+            id_manager = self.id_manager
 
             if id_manager.find_user(self.new_email, self.domain_id):
                 self.add_note("User with same username already exists")
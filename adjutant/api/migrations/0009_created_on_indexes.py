@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0008_auto_20190610_0209"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="notification",
+            index=models.Index(
+                fields=["created_on", "uuid"], name="api_notific_created_2aa636_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="token",
+            index=models.Index(
+                fields=["created_on", "token"], name="api_token_created_399495_idx"
+            ),
+        ),
+    ]
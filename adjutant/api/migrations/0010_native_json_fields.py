@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:59
+
+import rest_framework.utils.encoders
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0009_created_on_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="notification",
+            name="notes",
+            field=models.JSONField(
+                default=dict, encoder=rest_framework.utils.encoders.JSONEncoder
+            ),
+        ),
+    ]
@@ -15,7 +15,7 @@
 from django.db import models
 from uuid import uuid4
 from django.utils import timezone
-from jsonfield import JSONField
+from rest_framework.utils.encoders import JSONEncoder
 
 from adjutant.tasks.models import Task
 
@@ -34,6 +34,11 @@ class Token(models.Model):
     created_on = models.DateTimeField(default=timezone.now)
     expires = models.DateTimeField(db_index=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_on", "token"]),
+        ]
+
     def to_dict(self):
         return {
             "task": self.task.uuid,
@@ -54,12 +59,17 @@ class Notification(models.Model):
     """
 
     uuid = models.CharField(max_length=32, default=hex_uuid, primary_key=True)
-    notes = JSONField(default={})
+    notes = models.JSONField(default=dict, encoder=JSONEncoder)
     task = models.ForeignKey(Task, on_delete=models.CASCADE)
     error = models.BooleanField(default=False, db_index=True)
     created_on = models.DateTimeField(default=timezone.now)
     acknowledged = models.BooleanField(default=False, db_index=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_on", "uuid"]),
+        ]
+
     def to_dict(self):
         return {
             "uuid": self.uuid,
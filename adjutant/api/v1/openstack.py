@@ -12,6 +12,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from django.db.models import Exists, OuterRef
 from django.utils import timezone
 
 from rest_framework.response import Response
@@ -19,6 +20,7 @@ from rest_framework.response import Response
 from confspirator import groups
 from confspirator import fields
 
+from adjutant.actions.models import Action
 from adjutant.common import user_store
 from adjutant.api import models
 from adjutant.api import utils
@@ -121,53 +123,59 @@ class UserList(tasks.InviteUser):
                 }
             )
 
-        # Get my active tasks for this project:
-        project_tasks = models.Task.objects.filter(
-            project_id=project_id,
-            task_type="invite_user_to_project",
-            completed=0,
-            cancelled=0,
+        # Get my active tasks for this project, with what their status
+        # depends on worked out by the database:
+        now = timezone.now()
+        project_tasks = (
+            models.Task.objects.filter(
+                project_id=project_id,
+                task_type="invite_user_to_project",
+                completed=0,
+                cancelled=0,
+            )
+            .annotate(
+                has_expired_token=Exists(
+                    models.Token.objects.filter(task=OuterRef("pk"), expires__lt=now)
+                ),
+                has_failed_notification=Exists(
+                    models.Notification.objects.filter(task=OuterRef("pk"), error=True)
+                ),
+                has_invalid_action=Exists(
+                    Action.objects.filter(task=OuterRef("pk"), valid=False)
+                ),
+            )
+            .with_actions()
         )
 
-        registrations = []
         for task in project_tasks:
-            status = "Invited"
-            for token in task.tokens:
-                if token.expired:
-                    status = "Expired"
-
-            for notification in task.notifications:
-                if notification.error:
-                    status = "Failed"
-
-            for action in task.actions:
-                if not action.valid:
-                    status = "Invalid"
+            if task.has_invalid_action:
+                status = "Invalid"
+            elif task.has_failed_notification:
+                status = "Failed"
+            elif task.has_expired_token:
+                status = "Expired"
+            else:
+                status = "Invited"
 
             task_data = {}
             for action in task.actions:
                 task_data.update(action.action_data)
 
-            registrations.append(
-                {"uuid": task.uuid, "task_data": task_data, "status": status}
-            )
-
-        for task in registrations:
             # NOTE(adriant): commenting out for now as it causes more confusion
             # than it helps. May uncomment once different duplication checking
             # measures are in place.
-            # if task['task_data']['email'] not in active_emails:
+            # if task.target_email not in active_emails:
             user = {
-                "id": task["uuid"],
-                "name": task["task_data"]["email"],
-                "email": task["task_data"]["email"],
-                "roles": task["task_data"]["roles"],
-                "inherited_roles": task["task_data"]["inherited_roles"],
+                "id": task.uuid,
+                "name": task.target_email,
+                "email": task.target_email,
+                "roles": task_data["roles"],
+                "inherited_roles": task_data["inherited_roles"],
                 "cohort": "Invited",
-                "status": task["status"],
+                "status": status,
             }
             if not CONF.identity.username_is_email:
-                user["name"] = task["task_data"]["username"]
+                user["name"] = task.target_username
 
             user_list.append(user)
 
@@ -247,16 +255,16 @@ class UserDetail(BaseDelegateAPI):
                 },
                 status=501,
             )
-        project_tasks = models.Task.objects.filter(
+        task = models.Task.objects.filter(
+            uuid=user_id,
             project_id=project_id,
             task_type="invite_user_to_project",
             completed=0,
             cancelled=0,
-        )
-        for task in project_tasks:
-            if task.uuid == user_id:
-                self.task_manager.cancel(task)
-                return Response("Cancelled pending invite task!", status=200)
+        ).first()
+        if task:
+            self.task_manager.cancel(task)
+            return Response("Cancelled pending invite task!", status=200)
         return Response("Not found.", status=404)
 
 
@@ -403,11 +411,15 @@ class UpdateProjectQuotas(BaseDelegateAPI):
 
     def get_active_quota_tasks(self):
         # Get the 5 last quota tasks.
-        task_list = models.Task.objects.filter(
-            task_type__exact=self.task_type,
-            project_id__exact=self.project_id,
-            cancelled=0,
-        ).order_by("-created_on")[: self._number_of_returned_tasks]
+        task_list = (
+            models.Task.objects.filter(
+                task_type__exact=self.task_type,
+                project_id__exact=self.project_id,
+                cancelled=0,
+            )
+            .order_by("-created_on")
+            .with_actions()[: self._number_of_returned_tasks]
+        )
 
         response_tasks = []
 
@@ -432,14 +444,6 @@ class UpdateProjectQuotas(BaseDelegateAPI):
 
         return response_tasks
 
-    def check_region_exists(self, region):
-        # Check that the region actually exists
-        id_manager = user_store.IdentityManager()
-        v_region = id_manager.get_region(region)
-        if not v_region:
-            return False
-        return True
-
     @utils.mod_or_admin
     def get(self, request):
         """
@@ -454,24 +458,23 @@ class UpdateProjectQuotas(BaseDelegateAPI):
         regions = request.query_params.get("regions", None)
         include_usage = request.query_params.get("include_usage", True)
 
+        id_manager = user_store.IdentityManager()
+        # Only get the region id as that is what will be passed from
+        # parameters otherwise
+        active_regions = [region.id for region in id_manager.list_regions()]
+
         if regions:
             regions = regions.split(",")
+            for region in regions:
+                if region not in active_regions:
+                    return Response(
+                        {"ERROR": ["Region: %s is not valid" % region]}, 400
+                    )
         else:
-            id_manager = user_store.IdentityManager()
-            # Only get the region id as that is what will be passed from
-            # parameters otherwise
-            regions = (region.id for region in id_manager.list_regions())
-
-        region_quotas = []
+            regions = active_regions
 
         quota_manager = QuotaManager(self.project_id)
-        for region in regions:
-            if self.check_region_exists(region):
-                quota = quota_manager.get_region_quota_data(region, include_usage)
-                if quota:
-                    region_quotas.append(quota)
-            else:
-                return Response({"ERROR": ["Region: %s is not valid" % region]}, 400)
+        region_quotas = quota_manager.get_regions_quota_data(regions, include_usage)
 
         response_tasks = self.get_active_quota_tasks()
 
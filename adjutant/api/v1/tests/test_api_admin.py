@@ -18,11 +18,15 @@ from unittest import mock
 from unittest import skip
 
 from confspirator.tests import utils as conf_utils
+from django.db import connection
 from django.utils import timezone
 from django.core import mail
+from django.core.management import call_command
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.test import APITestCase
 
+from adjutant.actions.models import Action
 from adjutant.api.models import Task, Token, Notification
 from adjutant.common.tests import fake_clients
 from adjutant.common.tests.fake_clients import FakeManager, setup_identity_cache
@@ -1218,6 +1222,245 @@ class AdminAPITests(APITestCase):
         response = self.client.delete(url, format="json", headers=headers)
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
+    @conf_utils.modify_conf(
+        CONF,
+        operations={
+            "adjutant.api.batch_chunk_size": [
+                {"operation": "override", "value": 2},
+            ],
+            "adjutant.api.batch_create_task_types": [
+                {"operation": "override", "value": ["create_project_and_user"]},
+            ],
+        },
+    )
+    def test_task_batch(self):
+        """
+        Many tasks can be created, approved and cancelled at once, each
+        with its own result, in the order given.
+        """
+
+        setup_identity_cache()
+
+        headers = {
+            "project_name": "test_project",
+            "project_id": "test_project_id",
+            "roles": "admin,member",
+            "username": "test@example.com",
+            "user_id": "test_user_id",
+            "authenticated": True,
+        }
+        url = "/v1/tasks/batch"
+        create = [
+            {
+                "task_type": "create_project_and_user",
+                "data": {
+                    "project_name": "project_%s" % i,
+                    "email": "user_%s@example.com" % i,
+                    "region": "RegionOne",
+                    "domain_id": "default",
+                    "parent_id": None,
+                },
+            }
+            for i in range(4)
+        ]
+        create.append({"task_type": "not_a_task", "data": {}})
+        create.append(
+            {
+                "task_type": "edit_user_roles",
+                "data": {"user_id": "test_user_id", "roles": ["admin"]},
+            }
+        )
+        response = self.client.post(
+            url, {"create": create}, format="json", headers=headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.json()["create"]
+        self.assertEqual(
+            [result["status"] for result in results], [202, 202, 202, 202, 400, 400]
+        )
+        self.assertEqual(results[0]["notes"], ["task created"])
+        self.assertIsNone(results[4]["task"])
+        self.assertIn("task_type", results[4]["errors"])
+        self.assertEqual(
+            results[5]["errors"],
+            {"task_type": ["this task type can't be created in a batch."]},
+        )
+        self.assertFalse(Task.objects.filter(task_type="edit_user_roles").exists())
+        uuids = [result["task"] for result in results[:4]]
+        for uuid, data in zip(uuids, create):
+            task = Task.objects.get(uuid=uuid)
+            self.assertEqual(
+                task.actions[0].action_data["project_name"],
+                data["data"]["project_name"],
+            )
+
+        response = self.client.post(
+            url,
+            {"approve": uuids[:3] + ["not_a_task"], "cancel": [uuids[3], uuids[2]]},
+            format="json",
+            headers=headers,
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.json()
+        self.assertEqual(
+            [(result["task"], result["status"]) for result in results["approve"]],
+            [(uuids[0], 202), (uuids[1], 202), (uuids[2], 202), ("not_a_task", 404)],
+        )
+        self.assertEqual(results["approve"][0]["notes"], ["created token"])
+        self.assertEqual(results["approve"][3]["errors"], ["No task with this id."])
+        self.assertEqual(
+            [(result["task"], result["status"]) for result in results["cancel"]],
+            [(uuids[3], 200), (uuids[2], 200)],
+        )
+        self.assertEqual(Token.objects.count(), 2)
+        self.assertEqual(len(fake_clients.identity_cache["new_projects"]), 3)
+        self.assertTrue(Task.objects.get(uuid=uuids[3]).cancelled)
+
+        # a task that can't be cancelled doesn't stop the others
+        response = self.client.post(
+            url, {"cancel": uuids[2:]}, format="json", headers=headers
+        )
+        self.assertEqual(
+            [result["status"] for result in response.json()["cancel"]], [400, 400]
+        )
+
+    @conf_utils.modify_conf(
+        CONF,
+        operations={
+            "adjutant.workflow.task_queue.enabled": [
+                {"operation": "override", "value": True},
+            ],
+            "adjutant.api.batch_create_task_types": [
+                {"operation": "override", "value": ["create_project_and_user"]},
+            ],
+            "adjutant.api.batch_max_inline_approvals": [
+                {"operation": "override", "value": 1},
+            ],
+        },
+    )
+    def test_task_batch_queue(self):
+        """
+        With the task queue enabled, a batch approval queues a job per
+        task for the process_tasks workers, so isn't limited to the
+        approvals that can be run inline.
+        """
+
+        setup_identity_cache()
+
+        headers = {
+            "project_name": "test_project",
+            "project_id": "test_project_id",
+            "roles": "admin,member",
+            "username": "test@example.com",
+            "user_id": "test_user_id",
+            "authenticated": True,
+        }
+        url = "/v1/tasks/batch"
+        create = [
+            {
+                "task_type": "create_project_and_user",
+                "data": {
+                    "project_name": "project_%s" % i,
+                    "email": "user_%s@example.com" % i,
+                    "region": "RegionOne",
+                    "domain_id": "default",
+                    "parent_id": None,
+                },
+            }
+            for i in range(2)
+        ]
+        response = self.client.post(
+            url, {"create": create}, format="json", headers=headers
+        )
+        uuids = [result["task"] for result in response.json()["create"]]
+
+        response = self.client.post(
+            url, {"approve": uuids}, format="json", headers=headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for uuid, result in zip(uuids, response.json()["approve"]):
+            self.assertEqual(result["task"], uuid)
+            self.assertEqual(result["status"], 202)
+            self.assertEqual(result["notes"], ["Task approval queued."])
+            self.assertIn(result["job"], result["status_url"])
+        self.assertEqual(Token.objects.count(), 0)
+
+        call_command("process_tasks", once=True, workers=1)
+        self.assertEqual(Token.objects.count(), 2)
+
+    @conf_utils.modify_conf(
+        CONF,
+        operations={
+            "adjutant.api.batch_max_tasks": [
+                {"operation": "override", "value": 2},
+            ],
+            "adjutant.api.batch_max_inline_approvals": [
+                {"operation": "override", "value": 1},
+            ],
+        },
+    )
+    def test_task_batch_invalid(self):
+        """
+        The batch must be lists of tasks, and not too many of them.
+        """
+
+        headers = {
+            "project_name": "test_project",
+            "project_id": "test_project_id",
+            "roles": "admin,member",
+            "username": "test@example.com",
+            "user_id": "test_user_id",
+            "authenticated": True,
+        }
+        url = "/v1/tasks/batch"
+        response = self.client.post(url, {}, format="json", headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(
+            url, {"approve": "some_task"}, format="json", headers=headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.json(), {"approve": ["this field needs to be a list."]}
+        )
+
+        response = self.client.post(
+            url, {"cancel": [{"task": "some_task"}]}, format="json", headers=headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(
+            url,
+            {"approve": ["task_1", "task_2"], "cancel": ["task_3"]},
+            format="json",
+            headers=headers,
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.json(), {"errors": ["No more than 2 tasks can be given at once."]}
+        )
+
+        # without the task queue, each approval runs during the request
+        response = self.client.post(
+            url, {"approve": ["task_1", "task_2"]}, format="json", headers=headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.json(),
+            {
+                "errors": [
+                    "No more than 1 tasks can be approved at once without the "
+                    "task queue."
+                ]
+            },
+        )
+
+        headers["roles"] = "member"
+        response = self.client.post(
+            url, {"approve": ["task_1"]}, format="json", headers=headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
     def test_task_list(self):
         """
         Create some user invite tasks, then make sure we can list them.
@@ -1270,6 +1513,305 @@ class AdminAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.json()["tasks"]), 3)
 
+    def test_task_list_query_count(self):
+        """
+        Listing tasks takes the same number of queries however many tasks
+        there are, and still returns each task's actions in order.
+        """
+        headers = {
+            "project_name": "test_project",
+            "project_id": "test_project_id",
+            "roles": "admin,member",
+            "username": "test@example.com",
+            "user_id": "test_user_id",
+            "authenticated": True,
+        }
+        url = "/v1/tasks"
+
+        def create_tasks(count):
+            for i in range(count):
+                task = Task.objects.create(
+                    keystone_user={"project_id": "test_project_id"},
+                    project_id="test_project_id",
+                    task_type="create_project_and_user",
+                )
+                # create out of order, to check they are ordered
+                for order in [2, 0, 1]:
+                    Action.objects.create(
+                        action_name="Action%s" % order,
+                        action_data={"order": order},
+                        task=task,
+                        order=order,
+                    )
+
+        def count_queries(params=None):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, params, format="json", headers=headers)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(queries), response.json()
+
+        create_tasks(2)
+        small_count, _ = count_queries()
+        small_page_count, _ = count_queries({"tasks_per_page": 5})
+
+        create_tasks(48)
+        large_count, data = count_queries()
+        large_page_count, page_data = count_queries({"tasks_per_page": 25})
+
+        self.assertEqual(large_count, small_count)
+        self.assertEqual(large_page_count, small_page_count)
+        self.assertEqual(len(data["tasks"]), 50)
+        self.assertEqual(len(page_data["tasks"]), 25)
+        for task in data["tasks"]:
+            self.assertEqual(
+                [action["action_name"] for action in task["actions"]],
+                ["Action0", "Action1", "Action2"],
+            )
+
+    def test_task_list_marker(self):
+        """
+        Walk the task list a page at a time using limit and marker.
+        """
+        headers = {
+            "project_name": "test_project",
+            "project_id": "test_project_id",
+            "roles": "admin,member",
+            "username": "test@example.com",
+            "user_id": "test_user_id",
+            "authenticated": True,
+        }
+        url = "/v1/tasks"
+
+        now = timezone.now()
+        for i in range(8):
+            # pairs of tasks share a created_on, so ties must be handled
+            Task.objects.create(
+                keystone_user={"project_id": "test_project_id"},
+                project_id="test_project_id",
+                task_type="create_project_and_user",
+                created_on=now - timedelta(minutes=i // 2),
+            )
+        expected = list(
+            Task.objects.order_by("-created_on", "-uuid").values_list("uuid", flat=True)
+        )
+
+        uuids = []
+        query_counts = []
+        params = {"limit": 3}
+        while True:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, params, format="json", headers=headers)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            query_counts.append(len(queries))
+            data = response.json()
+            self.assertLessEqual(len(data["tasks"]), 3)
+            uuids.extend(task["uuid"] for task in data["tasks"])
+            if not data["has_more"]:
+                self.assertIsNone(data["next_marker"])
+                break
+            params["marker"] = data["next_marker"]
+
+        self.assertEqual(uuids, expected)
+        self.assertEqual(len(query_counts), 3)
+        self.assertEqual(len(set(query_counts)), 1)
+
+        response = self.client.get(
+            url, {"marker": "not a marker"}, format="json", headers=headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json(), {"errors": ["Marker is invalid."]})
+
+        response = self.client.get(url, {"limit": 0}, format="json", headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(url, {"limit": 1001}, format="json", headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json(), {"errors": ["Limit must be at most 1000."]})
+
+    def test_notification_and_token_list_marker(self):
+        """
+        Notifications and tokens can be paged through with limit and marker.
+        """
+        headers = {
+            "project_name": "test_project",
+            "project_id": "test_project_id",
+            "roles": "admin,member",
+            "username": "test@example.com",
+            "user_id": "test_user_id",
+            "authenticated": True,
+        }
+
+        task = Task.objects.create(
+            keystone_user={"project_id": "test_project_id"},
+            project_id="test_project_id",
+            task_type="create_project_and_user",
+        )
+        now = timezone.now()
+        for i in range(5):
+            Notification.objects.create(
+                task=task, notes={"i": i}, created_on=now - timedelta(minutes=i)
+            )
+            Token.objects.create(
+                task=task,
+                token="token_%s" % i,
+                created_on=now - timedelta(minutes=i),
+                expires=now + timedelta(hours=1),
+            )
+
+        for url, key, field in [
+            ("/v1/notifications", "notifications", "uuid"),
+            ("/v1/tokens", "tokens", "token"),
+        ]:
+            response = self.client.get(
+                url, {"limit": 2}, format="json", headers=headers
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            first_page = response.json()
+            self.assertTrue(first_page["has_more"])
+
+            response = self.client.get(
+                url,
+                {"limit": 4, "marker": first_page["next_marker"]},
+                format="json",
+                headers=headers,
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            second_page = response.json()
+            self.assertFalse(second_page["has_more"])
+
+            items = first_page[key] + second_page[key]
+            self.assertEqual(len(items), 5)
+            self.assertEqual(
+                [item["created_on"] for item in items],
+                sorted([item["created_on"] for item in items], reverse=True),
+            )
+            self.assertEqual(len({item[field] for item in items}), 5)
+
+    def test_list_streaming(self):
+        """
+        Streamed lists return the same JSON as the normal responses.
+        """
+        headers = {
+            "project_name": "test_project",
+            "project_id": "test_project_id",
+            "roles": "admin,member",
+            "username": "test@example.com",
+            "user_id": "test_user_id",
+            "authenticated": True,
+        }
+
+        now = timezone.now()
+        for i in range(7):
+            task = Task.objects.create(
+                keystone_user={"project_id": "test_project_id"},
+                project_id="test_project_id",
+                task_type="create_project_and_user",
+                task_notes=["note \u2603 %s" % i],
+                created_on=now - timedelta(minutes=i),
+            )
+            for order in [1, 0]:
+                Action.objects.create(
+                    action_name="Action%s" % order,
+                    action_data={"order": order},
+                    task=task,
+                    order=order,
+                )
+            Notification.objects.create(task=task, notes={"i": i})
+            Token.objects.create(
+                task=task, token="token_%s" % i, expires=now + timedelta(hours=1)
+            )
+
+        for url in ["/v1/tasks", "/v1/notifications", "/v1/tokens"]:
+            response = self.client.get(url, format="json", headers=headers)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertFalse(response.streaming)
+            expected = response.content
+
+            with conf_utils.modify_conf(
+                CONF,
+                operations={
+                    "adjutant.api.stream_list_responses": [
+                        {"operation": "override", "value": True},
+                    ],
+                    "adjutant.api.stream_chunk_size": [
+                        {"operation": "override", "value": 3},
+                    ],
+                },
+            ):
+                response = self.client.get(url, format="json", headers=headers)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(response.streaming)
+            self.assertEqual(response["Content-Type"], "application/json")
+            self.assertEqual(b"".join(response.streaming_content), expected)
+
+    def test_task_fields(self):
+        """
+        Only the requested task fields are fetched and returned.
+        """
+        headers = {
+            "project_name": "test_project",
+            "project_id": "test_project_id",
+            "roles": "admin,member",
+            "username": "test@example.com",
+            "user_id": "test_user_id",
+            "authenticated": True,
+        }
+
+        for i in range(3):
+            task = Task.objects.create(
+                keystone_user={"project_id": "test_project_id"},
+                project_id="test_project_id",
+                task_type="create_project_and_user",
+                task_notes=["a long note"],
+            )
+            Action.objects.create(
+                action_name="SomeAction", action_data={}, task=task, order=0
+            )
+
+        url = "/v1/tasks"
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                url,
+                {"fields": "task_type,uuid,completed"},
+                format="json",
+                headers=headers,
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()["tasks"]), 3)
+        for task_dict in response.json()["tasks"]:
+            self.assertEqual(list(task_dict), ["uuid", "task_type", "completed"])
+        task_queries = [
+            query["sql"] for query in queries if "tasks_task" in query["sql"]
+        ]
+        self.assertEqual(len(task_queries), 1)
+        self.assertNotIn("task_notes", task_queries[0])
+        self.assertFalse(
+            [query for query in queries if "actions_action" in query["sql"]]
+        )
+
+        response = self.client.get(
+            url, {"fields": "uuid,actions"}, format="json", headers=headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for task_dict in response.json()["tasks"]:
+            self.assertEqual(list(task_dict), ["uuid", "actions"])
+            self.assertEqual(task_dict["actions"][0]["action_name"], "SomeAction")
+
+        url = "/v1/tasks/" + task.uuid
+        response = self.client.get(
+            url, {"fields": "uuid,task_notes"}, format="json", headers=headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.json(), {"uuid": task.uuid, "task_notes": ["a long note"]}
+        )
+
+        response = self.client.get(
+            url, {"fields": "uuid,hash_key"}, format="json", headers=headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json(), {"errors": ["Invalid fields: hash_key"]})
+
     def test_task_list_ordering(self):
         """
         Test that tasks returns in the default sort.
@@ -1387,6 +1929,68 @@ class AdminAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.json()["tasks"]), 2)
 
+    def test_task_list_filter_json_fields(self):
+        """
+        Keys within the JSON fields can be filtered on.
+        """
+        project = fake_clients.FakeProject(name="test_project")
+
+        setup_identity_cache(projects=[project])
+
+        url = "/v1/actions/InviteUser"
+        headers = {
+            "project_name": "test_project",
+            "project_id": project.id,
+            "roles": "project_admin,member,project_mod",
+            "username": "test@example.com",
+            "user_id": "test_user_id",
+            "authenticated": True,
+        }
+        for email in ["test@example.com", "test2@example.com"]:
+            data = {
+                "email": email,
+                "roles": ["member"],
+                "project_id": project.id,
+            }
+            response = self.client.post(url, data, format="json", headers=headers)
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        url = "/v1/actions/CreateProjectAndUser"
+        data = {"project_name": "test_project2", "email": "test2@example.com"}
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        headers = {
+            "project_name": "test_project",
+            "project_id": "test_project_id",
+            "roles": "admin,member",
+            "username": "test@example.com",
+            "user_id": "test_user_id",
+            "authenticated": True,
+        }
+        url = "/v1/tasks"
+
+        params = {
+            "filters": json.dumps(
+                {"keystone_user__username": {"exact": "test@example.com"}}
+            )
+        }
+        response = self.client.get(url, params, format="json", headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()["tasks"]), 2)
+
+        params = {
+            "filters": json.dumps(
+                {"action__action_data__email": {"exact": "test2@example.com"}}
+            )
+        }
+        response = self.client.get(url, params, format="json", headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            sorted(task["task_type"] for task in response.json()["tasks"]),
+            ["create_project_and_user", "invite_user_to_project"],
+        )
+
     # TODO(adriant): enable this test again when filters are properly
     # blacklisted.
     @skip("Does not apply yet.")
@@ -12,14 +12,21 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from collections import Counter
+import contextlib
 from datetime import timedelta
+import threading
 from unittest import mock
 
 from confspirator.tests import utils as conf_utils
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from rest_framework import status
 
-from adjutant.api.models import Token, Task
+from adjutant.actions.models import Action
+from adjutant.api.models import Notification, Token, Task
+from adjutant.common.quota import QuotaManager
 from adjutant.common.tests import fake_clients
 from adjutant.common.tests.fake_clients import (
     FakeManager,
@@ -132,6 +139,121 @@ class OpenstackAPITests(AdjutantAPITestCase):
         self.assertEqual(len(response.json()["users"]), 2)
         self.assertTrue(b"test2@example.com" in response.content)
 
+    def test_user_list_pending_invites(self):
+        """
+        Pending invites are listed from the task's target fields, and
+        the number of queries does not grow with the number of invites.
+        """
+        project = fake_clients.FakeProject(name="test_project")
+
+        setup_identity_cache(projects=[project])
+
+        url = "/v1/openstack/users"
+        headers = {
+            "project_name": "test_project",
+            "project_id": project.id,
+            "roles": "project_admin,member,project_mod",
+            "username": "test@example.com",
+            "user_id": "test_user_id",
+            "authenticated": True,
+        }
+
+        def invite(count, start=0):
+            for i in range(start, start + count):
+                data = {
+                    "email": "invite%s@example.com" % i,
+                    "roles": ["member"],
+                    "project_id": project.id,
+                }
+                response = self.client.post(url, data, format="json", headers=headers)
+                self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        invite(2)
+        task = Task.objects.get(target_email="invite0@example.com")
+        # usernames are emails, so the invite has no username of its own
+        self.assertIsNone(task.target_username)
+        self.assertEqual(task.task_type, "invite_user_to_project")
+
+        with CaptureQueriesContext(connection) as few_invites:
+            response = self.client.get(url, headers=headers)
+        self.assertEqual(len(response.json()["users"]), 2)
+
+        invite(8, start=2)
+        with CaptureQueriesContext(connection) as many_invites:
+            response = self.client.get(url, headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        invites = sorted(
+            response.json()["users"], key=lambda user: int(user["email"][6:-12])
+        )
+        self.assertEqual(len(invites), 10)
+        for i, user in enumerate(invites):
+            self.assertEqual(user["email"], "invite%s@example.com" % i)
+            self.assertEqual(user["name"], "invite%s@example.com" % i)
+            self.assertEqual(user["roles"], ["member"])
+            self.assertEqual(user["cohort"], "Invited")
+            self.assertEqual(user["status"], "Invited")
+        self.assertEqual(len(many_invites), len(few_invites))
+
+    def test_user_list_invite_status(self):
+        """
+        The status of each pending invite reflects its tokens,
+        notifications and actions.
+        """
+        project = fake_clients.FakeProject(name="test_project")
+
+        setup_identity_cache(projects=[project])
+
+        url = "/v1/openstack/users"
+        headers = {
+            "project_name": "test_project",
+            "project_id": project.id,
+            "roles": "project_admin,member,project_mod",
+            "username": "test@example.com",
+            "user_id": "test_user_id",
+            "authenticated": True,
+        }
+        for name in ["invited", "expired", "failed", "invalid"]:
+            data = {
+                "email": "%s@example.com" % name,
+                "roles": ["member"],
+                "project_id": project.id,
+            }
+            response = self.client.post(url, data, format="json", headers=headers)
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        Token.objects.filter(task__target_email="expired@example.com").update(
+            expires=timezone.now() - timedelta(hours=1)
+        )
+        Notification.objects.create(
+            task=Task.objects.get(target_email="failed@example.com"),
+            notes={"errors": ["it broke"]},
+            error=True,
+        )
+        Action.objects.filter(task__target_email="invalid@example.com").update(
+            valid=False
+        )
+        # an invalid action outranks an expired token
+        Token.objects.filter(task__target_email="invalid@example.com").update(
+            expires=timezone.now() - timedelta(hours=1)
+        )
+
+        response = self.client.get(url, headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        statuses = {
+            user["email"]: user["status"]
+            for user in response.json()["users"]
+            if user["cohort"] == "Invited"
+        }
+        self.assertEqual(
+            statuses,
+            {
+                "invited@example.com": "Invited",
+                "expired@example.com": "Expired",
+                "failed@example.com": "Failed",
+                "invalid@example.com": "Invalid",
+            },
+        )
+
     def test_user_list_inherited(self):
         """
         Test that user list returns inherited roles correctly.
@@ -783,6 +905,118 @@ class QuotaAPITests(AdjutantAPITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_quota_show_service_error(self):
+        """A failing service is reported against its region, while the
+        rest of the quota data is still returned.
+        """
+
+        project = fake_clients.FakeProject(
+            name="test_project",
+            id="test_project_id",
+        )
+
+        user = fake_clients.FakeUser(
+            name="test@example.com", password="123", email="test@example.com"
+        )
+
+        setup_identity_cache(projects=[project], users=[user])
+
+        admin_headers = {
+            "project_name": "test_project",
+            "project_id": project.id,
+            "roles": "project_admin,member,project_mod",
+            "username": "test@example.com",
+            "user_id": "user_id",
+            "authenticated": True,
+        }
+
+        def get_cinderclient(region):
+            if region == "RegionTwo":
+                raise Exception("cinder is down")
+            return get_fake_cinderclient(region)
+
+        url = "/v1/openstack/quotas/"
+
+        with mock.patch(
+            "adjutant.common.openstack_clients.get_cinderclient", get_cinderclient
+        ):
+            response = self.client.get(
+                url,
+                {},
+                headers=admin_headers,
+                format="json",
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        regions = {res["region"]: res for res in response.data["regions"]}
+        self.assertNotIn("errors", regions["RegionOne"])
+        self.assertEqual(
+            regions["RegionTwo"]["errors"], {"cinder": "Exception: cinder is down"}
+        )
+        self.assertNotIn("cinder", regions["RegionTwo"]["current_quota"])
+        self.assertIsNone(regions["RegionTwo"]["current_quota_size"])
+        self.assertEqual(regions["RegionTwo"]["quota_change_options"], [])
+        self.assertEqual(regions["RegionOne"]["current_quota_size"], "small")
+        self.assertIn("nova", regions["RegionTwo"]["current_quota"])
+        self.assertIn("nova", regions["RegionTwo"]["current_usage"])
+
+    @conf_utils.modify_conf(
+        CONF,
+        operations={
+            "adjutant.quota.service_timeout": [
+                {"operation": "override", "value": 1},
+            ],
+        },
+    )
+    def test_quota_show_service_timeout(self):
+        """A service that doesn't respond in time is reported as an error."""
+
+        project = fake_clients.FakeProject(
+            name="test_project",
+            id="test_project_id",
+        )
+
+        user = fake_clients.FakeUser(
+            name="test@example.com", password="123", email="test@example.com"
+        )
+
+        setup_identity_cache(projects=[project], users=[user])
+
+        admin_headers = {
+            "project_name": "test_project",
+            "project_id": project.id,
+            "roles": "project_admin,member,project_mod",
+            "username": "test@example.com",
+            "user_id": "user_id",
+            "authenticated": True,
+        }
+
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def get_neutronclient(region):
+            release.wait(5)
+            return get_fake_neutron(region)
+
+        url = "/v1/openstack/quotas/"
+
+        with mock.patch(
+            "adjutant.common.openstack_clients.get_neutronclient", get_neutronclient
+        ):
+            response = self.client.get(
+                url,
+                {"regions": "RegionOne"},
+                headers=admin_headers,
+                format="json",
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        region = response.data["regions"][0]
+        self.assertEqual(list(region["errors"]), ["neutron"])
+        self.assertIn("TimeoutError", region["errors"]["neutron"])
+        self.assertEqual(sorted(region["current_quota"]), ["cinder", "nova"])
+        self.assertIsNone(region["current_quota_size"])
+
     def test_update_quota_no_history(self):
         """Update the quota size of a project with no history"""
 
@@ -814,6 +1048,80 @@ class QuotaAPITests(AdjutantAPITestCase):
         # Then check to see the quotas have changed
         self.check_quota_cache("RegionOne", project.id, "medium")
 
+    @conf_utils.modify_conf(
+        CONF,
+        operations={
+            "adjutant.quota.snapshot_cache_ttl": [
+                {"operation": "override", "value": 30},
+            ],
+        },
+    )
+    def test_update_quota_snapshot_cache(self):
+        """
+        Updating the quota fetches each service's quota and usage at most
+        once, and the update clears the cached quota.
+        """
+
+        project = fake_clients.FakeProject(name="test_project", id="test_project_id")
+
+        user = fake_clients.FakeUser(
+            name="test@example.com", password="123", email="test@example.com"
+        )
+
+        setup_identity_cache(projects=[project], users=[user])
+
+        admin_headers = {
+            "project_name": "test_project",
+            "project_id": project.id,
+            "roles": "project_admin,member,project_mod",
+            "username": "test@example.com",
+            "user_id": "user_id",
+            "authenticated": True,
+        }
+
+        calls = Counter()
+
+        def count_calls(helper_class, method):
+            original = getattr(helper_class, method)
+
+            def wrapper(helper):
+                calls[(helper_class.__name__, method)] += 1
+                return original(helper)
+
+            return mock.patch.object(helper_class, method, wrapper)
+
+        url = "/v1/openstack/quotas/"
+
+        data = {"size": "medium", "regions": ["RegionOne"]}
+
+        with contextlib.ExitStack() as stack:
+            for helper_class in QuotaManager._quota_updaters.values():
+                for method in ["get_quota", "get_usage"]:
+                    stack.enter_context(count_calls(helper_class, method))
+            response = self.client.post(url, data, headers=admin_headers, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.check_quota_cache("RegionOne", project.id, "medium")
+        self.assertEqual(
+            set(calls),
+            {
+                (helper_class.__name__, method)
+                for helper_class in [
+                    QuotaManager.ServiceQuotaCinderHelper,
+                    QuotaManager.ServiceQuotaNovaHelper,
+                    QuotaManager.ServiceQuotaNeutronHelper,
+                ]
+                for method in ["get_quota", "get_usage"]
+            },
+        )
+        self.assertEqual(set(calls.values()), {1})
+
+        response = self.client.get(
+            url, {"regions": "RegionOne"}, headers=admin_headers, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["regions"][0]["current_quota_size"], "medium")
+
     def test_update_quota_history(self):
         """
         Update the quota size of a project with a quota change recently
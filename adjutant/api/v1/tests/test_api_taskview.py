@@ -12,15 +12,26 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from datetime import timedelta
+import threading
 from unittest import mock
 
 from confspirator.tests import utils as conf_utils
 from django.core import mail
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from rest_framework import status
 
 from adjutant.api.models import Token, Notification
-from adjutant.tasks.models import Task
+from adjutant.actions.models import Action
+from adjutant.actions.v1.misc import SendAdditionalEmailAction
+from adjutant.actions.v1.projects import NewProjectWithUserAction
+from adjutant.actions.v1.users import ResetUserPasswordAction
+from adjutant.tasks.models import Task, TaskJob
 from adjutant.tasks.v1.projects import CreateProjectAndUser
+from adjutant.tasks.v1.users import UpdateUserEmail
 from adjutant.common.tests.fake_clients import FakeManager, setup_identity_cache
 from adjutant.common.tests import fake_clients
 from adjutant.common.tests.utils import AdjutantAPITestCase
@@ -322,6 +333,463 @@ class DelegateAPITests(AdjutantAPITestCase):
         response = self.client.post(url, data, format="json")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    @conf_utils.modify_conf(
+        CONF,
+        operations={
+            "adjutant.workflow.tasks.create_project_and_user.additional_actions": [
+                {"operation": "append", "value": "SendAdditionalEmailAction"},
+            ],
+        },
+    )
+    def test_new_project_reapprove_resumes(self):
+        """
+        Re-approving a task after an action failed picks up from that
+        action, rather than approving the earlier actions again.
+        """
+
+        setup_identity_cache()
+
+        url = "/v1/actions/CreateProjectAndUser"
+        data = {"project_name": "test_project", "email": "test@example.com"}
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        headers = {
+            "project_name": "test_project",
+            "project_id": "test_project_id",
+            "roles": "admin,member",
+            "username": "test@example.com",
+            "user_id": "test_user_id",
+            "authenticated": True,
+        }
+        new_task = Task.objects.all()[0]
+        url = "/v1/tasks/" + new_task.uuid
+
+        project_approve = mock.patch.object(
+            NewProjectWithUserAction,
+            "_approve",
+            autospec=True,
+            side_effect=NewProjectWithUserAction._approve,
+        )
+        email_approve = mock.patch.object(
+            SendAdditionalEmailAction,
+            "_approve",
+            autospec=True,
+            side_effect=[Exception("SMTP server unreachable"), None],
+        )
+        with project_approve as project_approve, email_approve as email_approve:
+            response = self.client.post(
+                url, {"approved": True}, format="json", headers=headers
+            )
+            self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+            response = self.client.post(
+                url, {"approved": True}, format="json", headers=headers
+            )
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        self.assertEqual(project_approve.call_count, 1)
+        self.assertEqual(email_approve.call_count, 2)
+        # the stage finished, so another approve would run every action
+        self.assertFalse(
+            Action.objects.filter(task=new_task).exclude(completed_stages={}).exists()
+        )
+
+        new_token = Token.objects.all()[0]
+        url = "/v1/tokens/" + new_token.token
+        data = {"password": "testpassword"}
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_new_project_updated_reapprove(self):
+        """
+        Updating a task forgets which actions completed a stage, so
+        approving it runs every action with the new data.
+        """
+
+        setup_identity_cache()
+
+        url = "/v1/actions/CreateProjectAndUser"
+        data = {"project_name": "test_project", "email": "test@example.com"}
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        headers = {
+            "project_name": "test_project",
+            "project_id": "test_project_id",
+            "roles": "admin,member",
+            "username": "test@example.com",
+            "user_id": "test_user_id",
+            "authenticated": True,
+        }
+        new_task = Task.objects.all()[0]
+        url = "/v1/tasks/" + new_task.uuid
+
+        # left from an approve of the old data that failed partway through
+        Action.objects.filter(
+            task=new_task, action_name="NewProjectWithUserAction"
+        ).update(completed_stages={"approve": {"project_id": "stale_project_id"}})
+
+        data = {"project_name": "test_project2", "email": "test@example.com"}
+        response = self.client.put(url, data, format="json", headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(
+            Action.objects.filter(task=new_task).exclude(completed_stages={}).exists()
+        )
+
+        with mock.patch.object(
+            NewProjectWithUserAction,
+            "_approve",
+            autospec=True,
+            side_effect=NewProjectWithUserAction._approve,
+        ) as project_approve:
+            response = self.client.post(
+                url, {"approved": True}, format="json", headers=headers
+            )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(project_approve.call_count, 1)
+
+        new_project = fake_clients.identity_cache["new_projects"][0]
+        self.assertEqual(new_project.name, "test_project2")
+
+    @conf_utils.modify_conf(
+        CONF,
+        operations={
+            "adjutant.workflow.task_queue.enabled": [
+                {"operation": "override", "value": True},
+            ],
+        },
+    )
+    def test_new_project_task_queue(self):
+        """
+        With the task queue enabled, approval is queued, and only run by
+        the process_tasks command. Token submissions that need a password
+        are still run during the request.
+        """
+
+        setup_identity_cache()
+
+        url = "/v1/actions/CreateProjectAndUser"
+        data = {"project_name": "test_project", "email": "test@example.com"}
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        headers = {
+            "project_name": "test_project",
+            "project_id": "test_project_id",
+            "roles": "admin,member",
+            "username": "test@example.com",
+            "user_id": "test_user_id",
+            "authenticated": True,
+        }
+        new_task = Task.objects.all()[0]
+        url = "/v1/tasks/" + new_task.uuid
+        response = self.client.post(
+            url, {"approved": True}, format="json", headers=headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.json()["notes"], ["Task approval queued."])
+        job_id = response.json()["job"]
+        self.assertTrue(response.json()["status_url"].endswith("/v1/jobs/" + job_id))
+
+        # nothing has run yet, and it can't be queued twice
+        self.assertEqual(fake_clients.identity_cache["new_projects"], [])
+        response = self.client.post(
+            url, {"approved": True}, format="json", headers=headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # only admins and the task's project mods can see the job
+        response = self.client.get("/v1/jobs/" + job_id)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        other_headers = dict(
+            headers, project_id="other_project_id", roles="project_mod,member"
+        )
+        response = self.client.get("/v1/jobs/" + job_id, headers=other_headers)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.client.get("/v1/jobs/" + job_id, headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["state"], "queued")
+        self.assertEqual(response.json()["stage"], "approve")
+
+        call_command("process_tasks", once=True, workers=1)
+
+        response = self.client.get("/v1/jobs/" + job_id, headers=headers)
+        self.assertEqual(response.json()["state"], "completed")
+        new_project = fake_clients.identity_cache["new_projects"][0]
+        self.assertEqual(new_project.name, "test_project")
+
+        new_token = Token.objects.all()[0]
+        url = "/v1/tokens/" + new_token.token
+        response = self.client.post(url, {}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(url, {"password": "testpassword"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["notes"], ["Token submitted successfully."])
+        self.assertEqual(TaskJob.objects.filter(stage="submit").count(), 0)
+        self.assertTrue(Task.objects.get(uuid=new_task.uuid).completed)
+
+    @conf_utils.modify_conf(
+        CONF,
+        operations={
+            "adjutant.workflow.task_queue.enabled": [
+                {"operation": "override", "value": True},
+            ],
+        },
+    )
+    def test_task_queue_token_submit(self):
+        """
+        Token submissions that need authentication and no password are
+        queued, and the submitter can check on them with their token.
+        """
+        user = fake_clients.FakeUser(
+            name="test@example.com", password="123", email="test@example.com"
+        )
+        setup_identity_cache(users=[user])
+
+        headers = {
+            "project_name": "test_project",
+            "project_id": "test_project_id",
+            "roles": "member",
+            "username": "test@example.com",
+            "user_id": user.id,
+            "authenticated": True,
+        }
+        url = "/v1/actions/UpdateEmail"
+        data = {"new_email": "new_test@example.com"}
+        response = self.client.post(url, data, format="json", headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        new_token = Token.objects.all()[0]
+        url = "/v1/tokens/" + new_token.token
+        with mock.patch.object(UpdateUserEmail, "token_requires_authentication", True):
+            response = self.client.post(
+                url, {"confirm": True}, format="json", headers=headers
+            )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.json()["notes"], ["Token submission queued."])
+        self.assertTrue(
+            response.json()["status_url"].endswith(url + "/job"),
+        )
+        self.assertEqual(user.email, "test@example.com")
+
+        # the submitter can't see the job by id, but can by their token
+        job_id = response.json()["job"]
+        response = self.client.get("/v1/jobs/" + job_id, headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.get(url + "/job")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["uuid"], job_id)
+        self.assertEqual(response.json()["state"], "queued")
+
+        call_command("process_tasks", once=True, workers=1)
+
+        # the token is gone, but the job can still be looked up
+        self.assertFalse(Token.objects.exists())
+        response = self.client.get(url + "/job")
+        self.assertEqual(response.json()["state"], "completed")
+        self.assertEqual(TaskJob.objects.get(uuid=job_id).data, {})
+        self.assertEqual(user.email, "new_test@example.com")
+
+        response = self.client.get("/v1/tokens/notatoken/job")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @conf_utils.modify_conf(
+        CONF,
+        operations={
+            "adjutant.workflow.task_queue.enabled": [
+                {"operation": "override", "value": True},
+            ],
+        },
+    )
+    def test_task_queue_job_cancelled(self):
+        """
+        Cancelling a task, including as an old duplicate, cancels its
+        queued jobs. A queued stage that can no longer run for another
+        reason is marked as failed.
+        """
+
+        setup_identity_cache()
+
+        url = "/v1/actions/CreateProjectAndUser"
+        data = {"project_name": "test_project", "email": "test@example.com"}
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        headers = {
+            "project_name": "test_project",
+            "project_id": "test_project_id",
+            "roles": "admin,member",
+            "username": "test@example.com",
+            "user_id": "test_user_id",
+            "authenticated": True,
+        }
+        new_task = Task.objects.all()[0]
+        url = "/v1/tasks/" + new_task.uuid
+        response = self.client.post(
+            url, {"approved": True}, format="json", headers=headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        duplicate_job_id = response.json()["job"]
+
+        # the same sign up again cancels the old task
+        with mock.patch.object(CreateProjectAndUser, "duplicate_policy", "cancel"):
+            response = self.client.post(
+                "/v1/actions/CreateProjectAndUser", data, format="json"
+            )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        duplicate_job = TaskJob.objects.get(uuid=duplicate_job_id)
+        self.assertEqual(duplicate_job.state, "cancelled")
+        self.assertEqual(duplicate_job.data, {})
+
+        new_task = Task.objects.get(cancelled=False)
+        url = "/v1/tasks/" + new_task.uuid
+        response = self.client.post(
+            url, {"approved": True}, format="json", headers=headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job_id = response.json()["job"]
+
+        response = self.client.delete(url, format="json", headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get("/v1/jobs/" + job_id, headers=headers)
+        self.assertEqual(response.json()["state"], "cancelled")
+
+        # cancelled behind the queue's back, so the job is still queued
+        response = self.client.post(
+            "/v1/actions/CreateProjectAndUser", data, format="json"
+        )
+        new_task = Task.objects.get(cancelled=False)
+        url = "/v1/tasks/" + new_task.uuid
+        response = self.client.post(
+            url, {"approved": True}, format="json", headers=headers
+        )
+        job_id = response.json()["job"]
+        Task.objects.filter(uuid=new_task.uuid).update(cancelled=True)
+
+        call_command("process_tasks", once=True, workers=1)
+
+        response = self.client.get("/v1/jobs/" + job_id, headers=headers)
+        self.assertEqual(response.json()["state"], "failed")
+        self.assertEqual(response.json()["errors"], ["Processing this task failed."])
+        self.assertIn("cancelled", TaskJob.objects.get(uuid=job_id).error)
+        self.assertEqual(fake_clients.identity_cache["new_projects"], [])
+
+    @conf_utils.modify_conf(
+        CONF,
+        operations={
+            "adjutant.workflow.task_queue.enabled": [
+                {"operation": "override", "value": True},
+            ],
+        },
+    )
+    def test_task_queue_stale_job(self):
+        """
+        A running job whose worker stopped responding is failed, so the
+        task can be approved again.
+        """
+
+        setup_identity_cache()
+
+        url = "/v1/actions/CreateProjectAndUser"
+        data = {"project_name": "test_project", "email": "test@example.com"}
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        headers = {
+            "project_name": "test_project",
+            "project_id": "test_project_id",
+            "roles": "admin,member",
+            "username": "test@example.com",
+            "user_id": "test_user_id",
+            "authenticated": True,
+        }
+        new_task = Task.objects.all()[0]
+        url = "/v1/tasks/" + new_task.uuid
+        response = self.client.post(
+            url, {"approved": True}, format="json", headers=headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job_id = response.json()["job"]
+
+        # a worker claims the job, then stops
+        job = TaskJob.claim_next()
+        self.assertEqual(job.uuid, job_id)
+        self.assertEqual(job.state, "running")
+
+        # still within the timeout, so it is left alone
+        self.assertIsNone(TaskJob.claim_next())
+        self.assertEqual(TaskJob.objects.get(uuid=job_id).state, "running")
+
+        TaskJob.objects.filter(uuid=job_id).update(
+            heartbeat_on=timezone.now() - timedelta(seconds=301)
+        )
+        self.assertIsNone(TaskJob.claim_next())
+        job.refresh_from_db()
+        self.assertEqual(job.state, "failed")
+        self.assertEqual(job.data, {})
+        self.assertIn("stopped responding", job.error)
+
+        response = self.client.post(
+            url, {"approved": True}, format="json", headers=headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        call_command("process_tasks", once=True, workers=1)
+        self.assertEqual(
+            TaskJob.objects.get(uuid=response.json()["job"]).state, "completed"
+        )
+
+    def test_new_project_note_writes(self):
+        """
+        Notes added while approving are saved together at the end of the
+        stage, without rewriting the rest of the task.
+        """
+
+        setup_identity_cache()
+
+        url = "/v1/actions/CreateProjectAndUser"
+        data = {"project_name": "test_project", "email": "test@example.com"}
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        headers = {
+            "project_name": "test_project",
+            "project_id": "test_project_id",
+            "roles": "admin,member",
+            "username": "test@example.com",
+            "user_id": "test_user_id",
+            "authenticated": True,
+        }
+        new_task = Task.objects.all()[0]
+        notes_before = sum(len(notes) for notes in new_task.action_notes.values())
+
+        url = "/v1/tasks/" + new_task.uuid
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                url, {"approved": True}, format="json", headers=headers
+            )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        new_task = Task.objects.get(uuid=new_task.uuid)
+        notes_after = sum(len(notes) for notes in new_task.action_notes.values())
+        self.assertGreater(notes_after - notes_before, 1)
+
+        task_updates = [
+            query["sql"]
+            for query in queries
+            if query["sql"].startswith('UPDATE "tasks_task"')
+        ]
+        self.assertLess(len(task_updates), notes_after - notes_before)
+        note_updates = [
+            sql
+            for sql in task_updates
+            if sql.startswith('UPDATE "tasks_task" SET "action_notes"')
+        ]
+        self.assertEqual(len(note_updates), 1)
+        self.assertNotIn("keystone_user", note_updates[0])
+
     @conf_utils.modify_conf(
         CONF,
         operations={
@@ -516,6 +984,126 @@ class DelegateAPITests(AdjutantAPITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(user.password, "new_test_password")
 
+    @conf_utils.modify_conf(
+        CONF,
+        operations={
+            "adjutant.workflow.action_workers": [
+                {"operation": "override", "value": 2},
+            ],
+            "adjutant.workflow.tasks.reset_user_password.additional_actions": [
+                {"operation": "append", "value": "ResetUserPasswordAction"},
+            ],
+        },
+    )
+    def test_reset_user_parallel_actions(self):
+        """
+        Actions that are safe to run alongside each other are prepared
+        at the same time, and saved once they have all finished.
+        """
+
+        user = fake_clients.FakeUser(
+            name="test@example.com", password="123", email="test@example.com"
+        )
+
+        setup_identity_cache(users=[user])
+
+        # neither action can finish preparing until both have started
+        barrier = threading.Barrier(2, timeout=5)
+        prepare = ResetUserPasswordAction._prepare
+
+        def parallel_prepare(action):
+            barrier.wait()
+            return prepare(action)
+
+        url = "/v1/actions/ResetPassword"
+        data = {"email": "test@example.com"}
+        with mock.patch.object(
+            ResetUserPasswordAction,
+            "_prepare",
+            autospec=True,
+            side_effect=parallel_prepare,
+        ) as mocked_prepare:
+            response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(mocked_prepare.call_count, 2)
+
+        new_task = Task.objects.all()[0]
+        self.assertTrue(new_task.approved)
+        actions = Action.objects.filter(task=new_task)
+        self.assertEqual(len(actions), 2)
+        for action in actions:
+            self.assertTrue(action.valid)
+            self.assertTrue(action.auto_approve)
+            self.assertTrue(action.need_token)
+
+        new_token = Token.objects.all()[0]
+        url = "/v1/tokens/" + new_token.token
+        data = {"password": "new_test_password"}
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(user.password, "new_test_password")
+
+    @conf_utils.modify_conf(
+        CONF,
+        operations={
+            "adjutant.workflow.action_workers": [
+                {"operation": "override", "value": 2},
+            ],
+            "adjutant.workflow.tasks.reset_user_password.additional_actions": [
+                {"operation": "append", "value": "ResetUserPasswordAction"},
+            ],
+        },
+    )
+    def test_parallel_approve_saves_from_task(self):
+        """
+        Actions approved alongside each other, in a transaction, are only
+        saved by the task once they have all finished, even if they flush.
+        """
+
+        user = fake_clients.FakeUser(
+            name="test@example.com", password="123", email="test@example.com"
+        )
+
+        setup_identity_cache(users=[user])
+
+        barrier = threading.Barrier(2, timeout=5)
+        approve = ResetUserPasswordAction._approve
+
+        def parallel_approve(action):
+            barrier.wait()
+            approve(action)
+            action.set_cache("approved", True, flush=True)
+
+        save = Action.save
+        save_threads = []
+
+        def recording_save(action, *args, **kwargs):
+            save_threads.append(threading.current_thread())
+            return save(action, *args, **kwargs)
+
+        url = "/v1/actions/ResetPassword"
+        data = {"email": "test@example.com"}
+        with (
+            mock.patch.object(
+                ResetUserPasswordAction,
+                "_approve",
+                autospec=True,
+                side_effect=parallel_approve,
+            ) as mocked_approve,
+            mock.patch.object(Action, "save", recording_save),
+            transaction.atomic(),
+        ):
+            response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(mocked_approve.call_count, 2)
+
+        self.assertTrue(save_threads)
+        self.assertEqual(set(save_threads), {threading.main_thread()})
+        for action in Action.objects.filter(task=Task.objects.get()):
+            self.assertTrue(action.valid)
+            self.assertTrue(action.need_token)
+            self.assertTrue(action.cache["approved"])
+
     def test_reset_user_duplicate(self):
         """
         Request password reset twice in a row
@@ -664,6 +1252,52 @@ class DelegateAPITests(AdjutantAPITestCase):
         response = self.client.post(url, data, format="json", headers=headers)
         self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
 
+    def test_duplicate_tasks_concurrent(self):
+        """
+        An open duplicate created between the duplicate check and the
+        new task being saved is still caught, by the database.
+        """
+        setup_identity_cache()
+
+        url = "/v1/actions/CreateProjectAndUser"
+        data = {"project_name": "test_project", "email": "test@example.com"}
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        with mock.patch.object(CreateProjectAndUser, "_handle_duplicates"):
+            response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Task.objects.count(), 1)
+
+    def test_duplicate_tasks_cancelled(self):
+        """
+        Duplicates of a task with the cancel policy are cancelled together,
+        and their tokens removed.
+        """
+        user = fake_clients.FakeUser(
+            name="test@example.com", password="123", email="test@example.com"
+        )
+
+        setup_identity_cache(users=[user])
+
+        url = "/v1/actions/ResetPassword"
+        data = {"email": "test@example.com"}
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        old_task = Task.objects.get()
+
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        old_task.refresh_from_db()
+        self.assertTrue(old_task.cancelled)
+        self.assertIn(
+            "Task cancelled because was an old duplicate.", old_task.task_notes[-1]
+        )
+        self.assertFalse(Token.objects.filter(task=old_task).exists())
+        new_task = Task.objects.get(cancelled=False)
+        self.assertEqual(Token.objects.get().task, new_task)
+
     def test_update_email_task(self):
         """
         Ensure the update email workflow goes as expected.
@@ -20,8 +20,19 @@ from adjutant.config import CONF
 
 urlpatterns = [
     re_path(r"^status/?$", views.StatusView.as_view()),
+    re_path(r"^tasks/batch/?$", views.TaskBatch.as_view()),
     re_path(r"^tasks/(?P<uuid>\w+)/?$", views.TaskDetail.as_view()),
     re_path(r"^tasks/?$", views.TaskList.as_view()),
+    re_path(
+        r"^jobs/(?P<uuid>\w+)/?$",
+        views.TaskJobDetail.as_view(),
+        name="task-job-detail",
+    ),
+    re_path(
+        r"^tokens/(?P<id>\w+)/job/?$",
+        views.TokenJobDetail.as_view(),
+        name="token-job-detail",
+    ),
     re_path(r"^tokens/(?P<id>\w+)", views.TokenDetail.as_view()),
     re_path(r"^tokens/?$", views.TokenList.as_view()),
     re_path(r"^notifications/(?P<uuid>\w+)/?$", views.NotificationDetail.as_view()),
@@ -12,13 +12,21 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import base64
+import binascii
 import json
 
 from decorator import decorator
 
 from django.core.exceptions import FieldError
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
 
 from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from adjutant.config import CONF
 
 
 # "{'filters': {'fieldname': { 'operation': 'value'}}
@@ -60,3 +68,101 @@ def parse_filters(func, *args, **kwargs):
         return func(*args, **kwargs)
     except FieldError as e:
         return Response({"errors": [str(e)]}, status=400)
+
+
+def parse_fields(request, allowed_fields):
+    """
+    Parses the comma separated 'fields' query parameter, returning None
+    if it wasn't given. Raises ValueError for unknown fields.
+    """
+    fields = request.query_params.get("fields", None)
+    if not fields:
+        return None
+
+    fields = [field.strip() for field in fields.split(",") if field.strip()]
+    invalid = [field for field in fields if field not in allowed_fields]
+    if invalid:
+        raise ValueError("Invalid fields: %s" % ", ".join(invalid))
+    # keep the order of allowed_fields, without duplicates
+    return [field for field in allowed_fields if field in fields]
+
+
+DEFAULT_MARKER_LIMIT = 100
+
+
+def _encode_marker(obj):
+    marker = json.dumps([obj.created_on.isoformat(), obj.pk])
+    return base64.urlsafe_b64encode(marker.encode()).decode()
+
+
+def _decode_marker(marker):
+    try:
+        created_on, pk = json.loads(base64.urlsafe_b64decode(marker.encode()))
+        created_on = parse_datetime(created_on)
+    except (binascii.Error, TypeError, ValueError):
+        created_on = None
+    if created_on is None:
+        raise ValueError("Marker is invalid.")
+    return created_on, pk
+
+
+def paginate_by_marker(queryset, limit=None, marker=None):
+    """
+    Gets a page of a queryset, newest first, using an opaque marker
+    on (created_on, pk) rather than an offset, so that each page costs
+    the same however deep it is.
+
+    Returns a tuple of (page, next_marker), where next_marker is None
+    when there is nothing after this page. Raises ValueError if the
+    limit or marker is invalid.
+    """
+    try:
+        limit = int(limit or DEFAULT_MARKER_LIMIT)
+    except ValueError:
+        raise ValueError("Limit must be an integer.")
+    if limit < 1:
+        raise ValueError("Limit must be greater than 0.")
+    if limit > CONF.api.max_page_limit:
+        raise ValueError("Limit must be at most %s." % CONF.api.max_page_limit)
+
+    queryset = queryset.order_by("-created_on", "-pk")
+    if marker:
+        created_on, pk = _decode_marker(marker)
+        queryset = queryset.filter(
+            Q(created_on__lt=created_on) | Q(created_on=created_on, pk__lt=pk)
+        )
+
+    page = list(queryset[: limit + 1])
+    if len(page) > limit:
+        page = page[:limit]
+        return page, _encode_marker(page[-1])
+    return page, None
+
+
+def _dump_json(data):
+    # NOTE: Matches the output of the default JSONRenderer.
+    return json.dumps(
+        data, cls=JSONEncoder, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def stream_json_list(key, queryset, to_dict):
+    """
+    Streams a queryset as a JSON object of {key: [to_dict(obj), ...]},
+    fetching the rows in chunks so that memory use doesn't grow with
+    the number of results.
+    """
+
+    chunk_size = CONF.api.stream_chunk_size
+
+    def generate():
+        yield b"{" + _dump_json(key) + b":["
+        first = True
+        for obj in queryset.iterator(chunk_size=chunk_size):
+            if not first:
+                yield b","
+            first = False
+            yield _dump_json(to_dict(obj))
+        yield b"]}"
+
+    return StreamingHttpResponse(generate(), content_type="application/json")
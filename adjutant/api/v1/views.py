@@ -14,6 +14,8 @@
 
 from logging import getLogger
 
+from django.db import transaction
+from django.urls import reverse
 from django.utils import timezone
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 
@@ -22,12 +24,40 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from adjutant.api import utils
+from adjutant.api.exception_handler import exception_handler
 from adjutant.api.views import SingleVersionView
 from adjutant.api.models import Notification, Token
-from adjutant.api.v1.utils import parse_filters
+from adjutant.api.v1.utils import (
+    paginate_by_marker,
+    parse_fields,
+    parse_filters,
+    stream_json_list,
+)
 from adjutant import exceptions
+from adjutant import tasks
+from adjutant.config import CONF
 from adjutant.tasks.v1.manager import TaskManager
-from adjutant.tasks.models import Task
+from adjutant.tasks.models import Task, TaskJob
+
+
+def queued_job_response(request, job, note, status_path=None):
+    if status_path is None:
+        status_path = reverse("task-job-detail", kwargs={"uuid": job.uuid})
+    return Response(
+        {
+            "notes": [note],
+            "job": job.uuid,
+            "status_url": request.build_absolute_uri(status_path),
+        },
+        status=202,
+    )
+
+
+def job_response(job):
+    job_dict = job.to_dict()
+    if job.state == "failed":
+        job_dict["errors"] = ["Processing this task failed."]
+    return Response(job_dict)
 
 
 class V1VersionEndpoint(SingleVersionView):
@@ -93,10 +123,34 @@ class NotificationList(APIViewWithLogger):
             )
         else:
             notifications = Notification.objects.all().order_by("-created_on")
+        notifications = notifications.select_related("task")
+
+        limit = request.GET.get("limit", None)
+        marker = request.GET.get("marker", None)
+        if limit or marker:
+            try:
+                notifications, next_marker = paginate_by_marker(
+                    notifications, limit, marker
+                )
+            except ValueError as e:
+                return Response({"errors": [str(e)]}, status=400)
+            return Response(
+                {
+                    "notifications": [note.to_dict() for note in notifications],
+                    "has_more": next_marker is not None,
+                    "next_marker": next_marker,
+                },
+                status=200,
+            )
 
         page = request.GET.get("page", 1)
         notifs_per_page = request.GET.get("notifications_per_page", None)
 
+        if not notifs_per_page and CONF.api.stream_list_responses:
+            return stream_json_list(
+                "notifications", notifications, Notification.to_dict
+            )
+
         if notifs_per_page:
             paginator = Paginator(notifications, notifs_per_page)
             try:
@@ -200,7 +254,31 @@ class TaskList(APIViewWithLogger):
 
             filters["project_id__exact"] = request.keystone_user["project_id"]
 
-        tasks = Task.objects.filter(**filters).order_by("-created_on")
+        try:
+            fields = parse_fields(request, Task.dict_fields)
+        except ValueError as e:
+            return Response({"errors": [str(e)]}, status=400)
+
+        tasks = Task.objects.filter(**filters).order_by("-created_on").for_dict(fields)
+
+        limit = request.GET.get("limit", None)
+        marker = request.GET.get("marker", None)
+        if limit or marker:
+            try:
+                tasks, next_marker = paginate_by_marker(tasks, limit, marker)
+            except ValueError as e:
+                return Response({"errors": [str(e)]}, status=400)
+            return Response(
+                {
+                    "tasks": [task.to_dict(fields) for task in tasks],
+                    "has_more": next_marker is not None,
+                    "next_marker": next_marker,
+                },
+                status=200,
+            )
+
+        if not tasks_per_page and CONF.api.stream_list_responses:
+            return stream_json_list("tasks", tasks, lambda task: task.to_dict(fields))
 
         if tasks_per_page:
             paginator = Paginator(tasks, tasks_per_page)
@@ -212,7 +290,7 @@ class TaskList(APIViewWithLogger):
                 return Response({"errors": ["Page not an integer"]}, status=400)
         task_list = []
         for task in tasks:
-            task_list.append(task.to_dict())
+            task_list.append(task.to_dict(fields))
 
         if tasks_per_page:
             return Response(
@@ -237,15 +315,21 @@ class TaskDetail(APIViewWithLogger):
         Dict representation of a Task object
         and its related actions.
         """
+        try:
+            fields = parse_fields(request, Task.dict_fields)
+        except ValueError as e:
+            return Response({"errors": [str(e)]}, status=400)
+
+        tasks = Task.objects.for_dict(fields)
         try:
             # TODO(adriant): better handle this bit of incode policy
             if "admin" in request.keystone_user["roles"]:
-                task = Task.objects.get(uuid=uuid)
+                task = tasks.get(uuid=uuid)
             else:
-                task = Task.objects.get(
+                task = tasks.get(
                     uuid=uuid, project_id=request.keystone_user["project_id"]
                 )
-            return Response(task.to_dict())
+            return Response(task.to_dict(fields))
         except Task.DoesNotExist:
             return Response({"errors": ["No task with this id."]}, status=404)
 
@@ -276,6 +360,10 @@ class TaskDetail(APIViewWithLogger):
                 {"approved": ["this is a required boolean field."]}
             )
 
+        if CONF.workflow.task_queue.enabled:
+            job = self.task_manager.queue_approve(uuid, request.keystone_user)
+            return queued_job_response(request, job, "Task approval queued.")
+
         task = self.task_manager.approve(uuid, request.keystone_user)
 
         if task.completed:
@@ -307,6 +395,166 @@ class TaskDetail(APIViewWithLogger):
         return Response({"notes": ["Task cancelled successfully."]}, status=200)
 
 
+class TaskBatch(APIViewWithLogger):
+    operations = ["create", "approve", "cancel"]
+
+    @utils.admin
+    def post(self, request, format=None):
+        """
+        Create, approve and cancel many tasks in one request.
+
+        Takes lists of tasks to create, as dicts of 'task_type' and the
+        action 'data', and lists of task uuids to approve or cancel.
+        Each task is handled as it would be on its own, and one failing
+        doesn't stop the rest, so the result of each is returned in
+        the same order as given.
+        """
+        batch = {}
+        for operation in self.operations:
+            items = request.data.get(operation, [])
+            if not isinstance(items, list):
+                return Response(
+                    {operation: ["this field needs to be a list."]}, status=400
+                )
+            item_type, type_name = (
+                (dict, "dicts") if operation == "create" else (str, "task ids")
+            )
+            if not all(isinstance(item, item_type) for item in items):
+                return Response(
+                    {operation: ["this field needs to be a list of %s." % type_name]},
+                    status=400,
+                )
+            if operation in request.data:
+                batch[operation] = items
+
+        if not batch:
+            return Response(
+                {"errors": ["One of %s is required." % ", ".join(self.operations)]},
+                status=400,
+            )
+        max_tasks = CONF.api.batch_max_tasks
+        if sum(len(items) for items in batch.values()) > max_tasks:
+            return Response(
+                {"errors": ["No more than %s tasks can be given at once." % max_tasks]},
+                status=400,
+            )
+        max_approvals = CONF.api.batch_max_inline_approvals
+        if (
+            not CONF.workflow.task_queue.enabled
+            and len(batch.get("approve", [])) > max_approvals
+        ):
+            return Response(
+                {
+                    "errors": [
+                        "No more than %s tasks can be approved at once without "
+                        "the task queue." % max_approvals
+                    ]
+                },
+                status=400,
+            )
+
+        results = {}
+        if "create" in batch:
+            results["create"] = [
+                self._result(None, lambda: self._create(request, item))
+                for item in batch["create"]
+            ]
+        if "approve" in batch:
+            # each approval is saved as it goes, rather than in a chunk, as
+            # it makes changes outside of Adjutant that must not be undone
+            results["approve"] = []
+            for chunk in self._chunks(batch["approve"]):
+                task_models = self.task_manager.get_many(chunk)
+                for uuid in chunk:
+                    results["approve"].append(
+                        self._result(
+                            uuid,
+                            lambda: self._approve(request, task_models.get(uuid)),
+                        )
+                    )
+        if "cancel" in batch:
+            results["cancel"] = []
+            for chunk in self._chunks(batch["cancel"]):
+                # cancelling only changes the database, so the chunk can
+                # be saved together
+                with transaction.atomic():
+                    task_models = self.task_manager.get_many(chunk)
+                    for uuid in chunk:
+                        results["cancel"].append(
+                            self._result(
+                                uuid, lambda: self._cancel(task_models.get(uuid))
+                            )
+                        )
+
+        return Response(results, status=200)
+
+    def _chunks(self, uuids):
+        chunk_size = CONF.api.batch_chunk_size
+        for i in range(0, len(uuids), chunk_size):
+            yield uuids[i : i + chunk_size]
+
+    def _result(self, uuid, handle):
+        """
+        Run one task of the batch, returning the response it would have
+        had on its own as a dict.
+        """
+        try:
+            uuid, response = handle()
+        except Exception as e:
+            if uuid is None and getattr(e, "task", None) is not None:
+                uuid = e.task.uuid
+            response = exception_handler(e, {})
+            if response is None:
+                response = exception_handler(exceptions.ServiceUnavailable(), {})
+        return {"task": uuid, "status": response.status_code, **response.data}
+
+    def _create(self, request, item):
+        task_type = item.get("task_type")
+        if task_type not in tasks.TASK_CLASSES:
+            raise exceptions.TaskSerializersInvalid(
+                {"task_type": ["this is a required field, and must be a task type."]}
+            )
+        if task_type not in CONF.api.batch_create_task_types:
+            raise exceptions.TaskSerializersInvalid(
+                {"task_type": ["this task type can't be created in a batch."]}
+            )
+        action_data = item.get("data", {})
+        if not isinstance(action_data, dict):
+            raise exceptions.TaskSerializersInvalid(
+                {"data": ["this field needs to be a dict."]}
+            )
+        task_data = {
+            "keystone_user": request.keystone_user,
+            "project_id": request.keystone_user.get("project_id"),
+        }
+        task = self.task_manager.create_from_data(task_type, task_data, action_data)
+        return task.task.uuid, Response({"notes": ["task created"]}, status=202)
+
+    def _approve(self, request, task):
+        if task is None:
+            raise exceptions.TaskNotFound("No task with this id.")
+
+        if CONF.workflow.task_queue.enabled:
+            job = self.task_manager.queue_approve(task, request.keystone_user)
+            return task.uuid, queued_job_response(request, job, "Task approval queued.")
+
+        task = self.task_manager.approve(task, request.keystone_user)
+        if task.completed:
+            response = Response({"notes": ["Task completed successfully."]}, status=200)
+        else:
+            response = Response({"notes": ["created token"]}, status=202)
+        return task.task.uuid, response
+
+    def _cancel(self, task):
+        if task is None:
+            raise exceptions.TaskNotFound("No task with this id.")
+
+        # a savepoint, so a task that fails to cancel is left as it was
+        with transaction.atomic():
+            self.task_manager.cancel(task)
+        return task.uuid, Response({"notes": ["Task cancelled successfully."]})
+
+
 class TokenList(APIViewWithLogger):
     """
     Admin functionality for managing/monitoring tokens.
@@ -322,6 +570,26 @@ class TokenList(APIViewWithLogger):
             tokens = Token.objects.filter(**filters).order_by("-created_on")
         else:
             tokens = Token.objects.all().order_by("-created_on")
+        tokens = tokens.select_related("task")
+
+        limit = request.GET.get("limit", None)
+        marker = request.GET.get("marker", None)
+        if limit or marker:
+            try:
+                tokens, next_marker = paginate_by_marker(tokens, limit, marker)
+            except ValueError as e:
+                return Response({"errors": [str(e)]}, status=400)
+            return Response(
+                {
+                    "tokens": [token.to_dict() for token in tokens],
+                    "has_more": next_marker is not None,
+                    "next_marker": next_marker,
+                }
+            )
+
+        if CONF.api.stream_list_responses:
+            return stream_json_list("tokens", tokens, Token.to_dict)
+
         token_list = []
         for token in tokens:
             token_list.append(token.to_dict())
@@ -437,6 +705,61 @@ class TokenDetail(APIViewWithLogger):
                 {"errors": ["This token requires authentication to submit."]}, 401
             )
 
+        if CONF.workflow.task_queue.enabled and self.task_manager.can_queue_submit(
+            task
+        ):
+            job = self.task_manager.queue_submit(
+                task, request.data, request.keystone_user, token=id
+            )
+            return queued_job_response(
+                request,
+                job,
+                "Token submission queued.",
+                reverse("token-job-detail", kwargs={"id": id}),
+            )
+
         self.task_manager.submit(task, request.data, request.keystone_user)
 
         return Response({"notes": ["Token submitted successfully."]}, status=200)
+
+
+class TaskJobDetail(APIViewWithLogger):
+    @utils.mod_or_admin
+    def get(self, request, uuid, format=None):
+        """
+        The state of a task stage queued to run in the background.
+
+        Project Admins and Project Mods can only see the jobs of tasks
+        associated with their project.
+        """
+        try:
+            # TODO(adriant): better handle this bit of incode policy
+            if "admin" in request.keystone_user["roles"]:
+                job = TaskJob.objects.get(uuid=uuid)
+            else:
+                job = TaskJob.objects.get(
+                    uuid=uuid, task__project_id=request.keystone_user["project_id"]
+                )
+        except TaskJob.DoesNotExist:
+            return Response({"errors": ["No job with this id."]}, status=404)
+
+        return job_response(job)
+
+
+class TokenJobDetail(APIViewWithLogger):
+    def get(self, request, id, format=None):
+        """
+        The state of the token submission most recently queued with
+        this token. Holding the token is enough to see it, as the token
+        is deleted once the task completes.
+        """
+        job = (
+            TaskJob.objects.filter(token_hash=TaskJob.hash_token(id))
+            .order_by("-created_on")
+            .first()
+        )
+        if job is None:
+            return Response(
+                {"errors": ["No job was queued with this token."]}, status=404
+            )
+        return job_response(job)
@@ -0,0 +1,43 @@
+# Copyright (C) 2026 Catalyst Cloud Ltd
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from adjutant.config import CONF
+from adjutant.notifications.utils import send_queued_emails
+
+
+class Command(BaseCommand):
+    help = "Send the emails stored in the email outbox."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once no more emails are due, rather than waiting for more.",
+        )
+
+    def handle(self, *args, **options):
+        poll_interval = CONF.notifications.email_outbox.poll_interval
+        try:
+            while True:
+                if send_queued_emails():
+                    continue
+                if options["once"]:
+                    return
+                time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            pass
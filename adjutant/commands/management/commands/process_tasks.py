@@ -0,0 +1,86 @@
+# Copyright (C) 2026 Catalyst Cloud Ltd
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from adjutant.config import CONF
+from adjutant.tasks.models import TaskJob
+from adjutant.tasks.v1.manager import TaskManager
+
+
+class Command(BaseCommand):
+    help = "Run the task approvals and token submissions queued by the API."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="How many jobs to run at once. Defaults to the "
+            "workflow.task_queue.workers config.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the queue is empty, rather than waiting for more.",
+        )
+
+    def handle(self, *args, **options):
+        workers = options["workers"] or CONF.workflow.task_queue.workers
+        poll_interval = CONF.workflow.task_queue.poll_interval
+        once = options["once"]
+        stop = threading.Event()
+
+        def work():
+            task_manager = TaskManager()
+            while not stop.is_set():
+                job = TaskJob.claim_next()
+                if job is None:
+                    if once:
+                        return
+                    stop.wait(poll_interval)
+                    continue
+                task_manager.run_job(job)
+
+        def work_in_thread():
+            try:
+                work()
+            finally:
+                # each thread has its own database connection
+                connection.close()
+
+        if workers == 1:
+            try:
+                work()
+            except KeyboardInterrupt:
+                pass
+            return
+
+        threads = [
+            threading.Thread(target=work_in_thread, daemon=True) for _ in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(1)
+        except KeyboardInterrupt:
+            # let the running jobs finish, but don't start any more
+            stop.set()
+            for thread in threads:
+                thread.join()
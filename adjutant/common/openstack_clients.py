@@ -12,7 +12,10 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from collections import OrderedDict
+import threading
 
+from keystoneauth1 import exceptions as ks_exceptions
 from keystoneauth1.identity import v3
 from keystoneauth1 import session
 from keystoneclient import client as ks_client
@@ -34,51 +37,167 @@ DEFAULT_OBJECT_STORAGE_VERSION = "1"
 DEFAULT_ORCHESTRATION_VERSION = "1"
 DEFAULT_VOLUME_VERSION = "3"
 
+# Maximum number of service clients kept for reuse
+CLIENT_CACHE_SIZE = 64
+
 # Auth session shared by default with all clients
 client_auth_session = None
+_auth_session_lock = threading.Lock()
+
+# Service clients keyed by (service, region, version), least recently
+# used first, along with the auth session they were built against.
+_client_cache = OrderedDict()
+_client_cache_session = None
+_client_cache_lock = threading.Lock()
 
 
 def get_auth_session():
     """Returns a global auth session to be shared by all clients"""
     global client_auth_session
-    if not client_auth_session:
-        auth = v3.Password(
-            username=CONF.identity.auth.username,
-            password=CONF.identity.auth.password,
-            project_name=CONF.identity.auth.project_name,
-            auth_url=CONF.identity.auth.auth_url,
-            user_domain_id=CONF.identity.auth.user_domain_id,
-            project_domain_id=CONF.identity.auth.project_domain_id,
-        )
-        client_auth_session = session.Session(auth=auth)
+    with _auth_session_lock:
+        if not client_auth_session:
+            auth = v3.Password(
+                username=CONF.identity.auth.username,
+                password=CONF.identity.auth.password,
+                project_name=CONF.identity.auth.project_name,
+                auth_url=CONF.identity.auth.auth_url,
+                user_domain_id=CONF.identity.auth.user_domain_id,
+                project_domain_id=CONF.identity.auth.project_domain_id,
+            )
+            client_auth_session = session.Session(auth=auth)
 
     return client_auth_session
 
 
+def reset_auth_session():
+    """Drop the shared auth session, and with it all cached clients."""
+    global client_auth_session
+    with _auth_session_lock:
+        client_auth_session = None
+    clear_client_cache()
+
+
+def clear_client_cache():
+    global _client_cache_session
+    with _client_cache_lock:
+        _client_cache.clear()
+        _client_cache_session = None
+
+
+def _get_cached_client(service, region, version, build_client):
+    """Get a client from the cache, building and caching it if missing.
+
+    The cache is thrown away whenever the shared auth session changes,
+    since every cached client holds a reference to the old one.
+    """
+    global _client_cache_session
+    key = (service, region, version)
+    auth_session = get_auth_session()
+
+    with _client_cache_lock:
+        if _client_cache_session is not auth_session:
+            _client_cache.clear()
+            _client_cache_session = auth_session
+        try:
+            _client_cache.move_to_end(key)
+            return _client_cache[key]
+        except KeyError:
+            pass
+
+    client = build_client(auth_session)
+
+    with _client_cache_lock:
+        if _client_cache_session is auth_session:
+            client = _client_cache.setdefault(key, client)
+            _client_cache.move_to_end(key)
+            while len(_client_cache) > CLIENT_CACHE_SIZE:
+                _client_cache.popitem(last=False)
+    return client
+
+
 def get_keystoneclient(version=DEFAULT_IDENTITY_VERSION):
-    return ks_client.Client(version, session=get_auth_session())
+    return _get_cached_client(
+        "identity",
+        None,
+        version,
+        lambda auth_session: ks_client.Client(version, session=auth_session),
+    )
 
 
 def get_neutronclient(region):
     # always returns neutron client v2
-    return neutronclient.Client(session=get_auth_session(), region_name=region)
+    return _get_cached_client(
+        "network",
+        region,
+        "2",
+        lambda auth_session: neutronclient.Client(
+            session=auth_session, region_name=region
+        ),
+    )
 
 
 def get_novaclient(region, version=DEFAULT_COMPUTE_VERSION):
-    return novaclient.Client(version, session=get_auth_session(), region_name=region)
+    return _get_cached_client(
+        "compute",
+        region,
+        version,
+        lambda auth_session: novaclient.Client(
+            version, session=auth_session, region_name=region
+        ),
+    )
 
 
 def get_cinderclient(region, version=DEFAULT_VOLUME_VERSION):
-    return cinderclient.Client(version, session=get_auth_session(), region_name=region)
-
+    return _get_cached_client(
+        "volume",
+        region,
+        version,
+        lambda auth_session: cinderclient.Client(
+            version, session=auth_session, region_name=region
+        ),
+    )
+
+
+def _get_octavia_endpoint(auth_session, region):
+    # NOTE: The service catalog comes back with the auth token, so this
+    # doesn't need any extra calls to Keystone.
+    try:
+        endpoint = auth_session.get_endpoint(
+            service_type="load-balancer",
+            interface="public",
+            region_name=region,
+            skip_discovery=True,
+        )
+    except (ks_exceptions.EndpointNotFound, ks_exceptions.EmptyCatalog):
+        endpoint = None
+    if endpoint:
+        return endpoint
 
-def get_octaviaclient(region):
+    # Fall back to looking for the endpoint by service name, for clouds
+    # where Octavia isn't registered under the standard service type.
     ks = get_keystoneclient()
-
     service = ks.services.list(name="octavia")[0]
-    endpoint = ks.endpoints.list(service=service, region=region, interface="public")[0]
-    return octavia.OctaviaAPI(session=get_auth_session(), endpoint=endpoint.url)
+    return ks.endpoints.list(service=service, region=region, interface="public")[0].url
+
+
+def get_octaviaclient(region):
+    return _get_cached_client(
+        "load-balancer",
+        region,
+        "2",
+        lambda auth_session: octavia.OctaviaAPI(
+            session=auth_session,
+            endpoint=_get_octavia_endpoint(auth_session, region),
+        ),
+    )
 
 
 def get_troveclient(region):
-    return troveclient.Client(session=get_auth_session(), region_name=region)
+    return _get_cached_client(
+        "database",
+        region,
+        "1",
+        lambda auth_session: troveclient.Client(
+            session=auth_session, region_name=region
+        ),
+    )
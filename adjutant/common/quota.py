@@ -12,10 +12,219 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import bisect
+from collections import OrderedDict
+import copy
+import threading
+import time
+from concurrent import futures
+
+from cinderclient import exceptions as cinder_exceptions
+from neutronclient.common import exceptions as neutron_exceptions
+
 from adjutant.config import CONF
 from adjutant.common import openstack_clients
 
 
+class QuotaSnapshotCache(object):
+    """
+    A short lived, process wide cache of the quota and usage read from
+    each service, keyed on (project, region, service, method).
+
+    Validating and approving a quota update reads the same quotas and
+    usage several times in quick succession, so snapshots are kept for
+    'quota.snapshot_cache_ttl' seconds, and dropped as soon as Adjutant
+    changes the quota for that service.
+
+    Each process has its own cache, and only drops the snapshots for
+    changes it made itself, so other processes may use snapshots up to
+    the TTL old. The cache is disabled by default for this reason.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshots = {}
+
+    def get(self, key):
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+            if snapshot is None:
+                return None
+            expires_at, value = snapshot
+            if time.monotonic() >= expires_at:
+                del self._snapshots[key]
+                return None
+            return copy.deepcopy(value)
+
+    def set(self, key, value):
+        ttl = CONF.quota.snapshot_cache_ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._snapshots[key] = (time.monotonic() + ttl, copy.deepcopy(value))
+
+    def invalidate(self, project_id=None, region_id=None, service_name=None):
+        """Drop the snapshots matching all of the given arguments."""
+        with self._lock:
+            for key in list(self._snapshots):
+                project, region, service, _ = key
+                if (
+                    project_id in (None, project)
+                    and region_id in (None, region)
+                    and service_name in (None, service)
+                ):
+                    del self._snapshots[key]
+
+
+quota_snapshot_cache = QuotaSnapshotCache()
+
+
+def invalidate_quota_cache(project_id=None, region_id=None, service_name=None):
+    """Drop cached quota and usage snapshots, all of them by default."""
+    quota_snapshot_cache.invalidate(project_id, region_id, service_name)
+
+
+class QuotaSizeIndex(object):
+    """
+    'quota.sizes' and 'quota.sizes_ascending' compiled for matching.
+
+    Each (service, resource) pair is mapped to a column of the values
+    every size gives it, sorted by value. Matching a current quota value
+    against a column is then a bisect to find the sizes at or under it,
+    rather than comparing against each size in turn. The differences for
+    recently matched quotas are remembered, as the same quota tends to
+    be matched several times while showing and updating it.
+    """
+
+    memo_size = 128
+
+    def __init__(self, sizes, sizes_ascending):
+        self.sizes = sizes
+        self.sizes_ascending = sizes_ascending
+        self.size_names = list(sizes)
+        entries = {}
+        for position, setting in enumerate(sizes.values()):
+            for service_name, values in setting.items():
+                for name, value in values.items():
+                    entries.setdefault((service_name, name), []).append(
+                        (value, position)
+                    )
+        self.columns = {}
+        for key, column in entries.items():
+            column.sort()
+            values = tuple(value for value, _ in column)
+            # NOTE(amelia): Sub-zero quota means unlimited, so the values
+            # are split into unlimited, zero, and limited sizes.
+            self.columns[key] = (
+                values,
+                tuple(position for _, position in column),
+                bisect.bisect_left(values, 0),
+                bisect.bisect_right(values, 0),
+            )
+        self.positions = {}
+        for i, size in enumerate(sizes_ascending):
+            self.positions.setdefault(size, i)
+        self._lock = threading.Lock()
+        self._memo = OrderedDict()
+
+    def is_current(self):
+        return (
+            self.sizes is CONF.quota.sizes
+            and self.sizes_ascending is CONF.quota.sizes_ascending
+        )
+
+    def _compute_differences(self, current_quota):
+        totals = [0.0] * len(self.size_names)
+        counts = [0] * len(self.size_names)
+        for service_name, values in current_quota.items():
+            for name, current in values.items():
+                column = self.columns.get((service_name, name))
+                if column is None:
+                    continue
+                column_values, positions, zero_start, limited_start = column
+                for position in positions:
+                    counts[position] += 1
+
+                if current < 0:
+                    matched = positions[:zero_start]
+                elif current == 0:
+                    matched = positions[zero_start:limited_start]
+                else:
+                    matched = ()
+                for position in matched:
+                    totals[position] += 1.0
+
+                # Limited sizes match by the ratio of the smaller to the
+                # larger of the two values.
+                split = limited_start
+                if current > 0:
+                    split = bisect.bisect_right(column_values, current, limited_start)
+                    for i in range(limited_start, split):
+                        totals[positions[i]] += column_values[i] / current
+                for i in range(split, len(positions)):
+                    totals[positions[i]] += current / column_values[i]
+
+        differences = {}
+        for position, size in enumerate(self.size_names):
+            if counts[position]:
+                # Calculate the average of how much it matches the setting
+                differences[size] = abs(totals[position] / counts[position] - 1)
+            else:
+                # Nothing to compare against, so it can't be a match.
+                differences[size] = 1.0
+        return differences
+
+    def get_differences(self, current_quota):
+        try:
+            key = tuple(
+                sorted(
+                    (service_name, name, value)
+                    for service_name, values in current_quota.items()
+                    for name, value in values.items()
+                )
+            )
+            hash(key)
+        except TypeError:
+            return self._compute_differences(current_quota)
+
+        with self._lock:
+            differences = self._memo.get(key)
+            if differences is not None:
+                self._memo.move_to_end(key)
+                return dict(differences)
+
+        differences = self._compute_differences(current_quota)
+        with self._lock:
+            self._memo[key] = differences
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        return dict(differences)
+
+    def get_position(self, quota_size):
+        """Position of the size in 'quota.sizes_ascending', or None."""
+        return self.positions.get(quota_size)
+
+
+_size_index = None
+_size_index_lock = threading.Lock()
+
+
+def get_quota_size_index():
+    """Get the compiled size index, recompiling it if the sizes changed."""
+    global _size_index
+    with _size_index_lock:
+        if _size_index is None or not _size_index.is_current():
+            _size_index = QuotaSizeIndex(CONF.quota.sizes, CONF.quota.sizes_ascending)
+        return _size_index
+
+
+def invalidate_quota_size_index():
+    """Drop the compiled size index, forcing a recompile on next use."""
+    global _size_index
+    with _size_index_lock:
+        _size_index = None
+
+
 class QuotaManager(object):
     """
     A manager to allow easier updating and access to quota information
@@ -25,6 +234,11 @@ class QuotaManager(object):
     default_size_diff_threshold = 0.2
 
     class ServiceQuotaHelper(object):
+        # How the last get_usage call worked out the usage, either
+        # from the service's own quota usage endpoint ("quota_usage"),
+        # by listing resources ("listing"), or from nova's "limits".
+        usage_strategy = None
+
         def set_quota(self, values):
             self.client.quotas.update(self.project_id, **values)
 
@@ -37,6 +251,22 @@ class QuotaManager(object):
             return self.client.quotas.get(self.project_id).to_dict()
 
         def get_usage(self):
+            try:
+                quota_usage = self.client.quotas.get(
+                    self.project_id, usage=True
+                ).to_dict()
+            except cinder_exceptions.ClientException:
+                return self._get_usage_from_listing()
+
+            self.usage_strategy = "quota_usage"
+            # NOTE: Cinder already counts snapshots towards gigabytes.
+            return {
+                "gigabytes": quota_usage["gigabytes"]["in_use"],
+                "volumes": quota_usage["volumes"]["in_use"],
+                "snapshots": quota_usage["snapshots"]["in_use"],
+            }
+
+        def _get_usage_from_listing(self):
             volumes = self.client.volumes.list(
                 search_opts={"all_tenants": 1, "project_id": self.project_id}
             )
@@ -48,6 +278,7 @@ class QuotaManager(object):
             gigabytes = sum([getattr(volume, "size", 0) for volume in volumes])
             gigabytes += sum([getattr(snap, "size", 0) for snap in snapshots])
 
+            self.usage_strategy = "listing"
             return {
                 "gigabytes": gigabytes,
                 "volumes": len(volumes),
@@ -78,6 +309,7 @@ class QuotaManager(object):
             for key, usage_key in nova_usage_keys:
                 nova_usage_dict[key] = nova_usage[usage_key]
 
+            self.usage_strategy = "limits"
             return nova_usage_dict
 
     class ServiceQuotaNeutronHelper(ServiceQuotaHelper):
@@ -89,30 +321,43 @@ class QuotaManager(object):
             body = {"quota": values}
             self.client.update_quota(self.project_id, body)
 
-        def get_usage(self):
-            networks = self.client.list_networks(tenant_id=self.project_id)["networks"]
-            routers = self.client.list_routers(tenant_id=self.project_id)["routers"]
-            floatingips = self.client.list_floatingips(tenant_id=self.project_id)[
-                "floatingips"
-            ]
-            ports = self.client.list_ports(tenant_id=self.project_id)["ports"]
-            subnets = self.client.list_subnets(tenant_id=self.project_id)["subnets"]
-            security_groups = self.client.list_security_groups(
-                tenant_id=self.project_id
-            )["security_groups"]
-            security_group_rules = self.client.list_security_group_rules(
-                tenant_id=self.project_id
-            )["security_group_rules"]
+        # quota resource name: (list call, response key)
+        usage_resources = {
+            "network": ("list_networks", "networks"),
+            "router": ("list_routers", "routers"),
+            "floatingip": ("list_floatingips", "floatingips"),
+            "port": ("list_ports", "ports"),
+            "subnet": ("list_subnets", "subnets"),
+            "security_group": ("list_security_groups", "security_groups"),
+            "security_group_rule": (
+                "list_security_group_rules",
+                "security_group_rules",
+            ),
+        }
 
-            return {
-                "network": len(networks),
-                "router": len(routers),
-                "floatingip": len(floatingips),
-                "port": len(ports),
-                "subnet": len(subnets),
-                "security_group": len(security_groups),
-                "security_group_rule": len(security_group_rules),
-            }
+        def get_usage(self):
+            try:
+                details = self.client.show_quota_details(self.project_id)["quota"]
+            except neutron_exceptions.NeutronClientException:
+                # NOTE: The quota details extension isn't enabled.
+                return self._get_usage_from_listing()
+            if any(name not in details for name in self.usage_resources):
+                return self._get_usage_from_listing()
+
+            self.usage_strategy = "quota_usage"
+            return {name: details[name]["used"] for name in self.usage_resources}
+
+        def _get_usage_from_listing(self):
+            usage = {}
+            for name, (list_call, key) in self.usage_resources.items():
+                # Only the ids are needed to count the resources.
+                resources = getattr(self.client, list_call)(
+                    tenant_id=self.project_id, fields="id"
+                )[key]
+                usage[name] = len(resources)
+
+            self.usage_strategy = "listing"
+            return usage
 
         def get_quota(self):
             return self.client.show_quota(self.project_id)["quota"]
@@ -164,6 +409,7 @@ class QuotaManager(object):
                     "healthmonitors"
                 ]
             )
+            self.usage_strategy = "listing"
             return usage
 
     class ServiceQuotaTroveHelper(ServiceQuotaHelper):
@@ -189,6 +435,7 @@ class QuotaManager(object):
             for quota in project_quota:
                 usage[quota.resource] = quota.in_use
 
+            self.usage_strategy = "quota_usage"
             return usage
 
     _quota_updaters = {
@@ -224,50 +471,94 @@ class QuotaManager(object):
             size_difference_threshold or self.default_size_diff_threshold
         )
 
-    def get_current_region_quota(self, region_id):
-        current_quota = {}
+    def _run_concurrently(self, func, keys, wait_for_all=False):
+        """Call func for each key, using a bounded pool of threads.
+
+        Returns a tuple of (results, errors), both dicts keyed on
+        the given keys. Calls that raise end up in errors.
+
+        Reads only wait 'quota.service_timeout' seconds for the calls,
+        reporting the slow ones as errors and leaving them to finish in
+        the background. Writes set wait_for_all, as a write that is
+        still running may yet apply, so every call is waited on and
+        its real outcome reported.
+        """
+        results = {}
+        errors = {}
+        if not keys:
+            return results, errors
+
+        max_workers = min(CONF.quota.max_workers, len(keys))
+        if max_workers <= 1:
+            for key in keys:
+                try:
+                    results[key] = func(key)
+                except Exception as e:
+                    errors[key] = e
+            return results, errors
+
+        timeout = None if wait_for_all else CONF.quota.service_timeout
+        executor = futures.ThreadPoolExecutor(max_workers=max_workers)
+        pending = {executor.submit(func, key): key for key in keys}
+        done, not_done = futures.wait(pending, timeout=timeout)
+        executor.shutdown(wait=wait_for_all, cancel_futures=True)
+
+        for future in done:
+            try:
+                results[pending[future]] = future.result()
+            except Exception as e:
+                errors[pending[future]] = e
+        for future in not_done:
+            errors[pending[future]] = futures.TimeoutError(
+                "No response after %s seconds." % timeout
+            )
+        return results, errors
+
+    def _get_service_data(self, region_ids, methods):
+        """Call the given helper methods for every service in the regions.
+
+        Returns a tuple of (results, errors), keyed on
+        (region_id, service_name, method).
+        """
+        calls = []
+        for region_id in region_ids:
+            region_helpers = self.helpers.get(region_id, self.default_helpers)
+            for name in region_helpers:
+                for method in methods:
+                    calls.append((region_id, name, method))
+
+        def call_helper(call):
+            region_id, name, method = call
+            cache_key = (self.project_id, region_id, name, method)
+            value = quota_snapshot_cache.get(cache_key)
+            if value is not None:
+                return value
+
+            region_helpers = self.helpers.get(region_id, self.default_helpers)
+            helper = region_helpers[name](region_id, self.project_id)
+            value = getattr(helper, method)()
+            quota_snapshot_cache.set(cache_key, value)
+            return value
+
+        return self._run_concurrently(call_helper, calls)
+
+    @staticmethod
+    def _raise_first_error(errors):
+        for error in errors.values():
+            raise error
 
-        region_helpers = self.helpers.get(region_id, self.default_helpers)
-        for name, service in region_helpers.items():
-            helper = service(region_id, self.project_id)
-            current_quota[name] = helper.get_quota()
+    def get_current_region_quota(self, region_id):
+        results, errors = self._get_service_data([region_id], ["get_quota"])
+        self._raise_first_error(errors)
 
+        current_quota = {}
+        for name in self.helpers.get(region_id, self.default_helpers):
+            current_quota[name] = results[(region_id, name, "get_quota")]
         return current_quota
 
     def get_quota_differences(self, current_quota):
         """Gets the closest matching quota size for a given quota"""
-        quota_differences = {}
-        for size, setting in CONF.quota.sizes.items():
-            match_percentages = []
-            for service_name, values in setting.items():
-                if service_name not in current_quota:
-                    continue
-                for name, value in values.items():
-                    if name not in current_quota[service_name]:
-                        continue
-                    if value > 0:
-                        current = current_quota[service_name][name]
-                        dividend = float(min(current, value))
-                        divisor = float(max(current, value))
-                        match_percentages.append(dividend / divisor)
-                    elif value < 0:
-                        # NOTE(amelia): Sub-zero quota means unlimited
-                        if current_quota[service_name][name] < 0:
-                            match_percentages.append(1.0)
-                        else:
-                            match_percentages.append(0.0)
-                    elif current_quota[service_name][name] == 0:
-                        match_percentages.append(1.0)
-                    else:
-                        match_percentages.append(0.0)
-            # Calculate the average of how much it matches the setting
-            difference = abs(
-                (sum(match_percentages) / float(len(match_percentages))) - 1
-            )
-
-            quota_differences[size] = difference
-
-        return quota_differences
+        return get_quota_size_index().get_differences(current_quota)
 
     def get_quota_size(self, current_quota, difference_threshold=None):
         """Gets the closest matching quota size for a given quota"""
@@ -288,12 +579,12 @@ class QuotaManager(object):
 
     def get_quota_change_options(self, quota_size):
         """Get's the pre-approved quota change options for a given size"""
-        quota_list = CONF.quota.sizes_ascending
-        try:
-            list_position = quota_list.index(quota_size)
-        except ValueError:
+        size_index = get_quota_size_index()
+        list_position = size_index.get_position(quota_size)
+        if list_position is None:
             return []
 
+        quota_list = size_index.sizes_ascending
         quota_change_list = quota_list[:list_position]
 
         if list_position + 1 < len(quota_list):
@@ -303,62 +594,151 @@ class QuotaManager(object):
 
     def get_smaller_quota_options(self, quota_size):
         """Get the quota sizes smaller than the current size."""
-        quota_list = CONF.quota.sizes_ascending
-        try:
-            list_position = quota_list.index(quota_size)
-        except ValueError:
+        size_index = get_quota_size_index()
+        list_position = size_index.get_position(quota_size)
+        if list_position is None:
             return []
 
-        return quota_list[:list_position]
+        return size_index.sizes_ascending[:list_position]
+
+    def _build_region_quota_data(self, region_ids, include_usage):
+        methods = ["get_quota"]
+        if include_usage:
+            methods.append("get_usage")
+        results, errors = self._get_service_data(region_ids, methods)
+
+        regions = {}
+        for region_id in region_ids:
+            # NOTE(callumdickinson): Regions with no services for which
+            # quotas should be managed are left out.
+            region_helpers = self.helpers.get(region_id, self.default_helpers)
+            if not region_helpers:
+                continue
+
+            current_quota = {}
+            current_usage = {}
+            region_errors = {}
+            for name in region_helpers:
+                for method, values in [
+                    ("get_quota", current_quota),
+                    ("get_usage", current_usage),
+                ]:
+                    key = (region_id, name, method)
+                    if key in results:
+                        values[name] = results[key]
+                    elif key in errors:
+                        region_errors[name] = errors[key]
+
+            # NOTE: The size can't be worked out from part of the quota,
+            # so leave it unknown if any service didn't respond.
+            if region_errors:
+                current_quota_size = None
+                change_options = []
+            else:
+                current_quota_size = self.get_quota_size(current_quota)
+                change_options = self.get_quota_change_options(current_quota_size)
+
+            region_data = {
+                "region": region_id,
+                "current_quota": current_quota,
+                "current_quota_size": current_quota_size,
+                "quota_change_options": change_options,
+            }
+            if include_usage:
+                region_data["current_usage"] = current_usage
+
+            regions[region_id] = (region_data, region_errors)
+        return regions
 
     def get_region_quota_data(self, region_id, include_usage=True):
         # NOTE(callumdickinson): If the region has no services
         # for which quotas should be managed, return None so the caller
         # can handle this case properly.
-        if not self.helpers.get(region_id, self.default_helpers):
+        regions = self._build_region_quota_data([region_id], include_usage)
+        if region_id not in regions:
             return None
 
-        current_quota = self.get_current_region_quota(region_id)
-        current_quota_size = self.get_quota_size(current_quota)
-        change_options = self.get_quota_change_options(current_quota_size)
-
-        region_data = {
-            "region": region_id,
-            "current_quota": current_quota,
-            "current_quota_size": current_quota_size,
-            "quota_change_options": change_options,
-        }
-
-        if include_usage:
-            region_data["current_usage"] = self.get_current_usage(region_id)
-
+        region_data, errors = regions[region_id]
+        self._raise_first_error(errors)
         return region_data
 
+    def get_regions_quota_data(self, region_ids, include_usage=True):
+        """Get the quota data for many regions at once.
+
+        Every service in every region is queried concurrently, and
+        rather than failing outright, services that error or time out
+        are reported by name in an 'errors' dict for their region, and
+        its 'current_quota_size' is None. Regions with quota management
+        disabled are skipped.
+        """
+        region_quotas = []
+        regions = self._build_region_quota_data(region_ids, include_usage)
+        for region_id in region_ids:
+            if region_id not in regions:
+                continue
+            region_data, errors = regions[region_id]
+            if errors:
+                region_data["errors"] = {
+                    name: "%s: %s" % (type(error).__name__, error)
+                    for name, error in errors.items()
+                }
+            region_quotas.append(region_data)
+        return region_quotas
+
     def get_current_usage(self, region_id):
-        current_usage = {}
+        results, errors = self._get_service_data([region_id], ["get_usage"])
+        self._raise_first_error(errors)
 
-        region_helpers = self.helpers.get(region_id, self.default_helpers)
-        for name, service in region_helpers.items():
-            helper = service(region_id, self.project_id)
-            current_usage[name] = helper.get_usage()
+        current_usage = {}
+        for name in self.helpers.get(region_id, self.default_helpers):
+            current_usage[name] = results[(region_id, name, "get_usage")]
         return current_usage
 
-    def set_region_quota(self, region_id, quota_dict):
-        region_helpers = self.helpers.get(region_id, self.default_helpers)
-        if not region_helpers:
-            return [
-                (
+    def set_regions_quota(self, region_quotas, completed=None):
+        """Set the quota for many regions at once.
+
+        region_quotas maps region ids to the quota to set there, in the
+        same form set_region_quota takes. Every service in every region
+        is updated concurrently, skipping any (region_id, service_name)
+        pairs in completed so that failed updates can be retried alone.
+
+        Returns a tuple of (updated, errors, notes), where updated is the
+        list of (region_id, service_name) pairs set by this call, errors
+        is keyed on the pairs that failed, and notes lists the regions
+        that were skipped.
+        """
+        completed = set(completed or [])
+        notes = []
+        calls = []
+        for region_id, quota_dict in region_quotas.items():
+            region_helpers = self.helpers.get(region_id, self.default_helpers)
+            if not region_helpers:
+                notes.append(
                     "WARNING: Quota management disabled in region "
                     f"{region_id}, skipping."
-                ),
-            ]
-        notes = []
-        for service_name, values in quota_dict.items():
-            updater_class = region_helpers.get(service_name)
-            if not updater_class:
+                )
                 continue
+            for service_name in quota_dict:
+                call = (region_id, service_name)
+                if service_name in region_helpers and call not in completed:
+                    calls.append(call)
+
+        def set_service_quota(call):
+            region_id, service_name = call
+            region_helpers = self.helpers.get(region_id, self.default_helpers)
+            service_helper = region_helpers[service_name](region_id, self.project_id)
+            try:
+                service_helper.set_quota(region_quotas[region_id][service_name])
+            finally:
+                invalidate_quota_cache(self.project_id, region_id, service_name)
+
+        results, errors = self._run_concurrently(
+            set_service_quota, calls, wait_for_all=True
+        )
+        updated = [call for call in calls if call in results]
+        return updated, errors, notes
 
-            service_helper = updater_class(region_id, self.project_id)
-
-            service_helper.set_quota(values)
+    def set_region_quota(self, region_id, quota_dict):
+        updated, errors, notes = self.set_regions_quota({region_id: quota_dict})
+        self._raise_first_error(errors)
         return notes
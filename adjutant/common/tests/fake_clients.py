@@ -12,10 +12,12 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-from collections import namedtuple
+from collections import Counter, namedtuple
 from unittest import mock
 from uuid import uuid4
 
+from keystoneclient import exceptions as ks_exceptions
+
 from adjutant.config import CONF
 
 identity_cache = {}
@@ -507,6 +509,111 @@ class FakeManager(object):
         return manageable_role_names
 
 
+class FakeKeystoneClient(object):
+    """Stub of the keystoneclient v3 Client backed by the identity cache.
+
+    Only implements the subset of calls the real IdentityManager makes,
+    and records each call in ``calls`` so tests can count round trips.
+    """
+
+    class FakeAssignment(object):
+        def __init__(self, role, scope, user=None):
+            self.role = role
+            self.scope = scope
+            if user is not None:
+                self.user = user
+
+    class Endpoint(object):
+        def __init__(self, client, name, methods):
+            for method in methods:
+                setattr(self, method, client._recorded("%s.%s" % (name, method)))
+
+    def __init__(self):
+        self.calls = Counter()
+        self.roles = self.Endpoint(self, "roles", ["list", "find"])
+        self.users = self.Endpoint(self, "users", ["get", "list"])
+        self.projects = self.Endpoint(self, "projects", ["get"])
+        self.role_assignments = self.Endpoint(self, "role_assignments", ["list"])
+
+    def _recorded(self, name):
+        handler = getattr(self, "_" + name.replace(".", "_"))
+
+        def call(*args, **kwargs):
+            self.calls[name] += 1
+            return handler(*args, **kwargs)
+
+        return call
+
+    @property
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    def _roles_list(self):
+        return list(identity_cache["roles"].values())
+
+    def _roles_find(self, name):
+        for role in identity_cache["roles"].values():
+            if role.name == name:
+                return role
+        raise ks_exceptions.NotFound()
+
+    def _users_get(self, user_id):
+        try:
+            return identity_cache["users"][user_id]
+        except KeyError:
+            raise ks_exceptions.NotFound()
+
+    def _users_list(self, domain=None, name=None):
+        return [
+            user
+            for user in identity_cache["users"].values()
+            if (domain is None or user.domain_id == domain)
+            and (name is None or user.name == name)
+        ]
+
+    def _projects_get(self, project_id):
+        if isinstance(project_id, FakeProject):
+            return project_id
+        try:
+            return identity_cache["projects"][project_id]
+        except KeyError:
+            raise ks_exceptions.NotFound()
+
+    def _role_assignments_list(self, project=None, user=None, include_names=False):
+        if isinstance(project, FakeProject):
+            project = project.id
+        if isinstance(user, FakeUser):
+            user = user.id
+        role_ids = {role.name: role.id for role in identity_cache["roles"].values()}
+
+        assignments = []
+        for assignment in identity_cache["role_assignments"]:
+            if project and assignment.scope["project"]["id"] != project:
+                continue
+            if not assignment.user:
+                assignments.append(
+                    self.FakeAssignment(
+                        {"id": role_ids[assignment.role["name"]]}, assignment.scope
+                    )
+                )
+                continue
+            if user and assignment.user["id"] != user:
+                continue
+            user_ref = {"id": assignment.user["id"]}
+            if include_names:
+                ks_user = identity_cache["users"][assignment.user["id"]]
+                user_ref["name"] = ks_user.name
+                user_ref["domain"] = {"id": ks_user.domain_id}
+            assignments.append(
+                self.FakeAssignment(
+                    {"id": role_ids[assignment.role["name"]]},
+                    assignment.scope,
+                    user_ref,
+                )
+            )
+        return assignments
+
+
 class FakeOpenstackClient(object):
     class Quotas(object):
         """Stub class for testing quotas"""
@@ -611,25 +718,36 @@ class FakeNeutronClient(object):
     def show_quota(self, project_id):
         return {"quota": neutron_cache[self.region][project_id]["quota"]}
 
-    def list_networks(self, tenant_id):
+    def show_quota_details(self, project_id):
+        project = neutron_cache[self.region][project_id]
+        details = {}
+        for resource, limit in project["quota"].items():
+            details[resource] = {
+                "limit": limit,
+                "used": len(project.get(resource + "s", {})),
+                "reserved": 0,
+            }
+        return {"quota": details}
+
+    def list_networks(self, tenant_id, **kwargs):
         return neutron_cache[self.region][tenant_id]
 
-    def list_routers(self, tenant_id):
+    def list_routers(self, tenant_id, **kwargs):
         return neutron_cache[self.region][tenant_id]
 
-    def list_subnets(self, tenant_id=0):
+    def list_subnets(self, tenant_id=0, **kwargs):
         return neutron_cache[self.region][tenant_id]
 
-    def list_security_groups(self, tenant_id=0):
+    def list_security_groups(self, tenant_id=0, **kwargs):
         return neutron_cache[self.region][tenant_id]
 
-    def list_floatingips(self, tenant_id=0):
+    def list_floatingips(self, tenant_id=0, **kwargs):
         return neutron_cache[self.region][tenant_id]
 
-    def list_security_group_rules(self, tenant_id=0):
+    def list_security_group_rules(self, tenant_id=0, **kwargs):
         return neutron_cache[self.region][tenant_id]
 
-    def list_ports(self, tenant_id=0):
+    def list_ports(self, tenant_id=0, **kwargs):
         return neutron_cache[self.region][tenant_id]
 
 
@@ -757,6 +875,30 @@ class FakeNovaClient(FakeOpenstackClient):
 
 
 class FakeCinderClient(FakeOpenstackClient):
+    class Quotas(FakeOpenstackClient.Quotas):
+        def get(self, project_id, usage=False):
+            project = self.service._cache[self.service.region][project_id]
+            if not usage:
+                return self.QuotaSet(project["quota"])
+
+            in_use = {
+                "volumes": len(project["volumes"]),
+                "snapshots": len(project["volume_snapshots"]),
+                "gigabytes": sum(
+                    resource.size
+                    for resource in project["volumes"] + project["volume_snapshots"]
+                ),
+            }
+            usage_data = {}
+            for resource, limit in project["quota"].items():
+                usage_data[resource] = {
+                    "limit": limit,
+                    "in_use": in_use.get(resource, 0),
+                    "reserved": 0,
+                    "allocated": 0,
+                }
+            return self.QuotaSet(usage_data)
+
     class FakeResourceGroup(object):
         """Stub class to represent volumes and snapshots"""
 
@@ -772,7 +914,7 @@ class FakeCinderClient(FakeOpenstackClient):
     def __init__(self, region):
         self.region = region
         self._cache = cinder_cache
-        self.quotas = FakeOpenstackClient.Quotas(self)
+        self.quotas = self.Quotas(self)
         self.volumes = self.FakeResourceGroup(region, "volumes")
         self.volume_snapshots = self.FakeResourceGroup(region, "volume_snapshots")
 
@@ -0,0 +1,137 @@
+# Copyright (C) 2026 Catalyst Cloud Ltd
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from unittest import mock
+
+from django.test import SimpleTestCase
+from keystoneauth1 import exceptions as ks_exceptions
+
+from adjutant.common import openstack_clients
+
+
+@mock.patch("adjutant.common.openstack_clients.neutronclient.Client")
+@mock.patch("adjutant.common.openstack_clients.novaclient.Client")
+class ClientCacheTests(SimpleTestCase):
+    def setUp(self):
+        openstack_clients.reset_auth_session()
+        patcher = mock.patch(
+            "adjutant.common.openstack_clients.session.Session",
+            side_effect=lambda auth: mock.Mock(),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(openstack_clients.reset_auth_session)
+
+    def test_client_reused(self, nova_client, neutron_client):
+        """
+        The same service client is returned for the same region.
+        """
+        neutron_client.side_effect = lambda **kwargs: mock.Mock()
+        nova_client.side_effect = lambda *args, **kwargs: mock.Mock()
+
+        neutron = openstack_clients.get_neutronclient("RegionOne")
+        self.assertIs(openstack_clients.get_neutronclient("RegionOne"), neutron)
+        self.assertIsNot(openstack_clients.get_neutronclient("RegionTwo"), neutron)
+
+        nova = openstack_clients.get_novaclient("RegionOne")
+        self.assertIsNot(nova, neutron)
+        self.assertIs(openstack_clients.get_novaclient("RegionOne"), nova)
+        self.assertIsNot(openstack_clients.get_novaclient("RegionOne", "2.1"), nova)
+
+        self.assertEqual(neutron_client.call_count, 2)
+        self.assertEqual(nova_client.call_count, 2)
+
+    def test_session_rebuilt(self, nova_client, neutron_client):
+        """
+        Rebuilding the auth session invalidates the cached clients.
+        """
+        neutron_client.side_effect = lambda **kwargs: mock.Mock()
+
+        neutron = openstack_clients.get_neutronclient("RegionOne")
+        openstack_clients.reset_auth_session()
+        new_neutron = openstack_clients.get_neutronclient("RegionOne")
+
+        self.assertIsNot(new_neutron, neutron)
+        self.assertIs(
+            neutron_client.call_args.kwargs["session"],
+            openstack_clients.get_auth_session(),
+        )
+
+        # Replacing the session directly is also picked up.
+        openstack_clients.client_auth_session = mock.Mock()
+        self.assertIsNot(openstack_clients.get_neutronclient("RegionOne"), new_neutron)
+
+    @mock.patch("adjutant.common.openstack_clients.CLIENT_CACHE_SIZE", 2)
+    def test_cache_bounded(self, nova_client, neutron_client):
+        """
+        Least recently used clients are dropped once the cache is full.
+        """
+        neutron_client.side_effect = lambda **kwargs: mock.Mock()
+
+        region_one = openstack_clients.get_neutronclient("RegionOne")
+        openstack_clients.get_neutronclient("RegionTwo")
+        openstack_clients.get_neutronclient("RegionOne")
+        openstack_clients.get_neutronclient("RegionThree")
+
+        self.assertIs(openstack_clients.get_neutronclient("RegionOne"), region_one)
+        self.assertEqual(neutron_client.call_count, 3)
+        openstack_clients.get_neutronclient("RegionTwo")
+        self.assertEqual(neutron_client.call_count, 4)
+
+
+@mock.patch("adjutant.common.openstack_clients.octavia.OctaviaAPI")
+@mock.patch("adjutant.common.openstack_clients.ks_client.Client")
+class OctaviaClientTests(SimpleTestCase):
+    def setUp(self):
+        openstack_clients.reset_auth_session()
+        self.auth_session = mock.Mock()
+        openstack_clients.client_auth_session = self.auth_session
+        self.addCleanup(openstack_clients.reset_auth_session)
+
+    def test_endpoint_from_catalog(self, ks_client, octavia_api):
+        """
+        The Octavia endpoint comes from the session's service catalog.
+        """
+        self.auth_session.get_endpoint.return_value = "http://octavia:9876"
+
+        client = openstack_clients.get_octaviaclient("RegionOne")
+        self.assertIs(openstack_clients.get_octaviaclient("RegionOne"), client)
+
+        octavia_api.assert_called_once_with(
+            session=self.auth_session, endpoint="http://octavia:9876"
+        )
+        self.auth_session.get_endpoint.assert_called_once_with(
+            service_type="load-balancer",
+            interface="public",
+            region_name="RegionOne",
+            skip_discovery=True,
+        )
+        ks_client.assert_not_called()
+
+    def test_endpoint_fallback(self, ks_client, octavia_api):
+        """
+        The endpoint is looked up in Keystone if it isn't in the catalog,
+        but only once per region.
+        """
+        self.auth_session.get_endpoint.side_effect = ks_exceptions.EndpointNotFound()
+        endpoint = mock.Mock(url="http://octavia.regiontwo:9876")
+        ks_client.return_value.endpoints.list.return_value = [endpoint]
+
+        openstack_clients.get_octaviaclient("RegionTwo")
+        openstack_clients.get_octaviaclient("RegionTwo")
+
+        octavia_api.assert_called_once_with(
+            session=self.auth_session, endpoint="http://octavia.regiontwo:9876"
+        )
+        ks_client.return_value.services.list.assert_called_once_with(name="octavia")
@@ -0,0 +1,322 @@
+# Copyright (C) 2026 Catalyst Cloud Ltd
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import time
+import timeit
+import unittest
+from unittest import mock
+
+from cinderclient import exceptions as cinder_exceptions
+from confspirator.tests import utils as conf_utils
+from neutronclient.common import exceptions as neutron_exceptions
+
+from adjutant.common import quota
+from adjutant.common.quota import QuotaManager
+from adjutant.common.tests.fake_clients import (
+    FakeCinderClient,
+    FakeNeutronClient,
+    FakeResource,
+    cinder_cache,
+    get_fake_cinderclient,
+    get_fake_neutron,
+    neutron_cache,
+    setup_mock_caches,
+)
+from adjutant.common.tests.utils import AdjutantTestCase
+from adjutant.config import CONF
+
+
+def build_sizes(size_count, service_count=5, resource_count=12):
+    sizes = {}
+    for i in range(size_count):
+        sizes["size_%s" % i] = {
+            "service_%s"
+            % j: {
+                "resource_%s" % k: (i + 1) * (k + 1) * 10 if k % 5 else -1
+                for k in range(resource_count)
+            }
+            for j in range(service_count)
+        }
+    return sizes
+
+
+def reference_quota_differences(sizes, current_quota):
+    """The size matching as it was before the sizes were compiled."""
+    quota_differences = {}
+    for size, setting in sizes.items():
+        match_percentages = []
+        for service_name, values in setting.items():
+            if service_name not in current_quota:
+                continue
+            for name, value in values.items():
+                if name not in current_quota[service_name]:
+                    continue
+                current = current_quota[service_name][name]
+                if value > 0:
+                    dividend = float(min(current, value))
+                    divisor = float(max(current, value))
+                    match_percentages.append(dividend / divisor)
+                elif value < 0:
+                    match_percentages.append(1.0 if current < 0 else 0.0)
+                else:
+                    match_percentages.append(1.0 if current == 0 else 0.0)
+        quota_differences[size] = abs(
+            (sum(match_percentages) / float(len(match_percentages))) - 1
+        )
+    return quota_differences
+
+
+@mock.patch("adjutant.common.openstack_clients.get_neutronclient", get_fake_neutron)
+@mock.patch("adjutant.common.openstack_clients.get_cinderclient", get_fake_cinderclient)
+class ServiceQuotaHelperTests(AdjutantTestCase):
+    def setUp(self):
+        super(ServiceQuotaHelperTests, self).setUp()
+        setup_mock_caches("RegionOne", "test_project_id")
+
+        cinder_project = cinder_cache["RegionOne"]["test_project_id"]
+        cinder_project["volumes"] = [FakeResource(10), FakeResource(40)]
+        cinder_project["volume_snapshots"] = [FakeResource(5)]
+
+        neutron_project = neutron_cache["RegionOne"]["test_project_id"]
+        neutron_project["networks"] = {"net_1": {}, "net_2": {}}
+        neutron_project["ports"] = {"port_1": {}, "port_2": {}, "port_3": {}}
+        neutron_project["routers"] = {"router_1": {}}
+
+    expected_cinder_usage = {"gigabytes": 55, "volumes": 2, "snapshots": 1}
+    expected_neutron_usage = {
+        "network": 2,
+        "subnet": 0,
+        "router": 1,
+        "floatingip": 0,
+        "port": 3,
+        "security_group": 0,
+        "security_group_rule": 0,
+    }
+
+    def test_cinder_usage_from_quota(self):
+        """
+        Cinder usage comes from the quota usage call without listing volumes.
+        """
+        helper = QuotaManager.ServiceQuotaCinderHelper("RegionOne", "test_project_id")
+
+        with mock.patch.object(
+            FakeCinderClient.FakeResourceGroup, "list"
+        ) as list_resources:
+            usage = helper.get_usage()
+
+        self.assertEqual(usage, self.expected_cinder_usage)
+        self.assertEqual(helper.usage_strategy, "quota_usage")
+        list_resources.assert_not_called()
+
+    def test_cinder_usage_fallback(self):
+        """
+        Cinder usage falls back to listing when quota usage is unavailable.
+        """
+        helper = QuotaManager.ServiceQuotaCinderHelper("RegionOne", "test_project_id")
+
+        with mock.patch.object(
+            FakeCinderClient.Quotas,
+            "get",
+            side_effect=cinder_exceptions.ClientException(400),
+        ):
+            usage = helper.get_usage()
+
+        self.assertEqual(usage, self.expected_cinder_usage)
+        self.assertEqual(helper.usage_strategy, "listing")
+
+    def test_neutron_usage_from_quota_details(self):
+        """
+        Neutron usage comes from the quota details call without listing.
+        """
+        helper = QuotaManager.ServiceQuotaNeutronHelper("RegionOne", "test_project_id")
+
+        with mock.patch.object(FakeNeutronClient, "list_ports") as list_ports:
+            usage = helper.get_usage()
+
+        self.assertEqual(usage, self.expected_neutron_usage)
+        self.assertEqual(helper.usage_strategy, "quota_usage")
+        list_ports.assert_not_called()
+
+    def test_neutron_usage_fallback(self):
+        """
+        Neutron usage falls back to listing ids when quota details are missing.
+        """
+        helper = QuotaManager.ServiceQuotaNeutronHelper("RegionOne", "test_project_id")
+
+        with (
+            mock.patch.object(
+                FakeNeutronClient,
+                "show_quota_details",
+                side_effect=neutron_exceptions.NotFound(),
+            ),
+            mock.patch.object(
+                FakeNeutronClient, "list_ports", wraps=helper.client.list_ports
+            ) as list_ports,
+        ):
+            usage = helper.get_usage()
+
+        self.assertEqual(usage, self.expected_neutron_usage)
+        self.assertEqual(helper.usage_strategy, "listing")
+        list_ports.assert_called_once_with(tenant_id="test_project_id", fields="id")
+
+    @conf_utils.modify_conf(
+        CONF,
+        operations={
+            "adjutant.quota.service_timeout": [
+                {"operation": "override", "value": 1},
+            ],
+        },
+    )
+    def test_slow_quota_update_waited_on(self):
+        """
+        Quota updates aren't cut off by the service timeout, as a slow
+        update may still apply.
+        """
+        quota_manager = QuotaManager("test_project_id")
+
+        def slow_set_quota(values):
+            time.sleep(1.5)
+
+        with (
+            mock.patch.object(
+                QuotaManager.ServiceQuotaCinderHelper,
+                "set_quota",
+                side_effect=slow_set_quota,
+            ),
+            mock.patch.object(QuotaManager.ServiceQuotaNeutronHelper, "set_quota"),
+        ):
+            updated, errors, notes = quota_manager.set_regions_quota(
+                {"RegionOne": {"cinder": {"volumes": 5}, "neutron": {"port": 5}}}
+            )
+
+        self.assertEqual(errors, {})
+        self.assertEqual(
+            sorted(updated), [("RegionOne", "cinder"), ("RegionOne", "neutron")]
+        )
+
+
+class QuotaSizeIndexTests(AdjutantTestCase):
+    sizes = build_sizes(40)
+    sizes_ascending = list(sizes)
+
+    def current_quotas(self):
+        quotas = [self.sizes["size_0"], self.sizes["size_17"], self.sizes["size_39"]]
+        for size in ["size_5", "size_30"]:
+            # a quota near, but not exactly, one of the sizes
+            quotas.append(
+                {
+                    service_name: {
+                        name: value + 3 if value > 0 else value
+                        for name, value in values.items()
+                    }
+                    for service_name, values in self.sizes[size].items()
+                }
+            )
+        # only part of the services and resources
+        quotas.append({"service_1": {"resource_1": 500, "resource_5": -1}})
+        return quotas
+
+    def modify_sizes(self):
+        return conf_utils.modify_conf(
+            CONF,
+            operations={
+                "adjutant.quota.sizes": [
+                    {"operation": "override", "value": self.sizes},
+                ],
+                "adjutant.quota.sizes_ascending": [
+                    {"operation": "override", "value": self.sizes_ascending},
+                ],
+            },
+        )
+
+    def test_matches_reference(self):
+        """
+        The compiled index gives the same differences and sizes as
+        comparing against every size in turn.
+        """
+        with self.modify_sizes():
+            quota_manager = QuotaManager("test_project_id")
+            for current_quota in self.current_quotas():
+                differences = quota_manager.get_quota_differences(current_quota)
+                expected = reference_quota_differences(self.sizes, current_quota)
+                self.assertEqual(list(differences), list(expected))
+                for size, difference in expected.items():
+                    self.assertAlmostEqual(differences[size], difference)
+                self.assertEqual(
+                    quota_manager.get_quota_size(current_quota),
+                    min(expected, key=expected.get),
+                )
+
+            self.assertEqual(
+                quota_manager.get_quota_change_options("size_2"),
+                ["size_0", "size_1", "size_3"],
+            )
+            self.assertEqual(
+                quota_manager.get_smaller_quota_options("size_2"),
+                ["size_0", "size_1"],
+            )
+            self.assertEqual(quota_manager.get_quota_change_options("custom"), [])
+
+    def test_compiled_once(self):
+        """
+        The sizes are compiled once, and again only when they change.
+        """
+        index = quota.get_quota_size_index()
+        self.assertIs(quota.get_quota_size_index(), index)
+
+        with self.modify_sizes():
+            modified_index = quota.get_quota_size_index()
+            self.assertIsNot(modified_index, index)
+            self.assertEqual(modified_index.size_names, self.sizes_ascending)
+
+        self.assertEqual(
+            quota.get_quota_size_index().size_names, list(CONF.quota.sizes)
+        )
+
+    def test_no_comparable_values(self):
+        """
+        A quota sharing no resources with the sizes matches none of them.
+        """
+        quota_manager = QuotaManager("test_project_id")
+        self.assertEqual(quota_manager.get_quota_size({}), "custom")
+
+    @unittest.skipUnless(
+        os.environ.get("ADJUTANT_BENCHMARK"), "set ADJUTANT_BENCHMARK to run"
+    )
+    def test_benchmark(self):
+        """
+        Time matching quotas with the compiled index, without its memo,
+        against comparing with every size in turn. Only reports the
+        timings, as they vary too much between machines to assert on.
+        """
+        current_quotas = self.current_quotas()
+        index = quota.QuotaSizeIndex(self.sizes, self.sizes_ascending)
+
+        def compiled():
+            for current_quota in current_quotas:
+                differences = index._compute_differences(current_quota)
+                min(differences, key=differences.get)
+
+        def reference():
+            for current_quota in current_quotas:
+                differences = reference_quota_differences(self.sizes, current_quota)
+                min(differences, key=differences.get)
+
+        compiled_time = min(timeit.repeat(compiled, number=20, repeat=3))
+        reference_time = min(timeit.repeat(reference, number=20, repeat=3))
+        print(
+            "\nQuota size matching: compiled %.4fs, reference %.4fs"
+            % (compiled_time, reference_time)
+        )
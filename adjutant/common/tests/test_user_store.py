@@ -0,0 +1,264 @@
+# Copyright (C) 2026 Catalyst Cloud Ltd
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from unittest import mock
+
+from confspirator.tests import utils as conf_utils
+
+from adjutant.common import user_store
+from adjutant.common.tests import fake_clients
+from adjutant.common.tests.fake_clients import (
+    FakeKeystoneClient,
+    FakeProject,
+    FakeRole,
+    FakeRoleAssignment,
+    FakeUser,
+    setup_identity_cache,
+)
+from adjutant.common.tests.utils import AdjutantTestCase
+from adjutant.config import CONF
+
+
+class IdentityManagerTests(AdjutantTestCase):
+    def setUp(self):
+        super(IdentityManagerTests, self).setUp()
+        self.ks_client = FakeKeystoneClient()
+        patcher = mock.patch(
+            "adjutant.common.user_store.get_keystoneclient",
+            return_value=self.ks_client,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        user_store.invalidate_role_cache()
+        self.addCleanup(user_store.invalidate_role_cache)
+
+    def _setup_project(self, user_count, inherited=False):
+        parent = FakeProject(name="parent_project")
+        project = FakeProject(name="test_project", parent_id=parent.id)
+
+        users = []
+        assignments = []
+        for i in range(user_count):
+            user = FakeUser(name="user%s@example.com" % i)
+            users.append(user)
+            for role_name in ["member", "project_mod"]:
+                assignments.append(
+                    FakeRoleAssignment(
+                        scope={"project": {"id": project.id}},
+                        role_name=role_name,
+                        user={"id": user.id},
+                    )
+                )
+            assignments.append(
+                FakeRoleAssignment(
+                    scope={"project": {"id": parent.id}},
+                    role_name="member",
+                    user={"id": user.id},
+                    inherited=inherited,
+                )
+            )
+
+        # a group assignment should be ignored
+        assignments.append(
+            FakeRoleAssignment(
+                scope={"project": {"id": project.id}},
+                role_name="member",
+                group={"id": "some_group"},
+            )
+        )
+
+        setup_identity_cache(
+            projects=[parent, project], users=list(users), role_assignments=assignments
+        )
+        return project, users
+
+    def test_list_users(self):
+        """
+        Users and their roles are resolved from the project assignments.
+        """
+        project, users = self._setup_project(3)
+
+        listed = {
+            user.id: user
+            for user in user_store.IdentityManager().list_users(project.id)
+        }
+
+        self.assertEqual(set(listed), {user.id for user in users})
+        for user in listed.values():
+            self.assertEqual(
+                sorted(role.name for role in user.roles), ["member", "project_mod"]
+            )
+            self.assertEqual(user.inherited_roles, [])
+
+    @conf_utils.modify_conf(
+        CONF,
+        operations={
+            "adjutant.identity.bulk_user_lookup_threshold": [
+                {"operation": "override", "value": 5},
+            ],
+        },
+    )
+    def test_list_users_keystone_calls(self):
+        """
+        Resolving a large project does not make one call per user.
+        """
+        project, users = self._setup_project(50)
+
+        listed = list(user_store.IdentityManager().list_users(project.id))
+
+        self.assertEqual(len(listed), 50)
+        self.assertEqual(self.ks_client.calls["role_assignments.list"], 1)
+        self.assertEqual(self.ks_client.calls["users.list"], 1)
+        self.assertEqual(self.ks_client.calls["users.get"], 0)
+        small_project_calls = self.ks_client.total_calls
+
+        # The call count must not grow with the number of users.
+        fake_clients.identity_cache.clear()
+        self.ks_client.calls.clear()
+        project, users = self._setup_project(400)
+
+        listed = list(user_store.IdentityManager().list_users(project.id))
+
+        self.assertEqual(len(listed), 400)
+        self.assertEqual(self.ks_client.total_calls, small_project_calls)
+
+    @conf_utils.modify_conf(
+        CONF,
+        operations={
+            "adjutant.identity.bulk_user_lookup_threshold": [
+                {"operation": "override", "value": 5},
+            ],
+        },
+    )
+    def test_list_users_below_threshold(self):
+        """
+        Few users are fetched individually rather than listing the domain.
+        """
+        project, users = self._setup_project(2)
+
+        listed = list(user_store.IdentityManager().list_users(project.id))
+
+        self.assertEqual(len(listed), 2)
+        self.assertEqual(self.ks_client.calls["users.list"], 0)
+        self.assertEqual(self.ks_client.calls["users.get"], 2)
+
+    @conf_utils.modify_conf(
+        CONF,
+        operations={
+            "adjutant.identity.bulk_user_lookup_threshold": [
+                {"operation": "override", "value": 5},
+            ],
+        },
+    )
+    def test_list_inherited_users_keystone_calls(self):
+        """
+        Inherited users are resolved in bulk as well.
+        """
+        project, users = self._setup_project(50, inherited=True)
+
+        listed = list(user_store.IdentityManager().list_inherited_users(project.id))
+
+        self.assertEqual(len(listed), 50)
+        for user in listed:
+            self.assertEqual([role.name for role in user.roles], ["member"])
+        self.assertEqual(self.ks_client.calls["users.list"], 1)
+        self.assertEqual(self.ks_client.calls["users.get"], 0)
+
+    def test_list_users_bulk_lookup_disabled(self):
+        """
+        By default the domain is never listed, however many users it has.
+        """
+        project, users = self._setup_project(50)
+
+        listed = list(user_store.IdentityManager().list_users(project.id))
+
+        self.assertEqual(len(listed), 50)
+        self.assertEqual(self.ks_client.calls["users.list"], 0)
+        self.assertEqual(self.ks_client.calls["users.get"], 50)
+
+    def test_role_catalog_cached(self):
+        """
+        Roles are only listed once across many role lookups.
+        """
+        project, users = self._setup_project(10)
+        id_manager = user_store.IdentityManager()
+
+        id_manager.list_users(project.id)
+        id_manager.list_users(project.id)
+        for user in users:
+            id_manager.get_roles(user.id, project.id)
+        self.assertEqual(id_manager.find_role("member").name, "member")
+
+        self.assertEqual(self.ks_client.calls["roles.list"], 1)
+
+    def test_role_catalog_refresh_on_miss(self):
+        """
+        A role missing from the catalog triggers a refresh.
+        """
+        self._setup_project(1)
+        id_manager = user_store.IdentityManager()
+        self.assertEqual(id_manager.find_role("member").name, "member")
+
+        new_role = FakeRole(name="new_role")
+        fake_clients.identity_cache["roles"][new_role.id] = new_role
+
+        self.assertEqual(id_manager.find_role("new_role"), new_role)
+        self.assertIsNone(id_manager.find_role("missing_role"))
+        self.assertEqual(self.ks_client.calls["roles.list"], 3)
+
+        # a role that is still missing is remembered until the catalog expires
+        self.assertIsNone(id_manager.find_role("missing_role"))
+        self.assertEqual(id_manager.find_role("member").name, "member")
+        self.assertEqual(self.ks_client.calls["roles.list"], 3)
+
+    def test_role_catalog_invalidate(self):
+        """
+        Invalidating the catalog drops stale roles.
+        """
+        self._setup_project(1)
+        id_manager = user_store.IdentityManager()
+        old_member = id_manager.find_role("member")
+
+        for role_id, role in list(fake_clients.identity_cache["roles"].items()):
+            if role.name == "member":
+                del fake_clients.identity_cache["roles"][role_id]
+        new_member = FakeRole(name="member")
+        fake_clients.identity_cache["roles"][new_member.id] = new_member
+
+        self.assertEqual(id_manager.find_role("member"), old_member)
+        user_store.invalidate_role_cache()
+        self.assertEqual(id_manager.find_role("member"), new_member)
+
+    @conf_utils.modify_conf(
+        CONF,
+        operations={
+            "adjutant.identity.role_cache_ttl": [
+                {"operation": "override", "value": 0},
+            ],
+        },
+    )
+    def test_role_catalog_disabled(self):
+        """
+        A zero TTL lists the roles once for each IdentityManager, rather
+        than caching them between requests.
+        """
+        project, users = self._setup_project(10)
+        id_manager = user_store.IdentityManager()
+
+        id_manager.find_role("member")
+        id_manager.list_users(project.id)
+        self.assertEqual(self.ks_client.calls["roles.list"], 1)
+
+        user_store.IdentityManager().find_role("member")
+        self.assertEqual(self.ks_client.calls["roles.list"], 2)
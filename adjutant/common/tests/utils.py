@@ -15,6 +15,7 @@
 from django.test import TestCase
 from rest_framework.test import APITestCase
 
+from adjutant.common import quota
 from adjutant.common.tests import fake_clients
 
 
@@ -24,6 +25,8 @@ class AdjutantTestCase(TestCase):
         fake_clients.neutron_cache.clear()
         fake_clients.nova_cache.clear()
         fake_clients.cinder_cache.clear()
+        quota.invalidate_quota_cache()
+        quota.invalidate_quota_size_index()
 
 
 class AdjutantAPITestCase(APITestCase):
@@ -32,3 +35,5 @@ class AdjutantAPITestCase(APITestCase):
         fake_clients.neutron_cache.clear()
         fake_clients.nova_cache.clear()
         fake_clients.cinder_cache.clear()
+        quota.invalidate_quota_cache()
+        quota.invalidate_quota_size_index()
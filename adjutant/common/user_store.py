@@ -13,6 +13,9 @@
 #    under the License.
 
 from collections import defaultdict
+import math
+import threading
+import time
 
 from keystoneclient import exceptions as ks_exceptions
 
@@ -32,6 +35,96 @@ def subtree_ids_list(subtree, id_list=None):
     return id_list
 
 
+class RoleCatalog(object):
+    """
+    A process wide cache of the Keystone roles, indexed by id and by name.
+
+    Roles very rarely change, so rather than listing them on every call
+    the catalog is kept for 'identity.role_cache_ttl' seconds, and is
+    refreshed early if a role is asked for that isn't in it. A role that
+    still isn't there after that is remembered as missing until the
+    catalog expires, so asking for it again doesn't list the roles again.
+    """
+
+    def __init__(self, ttl=None):
+        # None to use 'identity.role_cache_ttl'
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._by_id = {}
+        self._by_name = {}
+        self._missing = set()
+        self._expires_at = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._by_id = {}
+            self._by_name = {}
+            self._missing = set()
+            self._expires_at = 0
+
+    def _lookup(self, ks_client, index, key):
+        with self._lock:
+            expired = time.monotonic() >= self._expires_at
+            if not expired:
+                role = getattr(self, index).get(key)
+                if role is not None or (index, key) in self._missing:
+                    return role
+
+        # list the roles without holding the lock, as it may be slow
+        roles = ks_client.roles.list()
+        ttl = CONF.identity.role_cache_ttl if self.ttl is None else self.ttl
+
+        with self._lock:
+            self._by_id = {role.id: role for role in roles}
+            self._by_name = {role.name: role for role in roles}
+            if expired:
+                self._missing = set()
+                self._expires_at = time.monotonic() + ttl
+            role = getattr(self, index).get(key)
+            if role is None:
+                self._missing.add((index, key))
+            return role
+
+    def get_by_id(self, ks_client, role_id):
+        return self._lookup(ks_client, "_by_id", role_id)
+
+    def get_by_name(self, ks_client, name):
+        return self._lookup(ks_client, "_by_name", name)
+
+
+role_catalog = RoleCatalog()
+
+
+def invalidate_role_cache():
+    """Drop the cached role catalog, forcing a refresh on next use."""
+    role_catalog.invalidate()
+
+
+_identity_manager_lock = threading.Lock()
+_identity_manager_count = 0
+
+
+def get_identity_manager(scope):
+    """
+    Get the IdentityManager bound to the given scope (usually a task),
+    constructing one on first use so that everything working within
+    that scope shares a single Keystone client.
+    """
+    global _identity_manager_count
+    with _identity_manager_lock:
+        id_manager = getattr(scope, "_identity_manager", None)
+        if id_manager is None:
+            id_manager = IdentityManager()
+            scope._identity_manager = id_manager
+            _identity_manager_count += 1
+    return id_manager
+
+
+def identity_manager_count():
+    """Number of IdentityManagers constructed via get_identity_manager."""
+    return _identity_manager_count
+
+
 # NOTE(adriant): I'm adding no cover here since this class can never be covered
 # by unit and non-tempest functional tests. This class only works when talking
 # to a real Keystone, so tests can never cover it.
@@ -49,6 +142,13 @@ class IdentityManager(object):  # pragma: no cover
         # throw errors if this is false.
         self.can_edit_users = CONF.identity.can_edit_users
 
+        if CONF.identity.role_cache_ttl:
+            self.role_catalog = role_catalog
+        else:
+            # Not cached between requests, but the roles are still only
+            # listed once for the life of this manager.
+            self.role_catalog = RoleCatalog(ttl=math.inf)
+
     def find_user(self, name, domain):
         try:
             users = self.ks_client.users.list(name=name, domain=domain)
@@ -67,6 +167,38 @@ class IdentityManager(object):  # pragma: no cover
             user = None
         return user
 
+    def _get_users(self, user_refs):
+        """
+        Resolve a dict of user_id to assignment user references
+        (as returned with ``include_names``) into user objects.
+
+        Users are grouped by their domain, and if it is enabled any
+        domain holding more users than 'identity.bulk_user_lookup_threshold'
+        is resolved with a single domain scoped listing rather than one
+        call per user. Users not found that way (or in smaller groups)
+        fall back to individual lookups.
+        """
+        threshold = CONF.identity.bulk_user_lookup_threshold
+        domains = defaultdict(set)
+        for user_id, user_ref in user_refs.items():
+            domain_id = (user_ref.get("domain") or {}).get("id")
+            domains[domain_id].add(user_id)
+
+        users = {}
+        for domain_id, user_ids in domains.items():
+            if domain_id and threshold and len(user_ids) > threshold:
+                for user in self.ks_client.users.list(domain=domain_id):
+                    if user.id in user_ids:
+                        users[user.id] = user
+
+            for user_id in user_ids - set(users):
+                try:
+                    users[user_id] = self.ks_client.users.get(user_id)
+                except ks_exceptions.NotFound:
+                    # Assignment for a user deleted since, so ignore it.
+                    pass
+        return users
+
     def list_users(self, project):
         """
         Build a list of users for a given project using
@@ -77,28 +209,35 @@ class IdentityManager(object):  # pragma: no cover
         in the given project. Saves further api calls later on.
         """
         try:
-            roles = self.ks_client.roles.list()
-            role_dict = {role.id: role for role in roles}
-
-            users = {}
-
-            user_assignments = self.ks_client.role_assignments.list(project=project)
-            for assignment in user_assignments:
+            user_refs = {}
+            user_assignments = []
+            for assignment in self.ks_client.role_assignments.list(
+                project=project, include_names=True
+            ):
                 try:
-                    user = users.get(assignment.user["id"], None)
-                    if not user:
-                        user = self.ks_client.users.get(assignment.user["id"])
-                        user.roles = []
-                        user.inherited_roles = []
-                        users[user.id] = user
-
-                    if assignment.scope.get("OS-INHERIT:inherited_to"):
-                        user.inherited_roles.append(role_dict[assignment.role["id"]])
-                    else:
-                        user.roles.append(role_dict[assignment.role["id"]])
+                    user_refs[assignment.user["id"]] = assignment.user
                 except AttributeError:
                     # Just means the assignment is a group, so ignore it.
-                    pass
+                    continue
+                user_assignments.append(assignment)
+
+            users = self._get_users(user_refs)
+            for user in users.values():
+                user.roles = []
+                user.inherited_roles = []
+
+            for assignment in user_assignments:
+                user = users.get(assignment.user["id"])
+                if not user:
+                    continue
+                role = self._get_role(assignment.role["id"])
+                if not role:
+                    # Role deleted since the assignments were listed.
+                    continue
+                if assignment.scope.get("OS-INHERIT:inherited_to"):
+                    user.inherited_roles.append(role)
+                else:
+                    user.roles.append(role)
         except ks_exceptions.NotFound:
             return []
         return users.values()
@@ -108,32 +247,35 @@ class IdentityManager(object):  # pragma: no cover
         Find all the users whose roles are inherited down to the given project.
         """
         try:
-            roles = self.ks_client.roles.list()
-            role_dict = {role.id: role for role in roles}
-
-            users = {}
+            user_refs = {}
+            user_assignments = []
 
             project = self.ks_client.projects.get(project)
             while project.parent_id:
                 project = self.ks_client.projects.get(project.parent_id)
-                user_assignments = self.ks_client.role_assignments.list(project=project)
-                for assignment in user_assignments:
+                for assignment in self.ks_client.role_assignments.list(
+                    project=project, include_names=True
+                ):
                     if not assignment.scope.get("OS-INHERIT:inherited_to"):
                         continue
                     try:
-                        user = users.get(assignment.user["id"], None)
-                        if user:
-                            user.roles.append(role_dict[assignment.role["id"]])
-                        else:
-                            user = self.ks_client.users.get(assignment.user["id"])
-                            user.roles = [
-                                role_dict[assignment.role["id"]],
-                            ]
-                            user.inherited_roles = []
-                            users[user.id] = user
+                        user_refs[assignment.user["id"]] = assignment.user
                     except AttributeError:
                         # Just means the assignment is a group.
-                        pass
+                        continue
+                    user_assignments.append(assignment)
+
+            users = self._get_users(user_refs)
+            for user in users.values():
+                user.roles = []
+                user.inherited_roles = []
+
+            for assignment in user_assignments:
+                user = users.get(assignment.user["id"])
+                role = self._get_role(assignment.role["id"])
+                if user and role:
+                    user.roles.append(role)
+
             for user in users.values():
                 user.roles = list(set(user.roles))
         except ks_exceptions.NotFound:
@@ -168,17 +310,13 @@ class IdentityManager(object):  # pragma: no cover
     def update_user_name(self, user, name):
         self.ks_client.users.update(user, name=name)
 
+    def _get_role(self, role_id):
+        return self.role_catalog.get_by_id(self.ks_client, role_id)
+
     def find_role(self, name):
-        try:
-            role = self.ks_client.roles.find(name=name)
-        except ks_exceptions.NotFound:
-            role = None
-        return role
+        return self.role_catalog.get_by_name(self.ks_client, name)
 
     def get_roles(self, user, project, inherited=False):
-        roles = self.ks_client.roles.list()
-        role_dict = {role.id: role for role in roles}
-
         user_roles = []
         user_assignments = self.ks_client.role_assignments.list(
             user=user, project=project
@@ -188,7 +326,9 @@ class IdentityManager(object):  # pragma: no cover
                 inherited and not assignment.scope.get("OS-INHERIT:inherited_to")
             ):
                 continue
-            user_roles.append(role_dict[assignment.role["id"]])
+            role = self._get_role(assignment.role["id"])
+            if role:
+                user_roles.append(role)
         return user_roles
 
     def get_all_roles(self, user):
@@ -197,14 +337,13 @@ class IdentityManager(object):  # pragma: no cover
 
         Uses the new v3 assignments api method to quickly do this.
         """
-        roles = self.ks_client.roles.list()
-        role_dict = {role.id: role for role in roles}
-
         user_assignments = self.ks_client.role_assignments.list(user=user)
         projects = defaultdict(list)
         for assignment in user_assignments:
             project = assignment.scope["project"]["id"]
-            projects[project].append(role_dict[assignment.role["id"]])
+            role = self._get_role(assignment.role["id"])
+            if role:
+                projects[project].append(role)
 
         return projects
 
@@ -47,5 +47,73 @@ config_group.register_child_config(
     )
 )
 
+config_group.register_child_config(
+    fields.BoolConfig(
+        "stream_list_responses",
+        help_text="Stream the unpaginated task, notification and token lists "
+        "rather than building the whole response in memory. The JSON returned "
+        "is the same either way.",
+        default=False,
+    )
+)
+config_group.register_child_config(
+    fields.IntConfig(
+        "stream_chunk_size",
+        help_text="How many rows to fetch from the database at a time when "
+        "streaming list responses.",
+        default=500,
+        min=1,
+    )
+)
+config_group.register_child_config(
+    fields.IntConfig(
+        "max_page_limit",
+        help_text="The largest limit that can be asked for when paging through "
+        "tasks, notifications and tokens with a marker. Larger limits are "
+        "rejected.",
+        default=1000,
+        min=1,
+    )
+)
+config_group.register_child_config(
+    fields.IntConfig(
+        "batch_max_tasks",
+        help_text="The most tasks that can be created, approved and cancelled "
+        "in one request to the task batch API.",
+        default=500,
+        min=1,
+    )
+)
+config_group.register_child_config(
+    fields.IntConfig(
+        "batch_chunk_size",
+        help_text="How many tasks the task batch API fetches from the "
+        "database at a time. Cancellations are also committed in chunks of "
+        "this size.",
+        default=50,
+        min=1,
+    )
+)
+config_group.register_child_config(
+    fields.ListConfig(
+        "batch_create_task_types",
+        help_text="The task types the task batch API can create. Tasks are "
+        "created from the given action data as is, without the permission "
+        "checks and data the delegate APIs add, so only list task types that "
+        "are safe to create that way.",
+        default=[],
+    )
+)
+config_group.register_child_config(
+    fields.IntConfig(
+        "batch_max_inline_approvals",
+        help_text="The most tasks the task batch API will approve in one "
+        "request when the task queue isn't enabled, as each approval then "
+        "runs while the request waits.",
+        default=10,
+        min=1,
+    )
+)
+
 delegate_apis_group = groups.ConfigGroup("delegate_apis", lazy_load=True)
 config_group.register_child_config(delegate_apis_group)
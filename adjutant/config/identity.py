@@ -41,6 +41,28 @@ config_group.register_child_config(
         default=True,
     )
 )
+config_group.register_child_config(
+    fields.IntConfig(
+        "role_cache_ttl",
+        help_text="Seconds to cache the Keystone role list for. "
+        "Unknown roles cause a refresh. Set to 0 to only list the roles once "
+        "per request.",
+        default=300,
+        min=0,
+    )
+)
+config_group.register_child_config(
+    fields.IntConfig(
+        "bulk_user_lookup_threshold",
+        help_text="Number of users from one domain above which the users of "
+        "a project are found by listing every user in that domain, rather "
+        "than fetching them one at a time. Listing a large or LDAP backed "
+        "domain can be very expensive, so only set this if your domains are "
+        "small. Set to 0 to always fetch users one at a time.",
+        default=0,
+        min=0,
+    )
+)
 config_group.register_child_config(
     fields.DictConfig(
         "role_mapping",
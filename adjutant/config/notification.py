@@ -13,8 +13,67 @@
 #    under the License.
 
 from confspirator import groups
+from confspirator import fields
 
 config_group = groups.ConfigGroup("notifications")
 
 handler_defaults_group = groups.ConfigGroup("handler_defaults", lazy_load=True)
 config_group.register_child_config(handler_defaults_group)
+
+_email_outbox_group = groups.ConfigGroup("email_outbox")
+config_group.register_child_config(_email_outbox_group)
+_email_outbox_group.register_child_config(
+    fields.BoolConfig(
+        "enabled",
+        help_text="Store task emails and email notifications in an outbox to "
+        "be sent by the 'process_emails' command, rather than sending them "
+        "while the API request waits.",
+        default=False,
+    )
+)
+_email_outbox_group.register_child_config(
+    fields.IntConfig(
+        "batch_size",
+        help_text="How many emails 'process_emails' sends over one connection "
+        "to the email server.",
+        default=50,
+        min=1,
+    )
+)
+_email_outbox_group.register_child_config(
+    fields.IntConfig(
+        "max_attempts",
+        help_text="How many times an email is tried before giving up on it "
+        "and raising an error notification for its task.",
+        default=5,
+        min=1,
+    )
+)
+_email_outbox_group.register_child_config(
+    fields.IntConfig(
+        "retry_delay",
+        help_text="Seconds to wait before trying a failed email again. "
+        "Doubled after each failed attempt.",
+        default=60,
+        min=0,
+    )
+)
+_email_outbox_group.register_child_config(
+    fields.IntConfig(
+        "claim_timeout",
+        help_text="Seconds after which an email that 'process_emails' started "
+        "sending, but never finished with, counts as a failed attempt. It is "
+        "then tried again, or given up on once out of attempts.",
+        default=600,
+        min=1,
+    )
+)
+_email_outbox_group.register_child_config(
+    fields.IntConfig(
+        "poll_interval",
+        help_text="Seconds 'process_emails' waits before checking an empty "
+        "outbox again.",
+        default=5,
+        min=1,
+    )
+)
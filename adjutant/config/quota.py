@@ -164,3 +164,37 @@ config_group.register_child_config(
         default={"*": ["cinder", "neutron", "nova"]},
     )
 )
+config_group.register_child_config(
+    fields.IntConfig(
+        "max_workers",
+        help_text="The maximum number of concurrent requests Adjutant will make "
+        "to services when reading or updating quotas across regions.",
+        default=10,
+        min=1,
+    )
+)
+config_group.register_child_config(
+    fields.IntConfig(
+        "service_timeout",
+        help_text="Seconds to wait for services to respond when reading quotas "
+        "concurrently. Services that don't respond in time are reported as "
+        "errors. Quota updates always wait for every service to finish, as a "
+        "slow update may still apply.",
+        default=30,
+        min=1,
+    )
+)
+config_group.register_child_config(
+    fields.IntConfig(
+        "snapshot_cache_ttl",
+        help_text="Seconds to reuse the quota and usage read from a service "
+        "for a project, so that validating and approving a quota change "
+        "doesn't fetch them again. The cache is kept in memory by each "
+        "process, so other API workers and the task queue worker may see "
+        "values up to this old. Changing a quota through Adjutant always "
+        "clears the cached values for that service in the process that made "
+        "the change. Set to 0 to disable.",
+        default=0,
+        min=0,
+    )
+)
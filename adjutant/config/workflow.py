@@ -37,6 +37,56 @@ config_group.register_child_config(
         default=24 * 60 * 60,  # 24hrs in seconds
     )
 )
+config_group.register_child_config(
+    fields.IntConfig(
+        "action_workers",
+        help_text="How many actions of a task stage can be run at once. Only "
+        "consecutive actions that are safe to run alongside each other for "
+        "that stage are run together, the rest are always run in order.",
+        default=1,
+        min=1,
+    )
+)
+
+
+_task_queue_group = groups.ConfigGroup("task_queue")
+config_group.register_child_config(_task_queue_group)
+_task_queue_group.register_child_config(
+    fields.BoolConfig(
+        "enabled",
+        help_text="Queue task approvals and token submissions to be run in the "
+        "background by the 'process_tasks' command, rather than running them "
+        "while the API request waits.",
+        default=False,
+    )
+)
+_task_queue_group.register_child_config(
+    fields.IntConfig(
+        "workers",
+        help_text="How many queued tasks 'process_tasks' runs at once.",
+        default=4,
+        min=1,
+    )
+)
+_task_queue_group.register_child_config(
+    fields.IntConfig(
+        "poll_interval",
+        help_text="Seconds a 'process_tasks' worker waits before checking an "
+        "empty queue again.",
+        default=2,
+        min=1,
+    )
+)
+_task_queue_group.register_child_config(
+    fields.IntConfig(
+        "job_timeout",
+        help_text="Seconds a running job can go without its 'process_tasks' "
+        "worker showing it is still alive before the job is failed. Workers "
+        "show this every third of the timeout while they run a job.",
+        default=300,
+        min=3,
+    )
+)
 
 
 def _build_default_email_group(
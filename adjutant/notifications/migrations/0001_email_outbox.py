@@ -0,0 +1,91 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:16
+
+import adjutant.tasks.models
+import django.db.models.deletion
+import django.utils.timezone
+import rest_framework.utils.encoders
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ("api", "0010_native_json_fields"),
+        ("tasks", "0009_taskjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OutboxEmail",
+            fields=[
+                (
+                    "uuid",
+                    models.CharField(
+                        default=adjutant.tasks.models.hex_uuid,
+                        max_length=32,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("error_text", models.CharField(max_length=200)),
+                ("subject", models.TextField()),
+                ("body", models.TextField(blank=True)),
+                ("from_email", models.CharField(max_length=254)),
+                (
+                    "to",
+                    models.JSONField(
+                        default=list, encoder=rest_framework.utils.encoders.JSONEncoder
+                    ),
+                ),
+                (
+                    "headers",
+                    models.JSONField(
+                        default=dict, encoder=rest_framework.utils.encoders.JSONEncoder
+                    ),
+                ),
+                (
+                    "alternatives",
+                    models.JSONField(
+                        default=list, encoder=rest_framework.utils.encoders.JSONEncoder
+                    ),
+                ),
+                ("state", models.CharField(default="queued", max_length=20)),
+                ("claimed_by", models.CharField(blank=True, default="", max_length=32)),
+                ("attempts", models.IntegerField(default=0)),
+                ("last_error", models.TextField(blank=True, default="")),
+                ("created_on", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "next_attempt_on",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("sent_on", models.DateTimeField(null=True)),
+                (
+                    "notification",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="api.notification",
+                    ),
+                ),
+                (
+                    "task",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="tasks.task"
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["state", "next_attempt_on"],
+                        name="notificatio_state_e354c4_idx",
+                    ),
+                    models.Index(
+                        fields=["claimed_by"], name="notificatio_claimed_17ffae_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,158 @@
+# Copyright (C) 2026 Catalyst Cloud Ltd
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from datetime import timedelta
+
+from django.core.mail import EmailMultiAlternatives
+from django.db import models
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+
+from adjutant.api.models import Notification
+from adjutant.tasks.models import Task, hex_uuid
+
+
+class OutboxEmail(models.Model):
+    """
+    An email rendered during a task, queued to be sent by the
+    process_emails command rather than during the API request.
+    """
+
+    uuid = models.CharField(max_length=32, default=hex_uuid, primary_key=True)
+    task = models.ForeignKey(Task, on_delete=models.CASCADE)
+    # the notification this email is sending, if it is one:
+    notification = models.ForeignKey(Notification, null=True, on_delete=models.CASCADE)
+    # what the email was for, used in the error if it can't be sent:
+    error_text = models.CharField(max_length=200)
+
+    subject = models.TextField()
+    body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=254)
+    to = models.JSONField(default=list, encoder=JSONEncoder)
+    headers = models.JSONField(default=dict, encoder=JSONEncoder)
+    # list of [content, mimetype]:
+    alternatives = models.JSONField(default=list, encoder=JSONEncoder)
+
+    # "queued", "sending", "sent", or "failed" once out of attempts
+    state = models.CharField(max_length=20, default="queued")
+    claimed_by = models.CharField(max_length=32, default="", blank=True)
+    claimed_on = models.DateTimeField(null=True)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(default="", blank=True)
+
+    created_on = models.DateTimeField(default=timezone.now)
+    next_attempt_on = models.DateTimeField(default=timezone.now)
+    sent_on = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["state", "next_attempt_on"]),
+            models.Index(fields=["claimed_by"]),
+        ]
+
+    @classmethod
+    def queue(cls, task, email, error_text, notification=None):
+        """Store an EmailMultiAlternatives to be sent later."""
+        return cls.objects.create(
+            task=task,
+            notification=notification,
+            error_text=error_text,
+            subject=email.subject,
+            body=email.body,
+            from_email=email.from_email,
+            to=list(email.to),
+            headers=email.extra_headers,
+            alternatives=[list(alternative) for alternative in email.alternatives],
+        )
+
+    @classmethod
+    def claim_due(cls, count):
+        """
+        Mark up to count of the queued emails that are due as being sent,
+        and return them. Safe to call from many senders at once, as only
+        one of them can move an email out of the queued state.
+        """
+        now = timezone.now()
+        due = cls.objects.filter(state="queued", next_attempt_on__lte=now).order_by(
+            "next_attempt_on"
+        )
+        uuids = list(due.values_list("uuid", flat=True)[:count])
+        if not uuids:
+            return []
+        claim = hex_uuid()
+        cls.objects.filter(uuid__in=uuids, state="queued").update(
+            state="sending", claimed_by=claim, claimed_on=now
+        )
+        return list(
+            cls.objects.filter(claimed_by=claim)
+            .select_related("task", "notification")
+            .order_by("next_attempt_on")
+        )
+
+    @classmethod
+    def claim_stale(cls, claim_timeout):
+        """
+        Take over and return the emails still being sent more than
+        claim_timeout seconds after they were claimed, as their sender
+        has likely been stopped. They should be marked as failed.
+        """
+        now = timezone.now()
+        claim = hex_uuid()
+        cls.objects.filter(
+            state="sending", claimed_on__lt=now - timedelta(seconds=claim_timeout)
+        ).update(claimed_by=claim, claimed_on=now)
+        return list(
+            cls.objects.filter(claimed_by=claim, state="sending").select_related(
+                "task", "notification"
+            )
+        )
+
+    def message(self, connection=None):
+        email = EmailMultiAlternatives(
+            self.subject,
+            self.body,
+            self.from_email,
+            self.to,
+            headers=self.headers,
+            connection=connection,
+        )
+        for content, mimetype in self.alternatives:
+            email.attach_alternative(content, mimetype)
+        return email
+
+    def mark_sent(self):
+        self.state = "sent"
+        self.sent_on = timezone.now()
+        # don't keep token links and the like around
+        self.body = ""
+        self.alternatives = []
+        self.save()
+
+    def mark_failed(self, error, max_attempts, retry_delay):
+        """
+        Record a failed attempt, and queue the email to be tried again
+        after a delay that doubles each time. Returns True once the email
+        is out of attempts, and won't be tried again.
+        """
+        self.attempts += 1
+        self.last_error = str(error)
+        if self.attempts >= max_attempts:
+            self.state = "failed"
+        else:
+            self.state = "queued"
+            self.next_attempt_on = timezone.now() + timedelta(
+                seconds=retry_delay * 2 ** (self.attempts - 1)
+            )
+        self.save()
+        return self.state == "failed"
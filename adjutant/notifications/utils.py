@@ -12,8 +12,16 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from logging import getLogger
+
+from django.core.mail import get_connection
+
 from adjutant import notifications
 from adjutant.api.models import Notification
+from adjutant.config import CONF
+from adjutant.notifications.models import OutboxEmail
+
+LOG = getLogger("adjutant")
 
 
 def create_notification(task, notes, error=False, handlers=True):
@@ -36,3 +44,80 @@ def create_notification(task, notes, error=False, handlers=True):
             handler.notify(task, notification)
 
     return notification
+
+
+def deliver_email(task, email, error_text, notification=None):
+    """
+    Send an email for a task, or if the email outbox is enabled, store
+    it to be sent by the process_emails command instead.
+
+    Returns True if the email was sent, or False if it was queued.
+    """
+    if CONF.notifications.email_outbox.enabled:
+        OutboxEmail.queue(task, email, error_text, notification)
+        return False
+    email.send(fail_silently=False)
+    return True
+
+
+def send_queued_emails():
+    """
+    Send a batch of the emails in the outbox that are due, all over one
+    connection to the email server. Returns how many were tried.
+    """
+    conf = CONF.notifications.email_outbox
+    for outbox_email in OutboxEmail.claim_stale(conf.claim_timeout):
+        _email_failed(outbox_email, TimeoutError("The sender stopped responding."))
+
+    emails = OutboxEmail.claim_due(conf.batch_size)
+    if not emails:
+        return 0
+
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        for outbox_email in emails:
+            _email_failed(outbox_email, e)
+        return len(emails)
+
+    try:
+        for outbox_email in emails:
+            try:
+                connection.send_messages([outbox_email.message(connection)])
+            except Exception as e:
+                _email_failed(outbox_email, e)
+                continue
+            outbox_email.mark_sent()
+            if outbox_email.notification:
+                outbox_email.notification.acknowledged = True
+                outbox_email.notification.save()
+    finally:
+        connection.close()
+    return len(emails)
+
+
+def _email_failed(outbox_email, error):
+    conf = CONF.notifications.email_outbox
+    task = outbox_email.task
+    LOG.warning(
+        "Failed to send email (%s) for task (%s): %s"
+        % (outbox_email.uuid, task.uuid, error)
+    )
+    if not outbox_email.mark_failed(error, conf.max_attempts, conf.retry_delay):
+        return
+
+    notes = {
+        "errors": [
+            "Error: '%s' %s for task: %s" % (error, outbox_email.error_text, task.uuid)
+        ]
+    }
+    if outbox_email.notification:
+        # don't try to notify anyone that a notification couldn't be sent
+        create_notification(task, notes, error=True, handlers=False)
+    elif error.__class__.__name__ in task.config.notifications.safe_errors:
+        notification = create_notification(task, notes, error=True, handlers=False)
+        notification.acknowledged = True
+        notification.save()
+    else:
+        create_notification(task, notes, error=True)
@@ -25,6 +25,7 @@ from confspirator import types
 from adjutant.config import CONF
 from adjutant.common import constants
 from adjutant.api.models import Notification
+from adjutant.notifications.utils import deliver_email
 from adjutant.notifications.v1 import base
 
 
@@ -131,9 +132,11 @@ class EmailNotification(base.BaseNotificationHandler):
             if html_template:
                 email.attach_alternative(html_template.render(context), "text/html")
 
-            email.send(fail_silently=False)
-            notification.acknowledged = True
-            notification.save()
+            if deliver_email(
+                task, email, "while sending email notification", notification
+            ):
+                notification.acknowledged = True
+                notification.save()
         except SMTPException as e:
             notes = {"errors": [("Error: '%s' while sending email notification") % e]}
             error_notification = Notification.objects.create(
@@ -12,13 +12,19 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from datetime import timedelta
+from smtplib import SMTPException
 from unittest import mock
 
 from confspirator.tests import utils as conf_utils
 from django.core import mail
+from django.core.mail import get_connection
+from django.core.management import call_command
+from django.utils import timezone
 from rest_framework import status
 
 from adjutant.api.models import Notification
+from adjutant.notifications.models import OutboxEmail
 from adjutant.tasks.models import Task
 from adjutant.common.tests.fake_clients import FakeManager, setup_identity_cache
 from adjutant.common.tests.utils import AdjutantAPITestCase
@@ -110,3 +116,204 @@ class NotificationTests(AdjutantAPITestCase):
         self.assertEqual(notif.task.uuid, new_task.uuid)
         self.assertTrue(notif.error)
         self.assertTrue(notif.acknowledged)
+
+    @conf_utils.modify_conf(
+        CONF,
+        operations={
+            "adjutant.notifications.email_outbox.enabled": [
+                {"operation": "override", "value": True},
+            ],
+        },
+    )
+    def test_email_outbox(self):
+        """
+        With the email outbox enabled, task emails and notifications are
+        stored, and sent together by the process_emails command.
+        """
+        setup_identity_cache()
+
+        url = "/v1/openstack/sign-up"
+        for i in range(2):
+            data = {"project_name": "project_%s" % i, "email": "user%s@example.com" % i}
+            response = self.client.post(url, data, format="json")
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboxEmail.objects.filter(state="queued").count(), 4)
+        self.assertFalse(Notification.objects.filter(acknowledged=True).exists())
+
+        with mock.patch(
+            "adjutant.notifications.utils.get_connection", wraps=get_connection
+        ) as mocked_connection:
+            call_command("process_emails", once=True)
+
+        self.assertEqual(mocked_connection.call_count, 1)
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertEqual(
+            sorted(email.to[0] for email in mail.outbox),
+            [
+                "example_notification@example.com",
+                "example_notification@example.com",
+                "user0@example.com",
+                "user1@example.com",
+            ],
+        )
+        self.assertEqual(OutboxEmail.objects.filter(state="sent").count(), 4)
+        self.assertFalse(OutboxEmail.objects.exclude(body="").exists())
+        self.assertFalse(Notification.objects.filter(acknowledged=False).exists())
+
+    @conf_utils.modify_conf(
+        CONF,
+        operations={
+            "adjutant.notifications.email_outbox.enabled": [
+                {"operation": "override", "value": True},
+            ],
+            "adjutant.notifications.email_outbox.max_attempts": [
+                {"operation": "override", "value": 3},
+            ],
+            "adjutant.notifications.email_outbox.retry_delay": [
+                {"operation": "override", "value": 0},
+            ],
+        },
+    )
+    def test_email_outbox_dead_letter(self):
+        """
+        An email that keeps failing is retried, then given up on with an
+        error notification.
+        """
+        setup_identity_cache()
+
+        url = "/v1/openstack/sign-up"
+        data = {"project_name": "test_project", "email": "test@example.com"}
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        new_task = Task.objects.all()[0]
+
+        with mock.patch(
+            "django.core.mail.backends.locmem.EmailBackend.send_messages",
+            side_effect=SMTPException("Server unavailable"),
+        ) as mocked_send:
+            call_command("process_emails", once=True)
+
+        # both emails were tried three times
+        self.assertEqual(mocked_send.call_count, 6)
+        self.assertEqual(len(mail.outbox), 0)
+        for outbox_email in OutboxEmail.objects.all():
+            self.assertEqual(outbox_email.state, "failed")
+            self.assertEqual(outbox_email.attempts, 3)
+            self.assertEqual(outbox_email.last_error, "Server unavailable")
+
+        errors = Notification.objects.filter(task=new_task, error=True)
+        self.assertEqual(
+            sorted((error.notes["errors"], error.acknowledged) for error in errors),
+            [
+                (
+                    [
+                        "Error: 'Server unavailable' while emailing update for "
+                        "task: %s" % new_task.uuid
+                    ],
+                    # SMTPException is a safe error by default
+                    True,
+                ),
+                (
+                    [
+                        "Error: 'Server unavailable' while sending email "
+                        "notification for task: %s" % new_task.uuid
+                    ],
+                    False,
+                ),
+            ],
+        )
+        # nothing is sent about the failures
+        self.assertFalse(OutboxEmail.objects.filter(state="queued").exists())
+
+    @conf_utils.modify_conf(
+        CONF,
+        operations={
+            "adjutant.notifications.email_outbox.enabled": [
+                {"operation": "override", "value": True},
+            ],
+            "adjutant.notifications.email_outbox.claim_timeout": [
+                {"operation": "override", "value": 60},
+            ],
+            "adjutant.notifications.email_outbox.retry_delay": [
+                {"operation": "override", "value": 0},
+            ],
+        },
+    )
+    def test_email_outbox_stale_claim(self):
+        """
+        Emails left being sent by a sender that stopped count as a failed
+        attempt once they have been claimed for longer than the timeout,
+        and are tried again.
+        """
+        setup_identity_cache()
+
+        url = "/v1/openstack/sign-up"
+        data = {"project_name": "test_project", "email": "test@example.com"}
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        # a sender claims both emails and is then killed
+        claimed = OutboxEmail.claim_due(10)
+        self.assertEqual(len(claimed), 2)
+        stale, recent = claimed
+        OutboxEmail.objects.filter(uuid=stale.uuid).update(
+            claimed_on=timezone.now() - timedelta(seconds=120)
+        )
+
+        call_command("process_emails", once=True)
+
+        self.assertEqual(len(mail.outbox), 1)
+        stale = OutboxEmail.objects.get(uuid=stale.uuid)
+        self.assertEqual(stale.state, "sent")
+        self.assertEqual(stale.attempts, 1)
+        # the recently claimed email is left to its sender
+        recent = OutboxEmail.objects.get(uuid=recent.uuid)
+        self.assertEqual(recent.state, "sending")
+        self.assertEqual(recent.attempts, 0)
+
+    @conf_utils.modify_conf(
+        CONF,
+        operations={
+            "adjutant.notifications.email_outbox.enabled": [
+                {"operation": "override", "value": True},
+            ],
+            "adjutant.notifications.email_outbox.claim_timeout": [
+                {"operation": "override", "value": 60},
+            ],
+            "adjutant.notifications.email_outbox.max_attempts": [
+                {"operation": "override", "value": 1},
+            ],
+        },
+    )
+    def test_email_outbox_stale_claim_dead_letter(self):
+        """
+        An email whose sender keeps being stopped is given up on once it
+        is out of attempts, raising an error notification for its task.
+        """
+        setup_identity_cache()
+
+        url = "/v1/openstack/sign-up"
+        data = {"project_name": "test_project", "email": "test@example.com"}
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        new_task = Task.objects.all()[0]
+
+        claimed = OutboxEmail.claim_due(10)
+        self.assertEqual(len(claimed), 2)
+        OutboxEmail.objects.update(claimed_on=timezone.now() - timedelta(seconds=120))
+
+        call_command("process_emails", once=True)
+
+        for outbox_email in claimed:
+            outbox_email.refresh_from_db()
+            self.assertEqual(outbox_email.state, "failed")
+            self.assertEqual(outbox_email.attempts, 1)
+            self.assertEqual(outbox_email.last_error, "The sender stopped responding.")
+
+        errors = Notification.objects.filter(task=new_task, error=True)
+        self.assertEqual(errors.count(), 2)
+        for error in errors:
+            self.assertEqual(len(error.notes["errors"]), 1)
+            self.assertIn("The sender stopped responding.", error.notes["errors"][0])
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0002_auto_20190619_0613"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                fields=["created_on", "uuid"], name="tasks_task_created_0fbfd4_idx"
+            ),
+        ),
+    ]
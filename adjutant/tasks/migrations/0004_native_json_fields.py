@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:59
+
+import rest_framework.utils.encoders
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0003_task_created_on_uuid_idx"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="task",
+            name="action_notes",
+            field=models.JSONField(
+                default=dict, encoder=rest_framework.utils.encoders.JSONEncoder
+            ),
+        ),
+        migrations.AlterField(
+            model_name="task",
+            name="approved_by",
+            field=models.JSONField(
+                default=dict, encoder=rest_framework.utils.encoders.JSONEncoder
+            ),
+        ),
+        migrations.AlterField(
+            model_name="task",
+            name="keystone_user",
+            field=models.JSONField(
+                default=dict, encoder=rest_framework.utils.encoders.JSONEncoder
+            ),
+        ),
+        migrations.AlterField(
+            model_name="task",
+            name="task_notes",
+            field=models.JSONField(
+                default=list, encoder=rest_framework.utils.encoders.JSONEncoder
+            ),
+        ),
+    ]
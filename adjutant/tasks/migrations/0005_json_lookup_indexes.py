@@ -0,0 +1,41 @@
+from django.db import migrations
+
+# Index the JSON keys most often filtered on. These rely on the jsonb
+# operators, so they are only created on PostgreSQL.
+INDEXES = [
+    (
+        "tasks_task_keystone_user_gin",
+        'CREATE INDEX IF NOT EXISTS "tasks_task_keystone_user_gin" '
+        'ON "tasks_task" USING gin ("keystone_user")',
+    ),
+    (
+        "tasks_task_ks_username_idx",
+        'CREATE INDEX IF NOT EXISTS "tasks_task_ks_username_idx" '
+        'ON "tasks_task" (("keystone_user" -> \'username\'))',
+    ),
+]
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, sql in INDEXES:
+        schema_editor.execute(sql)
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, sql in INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS "%s"' % name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0004_native_json_fields"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+
+def backfill_target_fields(apps, schema_editor):
+    """Fill in the target fields of pending tasks from their actions."""
+    Task = apps.get_model("tasks", "Task")
+    Action = apps.get_model("actions", "Action")
+
+    pending_tasks = Task.objects.filter(completed=False, cancelled=False)
+    for task in pending_tasks.iterator():
+        targets = {}
+        for action in Action.objects.filter(task=task).order_by("order"):
+            if not isinstance(action.action_data, dict):
+                continue
+            for key in ["email", "username", "user_id"]:
+                value = action.action_data.get(key)
+                if value and not targets.get(key):
+                    targets[key] = value
+
+        if not targets:
+            continue
+
+        task.target_email = targets.get("email")
+        task.target_username = targets.get("username")
+        task.target_user_id = targets.get("user_id")
+        task.save(update_fields=["target_email", "target_username", "target_user_id"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("actions", "0006_native_json_fields"),
+        ("tasks", "0006_task_target_fields"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_target_fields, migrations.RunPython.noop),
+    ]
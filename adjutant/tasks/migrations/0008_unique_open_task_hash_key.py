@@ -0,0 +1,93 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:02
+
+from logging import getLogger
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def cancel_open_duplicates(apps, schema_editor):
+    """
+    Cancel the unapproved duplicates of each open task, so only one
+    open task is left for each hash_key.
+
+    Approved tasks may have sent their users a token, so they are never
+    cancelled here. Where a hash_key has more than one approved open
+    task, the migration fails listing them, to be resolved by hand.
+    """
+    Task = apps.get_model("tasks", "Task")
+    Token = apps.get_model("api", "Token")
+    logger = getLogger("adjutant")
+
+    open_tasks = Task.objects.filter(completed=False, cancelled=False).exclude(
+        hash_key=""
+    )
+    duplicate_keys = list(
+        open_tasks.values("hash_key")
+        .annotate(count=models.Count("uuid"))
+        .filter(count__gt=1)
+        .values_list("hash_key", flat=True)
+    )
+
+    conflicts = (
+        open_tasks.filter(hash_key__in=duplicate_keys, approved=True)
+        .values("hash_key")
+        .annotate(count=models.Count("uuid"))
+        .filter(count__gt=1)
+        .values_list("hash_key", flat=True)
+    )
+    if conflicts:
+        raise RuntimeError(
+            "Can't add the unique open task constraint, as these hash_keys "
+            "have more than one approved open task: %s. Cancel all but one "
+            "of the tasks for each, then run the migration again."
+            % ", ".join(sorted(conflicts))
+        )
+
+    now = timezone.now()
+    for hash_key in duplicate_keys:
+        # Keep the approved task if there is one, otherwise the newest.
+        tasks = list(
+            open_tasks.filter(hash_key=hash_key).order_by("-approved", "-created_on")
+        )
+        older_tasks = tasks[1:]
+        for task in older_tasks:
+            task.task_notes.append(
+                "Task cancelled because was an old duplicate. - (%s)" % now
+            )
+            task.cancelled = True
+        tokens = Token.objects.filter(task__in=older_tasks)
+        logger.warning(
+            "Cancelled duplicate tasks %s of task %s, removing %s tokens."
+            % (
+                ", ".join(task.uuid for task in older_tasks),
+                tasks[0].uuid,
+                tokens.count(),
+            )
+        )
+        tokens.delete()
+        Task.objects.bulk_update(older_tasks, ["cancelled", "task_notes"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0010_native_json_fields"),
+        ("tasks", "0007_backfill_task_target_fields"),
+    ]
+
+    operations = [
+        migrations.RunPython(cancel_open_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="task",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(
+                    ("cancelled", False),
+                    ("completed", False),
+                    models.Q(("hash_key", ""), _negated=True),
+                ),
+                fields=("hash_key",),
+                name="unique_open_task_hash_key",
+            ),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:05
+
+import adjutant.tasks.models
+import django.db.models.deletion
+import django.utils.timezone
+import rest_framework.utils.encoders
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0008_unique_open_task_hash_key"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TaskJob",
+            fields=[
+                (
+                    "uuid",
+                    models.CharField(
+                        default=adjutant.tasks.models.hex_uuid,
+                        max_length=32,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("stage", models.CharField(max_length=20)),
+                (
+                    "data",
+                    models.JSONField(
+                        default=dict, encoder=rest_framework.utils.encoders.JSONEncoder
+                    ),
+                ),
+                ("state", models.CharField(default="queued", max_length=20)),
+                ("error", models.TextField(blank=True, default="")),
+                ("created_on", models.DateTimeField(default=django.utils.timezone.now)),
+                ("started_on", models.DateTimeField(null=True)),
+                ("finished_on", models.DateTimeField(null=True)),
+                (
+                    "task",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="tasks.task"
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["state", "created_on"],
+                        name="tasks_taskj_state_3960fe_idx",
+                    ),
+                    models.Index(
+                        fields=["task", "state"], name="tasks_taskj_task_id_61533f_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
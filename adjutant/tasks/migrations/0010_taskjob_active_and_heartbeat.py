@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:37
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def prepare_active_jobs(apps, schema_editor):
+    """
+    Give running jobs a heartbeat so they can be found if stale, and
+    cancel all but the newest active job of each task.
+    """
+    TaskJob = apps.get_model("tasks", "TaskJob")
+
+    running_jobs = TaskJob.objects.filter(state="running")
+    running_jobs.update(heartbeat_on=models.F("started_on"))
+
+    active_jobs = TaskJob.objects.filter(state__in=["queued", "running"])
+    duplicate_tasks = (
+        active_jobs.values("task")
+        .annotate(count=models.Count("uuid"))
+        .filter(count__gt=1)
+        .values_list("task", flat=True)
+    )
+    now = timezone.now()
+    for task_id in list(duplicate_tasks):
+        older_jobs = list(
+            active_jobs.filter(task_id=task_id)
+            .order_by("-created_on")
+            .values_list("uuid", flat=True)
+        )[1:]
+        TaskJob.objects.filter(uuid__in=older_jobs).update(
+            state="cancelled", data={}, finished_on=now
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0009_taskjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="taskjob",
+            name="heartbeat_on",
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(prepare_active_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="taskjob",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("state__in", ["queued", "running"])),
+                fields=("task",),
+                name="unique_active_task_job",
+            ),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0010_taskjob_active_and_heartbeat"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="taskjob",
+            name="token_hash",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name="taskjob",
+            index=models.Index(
+                fields=["token_hash", "created_on"],
+                name="tasks_taskj_token_h_21cd4d_idx",
+            ),
+        ),
+    ]
@@ -12,11 +12,16 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from contextlib import contextmanager
+from datetime import timedelta
+import hashlib
+
 from django.db import models
 from uuid import uuid4
 from django.utils import timezone
-from jsonfield import JSONField
+from rest_framework.utils.encoders import JSONEncoder
 
+from adjutant.actions.models import Action
 from adjutant.config import CONF
 from adjutant import exceptions
 from adjutant import tasks
@@ -26,6 +31,30 @@ def hex_uuid():
     return uuid4().hex
 
 
+class TaskQuerySet(models.QuerySet):
+    def with_actions(self):
+        """Prefetch the actions of every task, in order."""
+        return self.prefetch_related(
+            models.Prefetch("action_set", queryset=Action.objects.order_by("order"))
+        )
+
+    def for_dict(self, fields=None):
+        """
+        Fetch only what Task.to_dict needs for the given fields, leaving
+        out the actions entirely unless they are asked for.
+        """
+        if fields is None:
+            return self.with_actions()
+
+        # NOTE: created_on is always needed to order and page tasks.
+        model_fields = {"uuid", "created_on"}
+        model_fields.update(field for field in fields if field != "actions")
+        tasks = self.only(*model_fields)
+        if "actions" in fields:
+            tasks = tasks.with_actions()
+        return tasks
+
+
 class Task(models.Model):
     """
     Wrapper object for the request and related actions.
@@ -37,20 +66,26 @@ class Task(models.Model):
     hash_key = models.CharField(max_length=64)
 
     # who is this:
-    keystone_user = JSONField(default={})
+    keystone_user = models.JSONField(default=dict, encoder=JSONEncoder)
     project_id = models.CharField(max_length=64, null=True)
 
     # keystone_user for the approver:
-    approved_by = JSONField(default={})
+    approved_by = models.JSONField(default=dict, encoder=JSONEncoder)
 
     # type of the task, for easy grouping
     task_type = models.CharField(max_length=100)
 
+    # who the task is about, taken from the action data on creation so
+    # tasks can be looked up by user without reading the action data:
+    target_email = models.CharField(max_length=255, null=True, db_index=True)
+    target_username = models.CharField(max_length=255, null=True, db_index=True)
+    target_user_id = models.CharField(max_length=64, null=True, db_index=True)
+
     # task level notes
-    task_notes = JSONField(default=[])
+    task_notes = models.JSONField(default=list, encoder=JSONEncoder)
 
     # Effectively a log of what the actions are doing.
-    action_notes = JSONField(default={})
+    action_notes = models.JSONField(default=dict, encoder=JSONEncoder)
 
     cancelled = models.BooleanField(default=False)
     approved = models.BooleanField(default=False)
@@ -60,6 +95,8 @@ class Task(models.Model):
     approved_on = models.DateTimeField(null=True)
     completed_on = models.DateTimeField(null=True)
 
+    objects = TaskQuerySet.as_manager()
+
     class Meta:
         indexes = [
             models.Index(fields=["completed"], name="completed_idx"),
@@ -68,12 +105,43 @@ class Task(models.Model):
             models.Index(fields=["project_id", "task_type", "cancelled"]),
             models.Index(fields=["project_id", "task_type", "completed", "cancelled"]),
             models.Index(fields=["hash_key", "completed", "cancelled"]),
+            models.Index(fields=["created_on", "uuid"]),
+        ]
+        constraints = [
+            # Stops concurrent requests creating the same open task twice.
+            models.UniqueConstraint(
+                fields=["hash_key"],
+                condition=models.Q(completed=False, cancelled=False)
+                & ~models.Q(hash_key=""),
+                name="unique_open_task_hash_key",
+            ),
         ]
 
+    # The fields returned by to_dict, in order.
+    dict_fields = (
+        "uuid",
+        "keystone_user",
+        "approved_by",
+        "project_id",
+        "actions",
+        "task_type",
+        "task_notes",
+        "action_notes",
+        "cancelled",
+        "approved",
+        "completed",
+        "created_on",
+        "approved_on",
+        "completed_on",
+    )
+
     def __init__(self, *args, **kwargs):
         super(Task, self).__init__(*args, **kwargs)
         # in memory dict to be used for passing data between actions:
         self.cache = {}
+        # note fields changed while notes are being buffered:
+        self._unsaved_note_fields = set()
+        self._note_buffer_depth = 0
 
     def get_task(self):
         """Returns self as the appropriate task wrapper type."""
@@ -97,6 +165,9 @@ class Task(models.Model):
 
     @property
     def actions(self):
+        if "action_set" in getattr(self, "_prefetched_objects_cache", {}):
+            # Already fetched in order by TaskQuerySet.with_actions
+            return self.action_set.all()
         return self.action_set.order_by("order")
 
     @property
@@ -107,7 +178,7 @@ class Task(models.Model):
     def notifications(self):
         return self.notification_set.all()
 
-    def to_dict(self):
+    def _actions_dict(self):
         actions = []
         for action in self.actions:
             actions.append(
@@ -117,31 +188,166 @@ class Task(models.Model):
                     "valid": action.valid,
                 }
             )
+        return actions
 
-        return {
-            "uuid": self.uuid,
-            "keystone_user": self.keystone_user,
-            "approved_by": self.approved_by,
-            "project_id": self.project_id,
-            "actions": actions,
-            "task_type": self.task_type,
-            "task_notes": self.task_notes,
-            "action_notes": self.action_notes,
-            "cancelled": self.cancelled,
-            "approved": self.approved,
-            "completed": self.completed,
-            "created_on": self.created_on,
-            "approved_on": self.approved_on,
-            "completed_on": self.completed_on,
-        }
+    def to_dict(self, fields=None):
+        """
+        The task as a dict, limited to the given fields if any are given.
+        """
+        if fields is None:
+            fields = self.dict_fields
+
+        task_dict = {}
+        for field in fields:
+            if field == "actions":
+                task_dict[field] = self._actions_dict()
+            else:
+                task_dict[field] = getattr(self, field)
+        return task_dict
+
+    def save(self, *args, **kwargs):
+        super(Task, self).save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None:
+            self._unsaved_note_fields.clear()
+        else:
+            self._unsaved_note_fields.difference_update(update_fields)
+
+    def _save_notes(self, field):
+        self._unsaved_note_fields.add(field)
+        if not self._note_buffer_depth:
+            self.flush_notes()
+
+    def flush_notes(self):
+        """Save any buffered notes, and only the notes."""
+        if self._unsaved_note_fields:
+            self.save(update_fields=sorted(self._unsaved_note_fields))
+
+    @contextmanager
+    def buffered_notes(self):
+        """
+        Hold off saving notes until the end of the block, so that
+        adding many notes during a stage is one small UPDATE rather
+        than a save of the whole task for each of them.
+        """
+        self._note_buffer_depth += 1
+        try:
+            yield
+        finally:
+            self._note_buffer_depth -= 1
+            if not self._note_buffer_depth:
+                self.flush_notes()
 
     def add_task_note(self, note):
         self.task_notes.append(note)
-        self.save()
+        self._save_notes("task_notes")
 
     def add_action_note(self, action, note):
-        if action in self.action_notes:
-            self.action_notes[action].append(note)
-        else:
-            self.action_notes[action] = [note]
-        self.save()
+        self.action_notes.setdefault(action, []).append(note)
+        self._save_notes("action_notes")
+
+
+class TaskJob(models.Model):
+    """
+    A task stage queued to be run in the background by the
+    process_tasks command, rather than during the API request.
+    """
+
+    uuid = models.CharField(max_length=32, default=hex_uuid, primary_key=True)
+    task = models.ForeignKey(Task, on_delete=models.CASCADE)
+    # the task stage to run, "approve" or "submit":
+    stage = models.CharField(max_length=20)
+    # what the stage is run with, cleared once it has finished:
+    data = models.JSONField(default=dict, encoder=JSONEncoder)
+    # "queued", "running", "completed", "failed" or "cancelled"
+    state = models.CharField(max_length=20, default="queued")
+    error = models.TextField(default="", blank=True)
+    # a hash of the token a submit stage was queued with, so the submitter
+    # can look up the job by their token:
+    token_hash = models.CharField(max_length=64, default="", blank=True)
+
+    created_on = models.DateTimeField(default=timezone.now)
+    started_on = models.DateTimeField(null=True)
+    # when the worker running the job last showed it was still alive:
+    heartbeat_on = models.DateTimeField(null=True)
+    finished_on = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["state", "created_on"]),
+            models.Index(fields=["task", "state"]),
+            models.Index(fields=["token_hash", "created_on"]),
+        ]
+        constraints = [
+            # Stops concurrent requests queueing the same task twice. Not
+            # enforced on MySQL, which doesn't support conditional unique
+            # constraints, so TaskManager also checks for an active job.
+            models.UniqueConstraint(
+                fields=["task"],
+                condition=models.Q(state__in=["queued", "running"]),
+                name="unique_active_task_job",
+            ),
+        ]
+
+    @staticmethod
+    def hash_token(token):
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def claim_next(cls):
+        """
+        Mark the oldest queued job as running and return it, or None if
+        the queue is empty. Safe to call from many workers at once, as
+        only one of them can move a job out of the queued state.
+        """
+        cls.fail_stale()
+        queued = cls.objects.filter(state="queued").order_by("created_on")
+        for uuid in queued.values_list("uuid", flat=True)[:10]:
+            now = timezone.now()
+            claimed = cls.objects.filter(uuid=uuid, state="queued").update(
+                state="running", started_on=now, heartbeat_on=now
+            )
+            if claimed:
+                return cls.objects.get(uuid=uuid)
+        return None
+
+    @classmethod
+    def fail_stale(cls):
+        """
+        Fail the running jobs whose worker hasn't shown it is alive for
+        'workflow.task_queue.job_timeout' seconds, as it has likely been
+        stopped. They are failed rather than run again, as their stage may
+        have partly run, and the task can be approved or submitted again.
+        """
+        now = timezone.now()
+        cutoff = now - timedelta(seconds=CONF.workflow.task_queue.job_timeout)
+        return cls.objects.filter(state="running", heartbeat_on__lt=cutoff).update(
+            state="failed",
+            error="The worker running this job stopped responding.",
+            data={},
+            finished_on=now,
+        )
+
+    @classmethod
+    def cancel_queued(cls, tasks):
+        """Cancel the jobs queued for the given tasks."""
+        return cls.objects.filter(task__in=tasks, state="queued").update(
+            state="cancelled", data={}, finished_on=timezone.now()
+        )
+
+    def heartbeat(self):
+        """Show that the job is still being run."""
+        self.heartbeat_on = timezone.now()
+        TaskJob.objects.filter(uuid=self.uuid, state="running").update(
+            heartbeat_on=self.heartbeat_on
+        )
+
+    def to_dict(self):
+        return {
+            "uuid": self.uuid,
+            "stage": self.stage,
+            "state": self.state,
+            "created_on": self.created_on,
+            "started_on": self.started_on,
+            "finished_on": self.finished_on,
+        }
@@ -12,6 +12,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 import hashlib
 from logging import getLogger
 
@@ -19,10 +21,13 @@ from confspirator import groups
 from confspirator import fields
 
 from adjutant import actions as adj_actions
-from adjutant.api.models import Task
+from adjutant.actions.models import Action
+from adjutant.api.models import Task, Token
 from adjutant.config import CONF
+from django.db import IntegrityError, connection, transaction
 from django.utils import timezone
 from adjutant.notifications.utils import create_notification
+from adjutant.tasks.models import TaskJob
 from adjutant.tasks.v1.utils import send_stage_email, create_token, handle_task_error
 from adjutant import exceptions
 
@@ -150,17 +155,24 @@ class BaseTask(object):
             action_serializer_list = self._instantiate_action_serializers(action_data)
 
             hash_key = self._create_task_hash(action_serializer_list)
-            # raises duplicate error
-            self._handle_duplicates(hash_key)
 
             keystone_user = task_data.get("keystone_user", {})
-            self.task = Task.objects.create(
-                keystone_user=keystone_user,
-                project_id=keystone_user.get("project_id"),
-                task_type=self.task_type,
-                hash_key=hash_key,
-            )
-            self.task.save()
+            try:
+                with transaction.atomic():
+                    # raises duplicate error
+                    self._handle_duplicates(hash_key)
+
+                    self.task = Task.objects.create(
+                        keystone_user=keystone_user,
+                        project_id=keystone_user.get("project_id"),
+                        task_type=self.task_type,
+                        hash_key=hash_key,
+                        **self._get_target_fields(action_serializer_list),
+                    )
+            except IntegrityError:
+                # Only one open task may have a given hash_key, so another
+                # request has just created this same task.
+                raise exceptions.TaskDuplicateFound()
 
             # Instantiate actions with serializers
             self.actions = []
@@ -243,25 +255,54 @@ class BaseTask(object):
 
         return hashlib.sha256(str(hashable_list).encode("utf-8")).hexdigest()
 
+    def _get_target_fields(self, action_list):
+        """
+        Work out which user the task is about from the action data, so
+        tasks can be queried by user without loading their actions.
+
+        Only what is in the action data is stored, without applying
+        'identity.username_is_email', so these match the fields backfilled
+        by the tasks 0007 migration.
+        """
+        targets = {}
+        for action in action_list:
+            if not action["serializer"]:
+                continue
+            data = action["serializer"].validated_data
+            for key in ["email", "username", "user_id"]:
+                if data.get(key) and not targets.get(key):
+                    targets[key] = data[key]
+
+        return {
+            "target_email": targets.get("email"),
+            "target_username": targets.get("username"),
+            "target_user_id": targets.get("user_id"),
+        }
+
     def _handle_duplicates(self, hash_key):
         duplicate_tasks = Task.objects.filter(
             hash_key=hash_key, completed=0, cancelled=0
         )
 
-        if not duplicate_tasks:
+        if self.duplicate_policy != "cancel":
+            if duplicate_tasks.exists():
+                raise exceptions.TaskDuplicateFound()
             return
 
-        if self.duplicate_policy == "cancel":
-            now = timezone.now()
-            self.logger.info("(%s) - Task is a duplicate - Cancelling old tasks." % now)
-            for task in duplicate_tasks:
-                task.add_task_note(
-                    "Task cancelled because was an old duplicate. - (%s)" % now
-                )
-                task.get_task().cancel()
+        duplicate_tasks = list(duplicate_tasks.only("uuid", "task_notes"))
+        if not duplicate_tasks:
             return
 
-        raise exceptions.TaskDuplicateFound()
+        now = timezone.now()
+        self.logger.info("(%s) - Task is a duplicate - Cancelling old tasks." % now)
+        for task in duplicate_tasks:
+            task.task_notes.append(
+                "Task cancelled because was an old duplicate. - (%s)" % now
+            )
+            task.cancelled = True
+        Token.objects.filter(task__in=duplicate_tasks).delete()
+        TaskJob.cancel_queued(duplicate_tasks)
+        Task.objects.bulk_update(duplicate_tasks, ["cancelled", "task_notes"])
 
     def _refresh_actions(self):
         self.actions = [a.get_action() for a in self.task.actions]
@@ -374,9 +415,105 @@ class BaseTask(object):
 
             action["action"].action.action_data = data
             action["action"].action.save()
+
+        target_fields = self._get_target_fields(action_serializer_list)
+        for field, value in target_fields.items():
+            setattr(self.task, field, value)
+        self.task.save(update_fields=list(target_fields))
         self._refresh_actions()
+        # the actions have new data, so none of their stages are done
+        self._clear_completed_stages(self.actions)
         self.prepare()
 
+    def _clear_completed_stages(self, actions, stage=None):
+        """
+        Forget that the actions completed the given stage, or every
+        stage, so that the next run of it runs them all again.
+        """
+        cleared = []
+        for action in actions:
+            completed_stages = action.action.completed_stages
+            if stage is None and completed_stages:
+                completed_stages.clear()
+            elif stage in completed_stages:
+                del completed_stages[stage]
+            else:
+                continue
+            cleared.append(action.action)
+        if cleared:
+            Action.objects.bulk_update(cleared, ["completed_stages"])
+
+    def _stage_batches(self, stage, actions):
+        """
+        Split the actions into the groups to run the stage with, in order.
+        Consecutive actions that are safe to run alongside each other for
+        the stage are grouped together, every other action is on its own.
+        """
+        batch = []
+        for action in actions:
+            if stage in action.parallel_stages and not action.stage_completed(stage):
+                batch.append(action)
+                continue
+            if batch:
+                yield batch
+                batch = []
+            yield [action]
+        if batch:
+            yield batch
+
+    def _run_stage(self, stage, actions, error_text, *args):
+        """
+        Run the given stage for each of the actions.
+
+        Actions still wait for the ones before them, so that the task
+        cache is handed along as it always has been, other than a group
+        of actions that are all safe to run alongside each other, which
+        are run at once by up to 'workflow.action_workers' threads.
+        """
+        workers = CONF.workflow.action_workers
+        with self.task.buffered_notes():
+            for batch in self._stage_batches(stage, actions):
+                if workers > 1 and len(batch) > 1:
+                    self._run_batch(stage, batch, workers, error_text, args)
+                    continue
+                for action in batch:
+                    # resume from the first action that hasn't done the stage
+                    if action.stage_completed(stage):
+                        action.resume_stage(stage)
+                        continue
+                    try:
+                        getattr(action, stage)(*args)
+                    except Exception as e:
+                        handle_task_error(e, self.task, error_text=error_text)
+
+        # Every action finished the stage, so only a stage that failed
+        # partway through is resumed, and running it again starts over.
+        self._clear_completed_stages(actions, stage)
+
+    def _run_batch(self, stage, batch, workers, error_text, args):
+        def run(action):
+            try:
+                getattr(action, stage)(*args)
+            finally:
+                # each thread has its own database connection
+                connection.close()
+
+        with ExitStack() as stack:
+            # Hold the saves of the actions, flushes included, until they
+            # have all finished, so that they are made here rather than
+            # from the threads.
+            for action in batch:
+                stack.enter_context(action.action.deferred_saves(hold_flushes=True))
+            with ThreadPoolExecutor(max_workers=min(workers, len(batch))) as pool:
+                futures = [pool.submit(run, action) for action in batch]
+
+        # the whole group has run, so report the first action that failed
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                handle_task_error(e, self.task, error_text=error_text)
+
     def prepare(self):
         """Run the prepare stage for all the actions.
 
@@ -386,11 +523,7 @@ class BaseTask(object):
 
         self.confirm_state(approved=False, completed=False, cancelled=False)
 
-        for action in self.actions:
-            try:
-                action.prepare()
-            except Exception as e:
-                handle_task_error(e, self.task, error_text="while setting up task")
+        self._run_stage("prepare", self.actions, "while setting up task")
 
         # send initial confirmation email:
         email_conf = self.config.emails.initial
@@ -440,11 +573,7 @@ class BaseTask(object):
         self.task.save()
 
         # approve all actions
-        for action in self.actions:
-            try:
-                action.approve()
-            except Exception as e:
-                handle_task_error(e, self.task, error_text="while approving task")
+        self._run_stage("approve", self.actions, "while approving task")
 
         self.is_valid("task invalid after approval")
 
@@ -468,6 +597,30 @@ class BaseTask(object):
     def submit(self, token_data=None, keystone_user=None):
         self.confirm_state(approved=True, completed=False, cancelled=False)
 
+        actions, data = self.get_token_data(token_data)
+
+        self.is_valid("task invalid before submit")
+
+        self._run_stage("submit", actions, "while submiting task", data, keystone_user)
+
+        self.is_valid("task invalid after submit")
+
+        self.task.completed = True
+        self.task.completed_on = timezone.now()
+        self.task.save()
+        for token in self.task.tokens:
+            token.delete()
+
+        # Sending confirmation email:
+        email_conf = self.config.emails.completed
+        send_stage_email(self.task, email_conf)
+
+    def get_token_data(self, token_data=None):
+        """
+        Pick out the fields the actions need from the submitted token
+        data, returning the actions and that data. Raises
+        TaskTokenSerializersInvalid if any fields are missing.
+        """
         required_fields = set()
         actions = []
         for action in self.task.actions:
@@ -496,28 +649,11 @@ class BaseTask(object):
         if errors:
             raise exceptions.TaskTokenSerializersInvalid(self.task, errors)
 
-        self.is_valid("task invalid before submit")
-
-        for action in actions:
-            try:
-                action.submit(data, keystone_user)
-            except Exception as e:
-                handle_task_error(e, self.task, "while submiting task")
-
-        self.is_valid("task invalid after submit")
-
-        self.task.completed = True
-        self.task.completed_on = timezone.now()
-        self.task.save()
-        for token in self.task.tokens:
-            token.delete()
-
-        # Sending confirmation email:
-        email_conf = self.config.emails.completed
-        send_stage_email(self.task, email_conf)
+        return actions, data
 
     def cancel(self):
         self.confirm_state(completed=False, cancelled=False)
         self.clear_tokens()
+        TaskJob.cancel_queued([self.task])
         self.task.cancelled = True
         self.task.save()
@@ -13,12 +13,20 @@
 #    under the License.
 
 from logging import getLogger
+import threading
+
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
 
 from adjutant import exceptions
 from adjutant import tasks
-from adjutant.tasks.models import Task
+from adjutant.config import CONF
+from adjutant.tasks.models import Task, TaskJob
 from adjutant.tasks.v1.base import BaseTask
 
+# Token fields that are never stored in a queued job.
+SECRET_TOKEN_FIELDS = ["password"]
+
 
 class TaskManager(object):
     def __init__(self, message=None):
@@ -67,6 +75,13 @@ class TaskManager(object):
             return task.get_task()
         raise exceptions.TaskNotFound("Task not found for value of: '%s'" % task)
 
+    def get_many(self, uuids):
+        """
+        Fetch the tasks with the given uuids in one query, returning
+        them in a dict by uuid. Unknown uuids are left out.
+        """
+        return {task.uuid: task for task in Task.objects.filter(uuid__in=uuids)}
+
     def update(self, task, action_data):
         task = self.get(task)
         task.update(action_data)
@@ -91,3 +106,122 @@ class TaskManager(object):
         task = self.get(task)
         task.reissue_token()
         return task
+
+    def _queue(self, task, stage, data, token=None):
+        already_queued = exceptions.TaskStateInvalid(
+            task.task, "This task is already being processed."
+        )
+        try:
+            with transaction.atomic():
+                # Only one job may be queued or running for a task at a time.
+                # The unique_active_task_job constraint isn't enforced on
+                # MySQL, so lock the task and check for an active job too.
+                Task.objects.select_for_update().filter(uuid=task.task.uuid).first()
+                if TaskJob.objects.filter(
+                    task=task.task, state__in=["queued", "running"]
+                ).exists():
+                    raise already_queued
+                job = TaskJob.objects.create(
+                    task=task.task,
+                    stage=stage,
+                    data=data,
+                    token_hash=TaskJob.hash_token(token) if token else "",
+                )
+        except IntegrityError:
+            raise already_queued
+        self.logger.info(
+            "(%s) - '%s' stage queued for task (%s) as job (%s)."
+            % (timezone.now(), stage, task.task.uuid, job.uuid)
+        )
+        return job
+
+    def queue_approve(self, task, approved_by):
+        """
+        Check the task can be approved, and queue the approve stage to
+        be run in the background. Returns the queued TaskJob.
+        """
+        task = self.get(task)
+        task.confirm_state(completed=False, cancelled=False)
+        task.is_valid("task invalid before approval")
+        return self._queue(task, "approve", {"approved_by": approved_by})
+
+    def can_queue_submit(self, task):
+        """
+        Whether a token submit for the task can be queued. Submits that
+        don't need authentication, or that need a password, are always
+        run during the request: the submitter couldn't check on a job,
+        and the token data would be stored until the job runs.
+        """
+        task = self.get(task)
+        if not task.token_requires_authentication:
+            return False
+        for action in task.task.actions:
+            for field in action.get_action().token_fields:
+                if field in SECRET_TOKEN_FIELDS:
+                    return False
+        return True
+
+    def queue_submit(self, task, token_data, keystone_user=None, token=None):
+        """
+        Check the token data is complete, and queue the submit stage to
+        be run in the background. Returns the queued TaskJob, which can
+        be looked up by the token it was submitted with.
+        """
+        task = self.get(task)
+        task.confirm_state(approved=True, completed=False, cancelled=False)
+        # only the fields the actions need are kept:
+        _, token_data = task.get_token_data(token_data)
+        task.is_valid("task invalid before submit")
+        return self._queue(
+            task,
+            "submit",
+            {"token_data": token_data, "keystone_user": keystone_user},
+            token=token,
+        )
+
+    def run_job(self, job):
+        """Run a claimed TaskJob, recording whether it succeeded."""
+        stop = threading.Event()
+        heartbeat_thread = threading.Thread(
+            target=self._heartbeat, args=(job, stop), daemon=True
+        )
+        heartbeat_thread.start()
+        try:
+            self._run_job(job)
+        finally:
+            stop.set()
+            heartbeat_thread.join()
+
+        # don't keep submitted passwords and the like around
+        job.data = {}
+        job.finished_on = timezone.now()
+        job.save()
+        return job
+
+    def _heartbeat(self, job, stop):
+        interval = CONF.workflow.task_queue.job_timeout / 3
+        try:
+            while not stop.wait(interval):
+                job.heartbeat()
+        finally:
+            # the thread has its own database connection
+            connection.close()
+
+    def _run_job(self, job):
+        try:
+            if job.stage == "approve":
+                self.approve(job.task, job.data["approved_by"])
+            elif job.stage == "submit":
+                self.submit(job.task, job.data["token_data"], job.data["keystone_user"])
+            else:
+                raise exceptions.TaskStateInvalid(
+                    job.task, "Unknown task stage: '%s'" % job.stage
+                )
+            job.state = "completed"
+        except Exception as e:
+            self.logger.exception(
+                "(%s) - Job (%s) failed for task (%s)."
+                % (timezone.now(), job.uuid, job.task.uuid)
+            )
+            job.state = "failed"
+            job.error = str(e)
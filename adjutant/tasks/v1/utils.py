@@ -23,7 +23,7 @@ from django.utils import timezone
 
 from adjutant.api.models import Token
 from adjutant.common import user_store
-from adjutant.notifications.utils import create_notification
+from adjutant.notifications.utils import create_notification, deliver_email
 from adjutant.config import CONF
 from adjutant import exceptions
 
@@ -131,7 +131,7 @@ def _send_stage_email(
     if CONF.identity.username_is_email and "username" in task.keystone_user:
         email_current_user_address = task.keystone_user["username"]
     elif "user_id" in task.keystone_user:
-        id_manager = user_store.IdentityManager()
+        id_manager = user_store.get_identity_manager(task)
         user = id_manager.get_user(task.keystone_user["user_id"])
         email_current_user_address = user.email if user else None
     else:
@@ -219,7 +219,7 @@ def _send_stage_email(
         if html_template:
             email.attach_alternative(html_template.render(context), "text/html")
 
-        email.send(fail_silently=False)
+        deliver_email(task, email, "while emailing update")
 
     except Exception as e:
         notes = {